@@ -25,25 +25,158 @@ assert API_KEY is not None ,"API_KEY Required"
 
 
 LLM_RPM = float(os.getenv("LLM_RPM",88))
+# 限流模式：strict（严格等间隔，任意一分钟内不超过 LLM_RPM）/ bucket（令牌桶，允许 LLM_BURST 次突发，可按 TPM 计费、
+# 可用 sqlite 后端跨进程共享）。bucket 在任意一分钟内最多放行 LLM_RPM + LLM_BURST 次，
+# 服务端按滚动窗口严格计 RPM 时需相应调低 LLM_RPM
+LLM_LIMITER = os.getenv("LLM_LIMITER", "strict")
+LLM_BURST = int(os.getenv("LLM_BURST", 8))
+LLM_TPM = float(os.getenv("LLM_TPM", 0))                          # 0 表示不按 token 限流（仅 bucket 模式）
+LLM_OUTPUT_TOKENS = int(os.getenv("LLM_OUTPUT_TOKENS", 2000))     # 预扣 TPM 时对单次输出的估计
+# 自适应限流（AIMD）：429 时有效 RPM 乘以 0.7 并按 Retry-After 暂停派发，持续成功后逐步回升到 LLM_RPM；
+# 连续服务端故障时熔断，冷却后只放一个探测请求
+LLM_ADAPTIVE = os.getenv("LLM_ADAPTIVE", "1") == "1"
+LLM_MIN_RPM = float(os.getenv("LLM_MIN_RPM", 5))
+LLM_RPM_STEP = float(os.getenv("LLM_RPM_STEP", 4))                 # 每 10 次连续成功提升的 RPM
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))   # 连续多少次服务端故障触发熔断
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+# 限流器前的公平队列：每个 tenant（浏览器会话 / CLI 任务）同时在途的 LLM 调用上限
+TENANT_MAX_IN_FLIGHT = int(os.getenv("TENANT_MAX_IN_FLIGHT", 8))
+# 服务端准入控制（/api/convert_chunk）：排队超过深度或预计等待超过 ADMISSION_MAX_WAIT 秒时返回 429 + Retry-After
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 512))      # 全局排队上限
+ADMISSION_TENANT_QUEUE = int(os.getenv("ADMISSION_TENANT_QUEUE", 64))  # 单个 tenant 排队上限
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", 120))
+# 限流状态后端（仅 bucket 模式）：memory（进程内）/ sqlite（同机多进程共享，例如 uvicorn --workers N）
+LLM_LIMITER_BACKEND = os.getenv("LLM_LIMITER_BACKEND", "memory")
+# 连接失败（请求没有到达服务端）时总是退还本次占用的限流名额，重试不重复占用（strict / bucket 均适用）。
+# 429 时也退还：只适用于不把被拒请求计入 RPM / TPM 的服务端，默认关闭；开启后响应带 Retry-After / x-ratelimit-* 头的 429 仍不退还
+LLM_REFUND_THROTTLED = os.getenv("LLM_REFUND_THROTTLED", "0") == "1"
 MAX_TRY=int(os.getenv("MAX_TRY",3))
+# 按错误类别的重试规则（utils.retry_policy）：attempts 含首次调用；
+# shared=True 的重试同时消耗 chunk 的 MAX_TRY 预算（与图内的语法重试共用），throttle 由限流控制，不占预算
+RETRY_RULES = {
+    "throttle": {"attempts": 6, "base_delay": 2.0, "max_delay": 60.0, "shared": False},
+    "transient": {"attempts": MAX_TRY, "base_delay": 1.0, "max_delay": 30.0},
+    "parse": {"attempts": 2, "base_delay": 0.0},
+    "unknown": {"attempts": MAX_TRY, "base_delay": 1.0},
+    "bad_request": {"attempts": 1},
+    "content_filter": {"attempts": 1},
+}
 
 TIME_WARN=0
 
 
 
 # Concurrency for per-chunk processing (platform-level setting)
-MAX_CONCURRENCY = 6
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", 6))
+# Chunk 调度顺序：input（输入顺序）/ largest_first（大 chunk 先跑）/ retry_first（失败重排的先跑）
+CHUNK_ORDER = os.getenv("CHUNK_ORDER", "input")
+# 调度层对单个 chunk 的最大执行次数（chunk 图内部的语法重试不计入）。
+# 默认 1：失败不在调度层重排，CHUNK_ORDER=retry_first 只有在该值 > 1 时才有作用
+CHUNK_MAX_ATTEMPTS = int(os.getenv("CHUNK_MAX_ATTEMPTS", 1))
+# 服务端整文件任务（/api/jobs）：同时运行的任务数（每个任务内部再按 MAX_CONCURRENCY 并发），结束后结果保留的秒数
+MAX_RUNNING_JOBS = int(os.getenv("MAX_RUNNING_JOBS", 2))
+JOB_TTL = float(os.getenv("JOB_TTL", 3600))
+# CLI 流式写出结果（utils.ordered_writer）：有序前缀完成即落盘，中断后重跑从已落盘处继续；
+# 重排缓冲超过 STREAM_BUFFER_CHARS 个字符后乱序结果溢写到临时文件
+STREAM_OUTPUT = os.getenv("STREAM_OUTPUT", "1") == "1"
+STREAM_BUFFER_CHARS = int(os.getenv("STREAM_BUFFER_CHARS", 64 << 20))
+# 按文件路径转换时（MainState.source_path）流式切分的读块大小，SPLIT_MMAP=1 时用 mmap 读取
+SPLIT_BLOCK_SIZE = int(os.getenv("SPLIT_BLOCK_SIZE", 1 << 20))
+SPLIT_MMAP = os.getenv("SPLIT_MMAP", "0") == "1"
+# 切分方式：regex（split_sql / iter_split_sql，按 CREATE TABLE 切，流式）/ ddl（utils.ddl_splitter，词法感知，索引 / 注释 / ALTER 并入所属表）
+# ddl 需要先扫描整个文件再产出第一个 chunk，耗时和内存约为 regex 的 2 倍。
+# 两种方式的 chunk 边界不同：切换后已有的 chunk checkpoint 和翻译缓存都不再命中，相当于从头重跑
+SPLITTER = os.getenv("SPLITTER", "regex")
 
 
 
 RESOURCES_DIR = "resources"
 os.makedirs(RESOURCES_DIR, exist_ok=True)
 
+LLM_LIMITER_PATH = os.getenv("LLM_LIMITER_PATH", os.path.join(RESOURCES_DIR, "rate_limiter.db"))
+# 服务端整文件任务的结果文件（job_progress.JobRegistry），/api/jobs/<id>/result 直接读这里
+JOB_DIR = os.path.join(RESOURCES_DIR, "jobs")
+
+
+# 按归一化 DDL + prompt + 目标方言 / 库名 + 模型缓存 chunk 的翻译结果，命中时不调用 LLM；只缓存规则翻译和通过校验的结果
+TRANSLATION_CACHE = os.getenv("TRANSLATION_CACHE", "1") == "1"
+TRANSLATION_CACHE_PATH = os.path.join(RESOURCES_DIR, "translation_cache.db")
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", 200000))
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", 30 * 24 * 3600))  # 秒，0 表示不过期
+
+# 规范化提示词（main_method.prompt_normalize）的持久化缓存：key 含 general_prompt、源/目标格式、target_schema、
+# merge_n、示例摘要、模型和模板版本，同样的参数重跑或重复请求 /api/normalize_prompt 时不再调用 LLM
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "1") == "1"
+PROMPT_CACHE_PATH = os.path.join(RESOURCES_DIR, "prompt_cache.db")
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", 1000))
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", 30 * 24 * 3600))  # 秒，0 表示不过期
+# 投机执行：缓存未命中时不等规范化完成，先用原始 general_prompt 开始至多 PROMPT_SPECULATIVE_CHUNKS 个 chunk；
+# 这些 chunk 的译文不会按规范化后的提示词重做，因此默认关闭
+PROMPT_SPECULATIVE = os.getenv("PROMPT_SPECULATIVE", "0") == "1"
+PROMPT_SPECULATIVE_CHUNKS = int(os.getenv("PROMPT_SPECULATIVE_CHUNKS", MAX_CONCURRENCY))
+
+# 执行方式：online（逐 chunk 实时调用，受 LLM_RPM 限制）/ batch（离线批处理：所有 chunk 的请求写成 JSONL 一次提交，
+# 完成后结果回到 chunk 图做校验，校验失败或没有结果的 chunk 再按 online 方式重试）
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "online")
+# 批处理提供方：openai（/v1/batches，需服务端支持）/ local（utils.batch_api.LocalBatchClient，本地目录 + 逐条转发到 API_BASE）
+BATCH_PROVIDER = os.getenv("BATCH_PROVIDER", "openai")
+BATCH_API_BASE = os.getenv("BATCH_API_BASE", API_BASE)
+BATCH_DIR = os.path.join(RESOURCES_DIR, "batches")
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", 60))
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", 50000))          # 单个批次的请求数上限（OpenAI 为 50000）
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", 150 << 20))            # 单个请求文件的大小上限（OpenAI 为 200MB）
+BATCH_LOCAL_CONCURRENCY = int(os.getenv("BATCH_LOCAL_CONCURRENCY", 4))
+
+# 结构复用：只有表名不同的 chunk（foo / foo_error / foo_tmp）只翻译一个代表，其余替换表名后校验复用
+TEMPLATE_REUSE = os.getenv("TEMPLATE_REUSE", "0") == "1"
+
+# 按 token 预算把相邻的小表合并为一次调用（每批最多 merge_n 张表），输出再按表拆回分别校验
+PACK_INPUT_TOKENS = int(os.getenv("PACK_INPUT_TOKENS", 16000))     # 含提示词固定部分
+PACK_OUTPUT_TOKENS = int(os.getenv("PACK_OUTPUT_TOKENS", 8000))
+PACK_OUTPUT_RATIO = float(os.getenv("PACK_OUTPUT_RATIO", 1.5))      # 输出 token / 输入 SQL token 的估计值
+PACK_CHARS_PER_TOKEN = float(os.getenv("PACK_CHARS_PER_TOKEN", 3.0))
+PACK_TOKENIZER = os.getenv("PACK_TOKENIZER", "")                    # tiktoken 编码名，例如 cl100k_base；为空按字符比估算
+PACK_PROMPT_OVERHEAD = int(os.getenv("PACK_PROMPT_OVERHEAD", 800))  # process_chunk 模板本身的 token
+
+# 规则翻译快速路径：sqlglot 解析 + 下列规则能完整处理的 chunk 不再调用 LLM。
+# 规则只覆盖机械性的类型映射 / 子句剔除 / 模板字段，general_prompt 中的其他要求不会生效，因此默认关闭。
+RULE_TRANSLATE = os.getenv("RULE_TRANSLATE", "0") == "1"
+# key 为 destination_format（小写），字段含义见 utils.rule_translate.RuleSet
+RULE_SETS = {
+    "gbasehd": {
+        "type_map": {
+            "VARCHAR": "string", "NVARCHAR": "string", "CHAR": "string", "NCHAR": "string", "TEXT": "string",
+            "SMALLINT": "int", "TINYINT": "int", "INT": "int",
+            "BIGINT": "bigint",
+            "DECIMAL": "",          # decimal(p,s) 保留精度
+            "DOUBLE": "double", "FLOAT": "float",
+            "TIMESTAMP": "timestamp", "TIMESTAMPTZ": "timestamp",
+            "DATE": "date",
+        },
+        "extra_columns": [("col_batch", "string", "处理批次")],
+        "table_suffix": "ROW FORMAT DELIMITED\nFIELDS TERMINATED BY '\\u0001'\nSTORED AS TEXTFILE",
+        "require_table_comment": True,
+        "require_column_comment": False,
+    },
+}
+
 
 
 
 
 GRAMMAR_CHECK=True
+# 语法校验执行器（utils.validation_pool）：process（进程池）/ thread（线程池）/ inline（在事件循环里直接解析）；
+# VALIDATION_WORKERS=0 时退回 inline，不启动任何 worker 进程（单核机器、或不便管理子进程的部署）。
+# 进程池由 webapp 的 lifespan 在启动时预热、退出时关闭；
+# 同时提交给池的校验不超过 VALIDATION_MAX_PENDING 个，相同 SQL 的校验结果缓存 VALIDATION_CACHE_SIZE 条
+VALIDATION_EXECUTOR = os.getenv("VALIDATION_EXECUTOR", "process")
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS", min(4, max(1, (os.cpu_count() or 2) - 1))))
+VALIDATION_MAX_PENDING = int(os.getenv("VALIDATION_MAX_PENDING", 64))
+VALIDATION_CACHE_SIZE = int(os.getenv("VALIDATION_CACHE_SIZE", 4096))
+# 结构校验（utils.structure_check）：语法通过后再与源 chunk 比对表、字段、顺序、类型映射和模板子句，
+# 不一致之处作为 exception 反馈给 LLM；类型映射和模板取 RULE_SETS 中目标格式对应的一项（不要求开启 RULE_TRANSLATE）
+STRUCTURE_CHECK = os.getenv("STRUCTURE_CHECK", "1") == "1"
 SQLGLOT_DIALECT_MAP = {
     # ===== GBase 系列 =====
     "gbase8c": "postgres",      # GBase 8c 语法高度接近 PostgreSQL
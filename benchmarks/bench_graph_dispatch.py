@@ -0,0 +1,55 @@
+"""
+单个 chunk 派发开销的微基准：取图 + 查最新 checkpoint（start_or_resume 进入图之前的固定开销）。
+- before：每次调用都重新构建并 compile 图（引入 graph_registry 之前 get_graph 的行为）
+- after：graph_registry 按 checkpointer 复用编译好的图
+
+运行（仓库根目录）：
+    API_KEY=x python -m benchmarks.bench_graph_dispatch --iterations 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from graph import chunk_graph, main_graph  # noqa: F401  导入时登记图
+from utils import checkpointer_pool, graph_registry
+
+_GRAPHS = {
+    "chunk-transfer-agent": chunk_graph._build_graph,
+    "sql-transfer-agent": main_graph._build_graph,
+}
+
+
+async def _dispatch(get_graph, saver, i: int) -> float:
+    config = {"configurable": {"thread_id": f"bench-{i}"}}
+    start = time.perf_counter()
+    graph = get_graph(saver)
+    await checkpointer_pool.latest_snapshot(graph, config)
+    return (time.perf_counter() - start) * 1000
+
+
+async def _bench(name: str, iterations: int, path: str) -> None:
+    builder = _GRAPHS[name]
+    async with AsyncSqliteSaver.from_conn_string(path) as saver:
+        graph_registry.get(name, saver)
+        for label, get_graph in (("before", builder), ("after", lambda s: graph_registry.get(name, s))):
+            timings = [await _dispatch(get_graph, saver, i) for i in range(iterations)]
+            print(f"[Bench] {name:<22} {label:<6} mean={statistics.mean(timings):.3f}ms "
+                  f"p50={statistics.median(timings):.3f}ms max={max(timings):.3f}ms")
+
+
+async def main(iterations: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoints.db")
+        for name in _GRAPHS:
+            await _bench(name, iterations, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    asyncio.run(main(parser.parse_args().iterations))
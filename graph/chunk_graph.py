@@ -1,39 +1,177 @@
-from datetime import datetime
+import functools
+from typing import List, Optional
 
 from langchain_core.runnables import RunnableConfig
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
-from utils import checkpointer_pool
+import CONFIG
+import utils
+from utils import checkpoint_migration, checkpointer_pool, chunk_packer, graph_registry, job_store, translation_cache
 
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
 from method import chunk_method
-from states.main_state import ChunkState
+from pydantic import ValidationError
 
+from states.main_state import ChunkState, JobContext
 
-async def get_graph(checkpointer: AsyncSqliteSaver=None):
-    # 初始化 RedisSaver
-    # checkpointer = AsyncRedisSaver(redis_url=CONFIG.REDIS_HOST, ttl={"default_ttl": CONFIG.REDIS_EXPIRE, "refresh_on_read": True})
-    if checkpointer is None:
-        checkpointer = await checkpointer_pool.get_checkpointer()
 
+@graph_registry.register("chunk-transfer-agent")
+def _build_graph(checkpointer: AsyncSqliteSaver=None):
     _builder = StateGraph(ChunkState)
 
+    _builder.add_node("rule_translate", chunk_method.rule_translate)
     _builder.add_node("process_chunk", chunk_method.process_chunk)
     _builder.add_node("validate_sql", chunk_method.validate_sql)
 
 
-    _builder.add_edge(START, "process_chunk")
-    _builder.add_conditional_edges("process_chunk", lambda x:"validate_sql" if x.destination_sql_language and x.limiter>0 else END)
-    _builder.add_conditional_edges("validate_sql",lambda x:"process_chunk" if x.exception else END)
+    # 配置了规则的目标格式先走确定性翻译，规则覆盖不到的 chunk 再交给 LLM；
+    # 已带批处理结果的 chunk（route=batch）直接进入校验，与 process_chunk 之后的判断相同
+    _builder.add_conditional_edges(START, lambda x:("validate_sql" if job_store.get(x.job_id).destination_sql_language and x.limiter>0 else END) if x.route == "batch"
+                                   else "rule_translate" if chunk_method.get_rule_set(job_store.get(x.job_id).destination_format) else "process_chunk")
+    _builder.add_conditional_edges("rule_translate", lambda x:END if x.route == "rules" else "process_chunk")
+    _builder.add_conditional_edges("process_chunk", lambda x:"validate_sql" if job_store.get(x.job_id).destination_sql_language and x.limiter>0 else END)
+    _builder.add_node("repair_statements", chunk_method.repair_statements)
+    _builder.add_conditional_edges("validate_sql",lambda x:"repair_statements" if x.broken else "process_chunk" if x.exception else END)
+    _builder.add_conditional_edges("repair_statements",lambda x:"validate_sql" if x.limiter>0 else END)
     # _builder.add_edge("process_chunk",END)
 
     return _builder.compile(name="chunk-transfer-agent", checkpointer=checkpointer)
 
 
+def _legacy_job_id(channel_values: dict) -> Optional[str]:
+    """job_id 引入之前的 chunk checkpoint：共享参数直接存在 channel 里，按 job_store.put 同样的内容哈希补上 job_id。"""
+    if "limiter" not in channel_values:
+        # 不是 chunk 图的 checkpoint
+        return None
+    try:
+        return utils.stable_model_hash(JobContext.model_validate(channel_values))
+    except ValidationError:
+        return None
+
+
+checkpointer_pool.register_migration(functools.partial(checkpoint_migration.migrate_job_ids, job_id=_legacy_job_id))
+
+
+async def get_graph(checkpointer: AsyncSqliteSaver=None):
+    # 初始化 RedisSaver
+    # checkpointer = AsyncRedisSaver(redis_url=CONFIG.REDIS_HOST, ttl={"default_ttl": CONFIG.REDIS_EXPIRE, "refresh_on_read": True})
+    if checkpointer is None:
+        checkpointer = await checkpointer_pool.get_checkpointer()
+
+    # 同一个 checkpointer 只编译一次，进程内复用
+    return graph_registry.get("chunk-transfer-agent", checkpointer)
+
+
+
+_translation_cache = None
+
+
+def get_translation_cache():
+    global _translation_cache
+    if _translation_cache is None and CONFIG.TRANSLATION_CACHE:
+        _translation_cache = translation_cache.TranslationCache(
+            CONFIG.TRANSLATION_CACHE_PATH,
+            max_entries=CONFIG.TRANSLATION_CACHE_MAX_ENTRIES,
+            ttl=CONFIG.TRANSLATION_CACHE_TTL,
+        )
+    return _translation_cache
+
+
+def _cache_key(input_state: ChunkState) -> str:
+    job = job_store.get(input_state.job_id)
+    return translation_cache.cache_key(
+        input_state.source or input_state.sql,
+        source_dialect=CONFIG.SQLGLOT_DIALECT_MAP.get(job.source_format.lower(), ""),
+        prompt=job.general_prompt,
+        destination_format=job.destination_format,
+        destination_dialect=job.destination_sql_language,
+        target_schema=job.target_schema,
+        model=CONFIG.LLM_TYPE,
+    )
+
+
+def _cacheable(values: dict, job: JobContext) -> bool:
+    """
+    只缓存确定可用的结果：规则翻译，或通过了校验的 LLM 输出。
+    重试耗尽时图不经校验直接结束（limiter == 0），最后一次输出即使 exception 为空也不缓存。
+    """
+    if values.get("route") == "rules":
+        return True
+    if values.get("exception"):
+        return False
+    return not job.destination_sql_language or values.get("limiter", 0) > 0
+
+
+def cached(input_state: ChunkState) -> Optional[str]:
+    """只查翻译缓存，不进入图；未开启缓存或未命中时返回 None。"""
+    cache = get_translation_cache()
+    return cache.get(_cache_key(input_state)) if cache is not None else None
+
 
 async def start_or_resume(input_state: ChunkState, checkpointer: AsyncSqliteSaver = None)->str:
-    input_state.task_id=input_state.task_id+":"+input_state.sql
+    # 先查翻译缓存：命中则不进入图，也不占用限流名额
+    cache = get_translation_cache()
+    key = None
+    if cache is not None:
+        key = _cache_key(input_state)
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+
+    values = await _run_graph(input_state, checkpointer)
+    sql = values.get("sql", "")
+    if key and sql and _cacheable(values, job_store.get(input_state.job_id)):
+        cache.put(key, sql)
+    return sql
+
+
+pack_stats = chunk_packer.PackStats()
+
+
+async def start_or_resume_batch(input_states: List[ChunkState], checkpointer: AsyncSqliteSaver = None
+                                )->List[Optional[str]]:
+    """
+    把多个 chunk 合并为一次图调用，输出按表拆回后逐表校验、逐表写缓存。
+    返回与输入等长的列表；拆分或校验失败的位置为 None，由调用方逐表重新翻译。
+    """
+    cache = get_translation_cache()
+    keys = [_cache_key(s) for s in input_states] if cache is not None else [None] * len(input_states)
+    results: List[Optional[str]] = [cache.get(k) if k else None for k in keys]
+
+    pending = [i for i, r in enumerate(results) if r is None]
+    if len(pending) < 2 or pack_stats.degraded:
+        return results
+
+    # 批次内容确定时 thread_id 也确定，中断后可以按批次续跑
+    batch = input_states[pending[0]].model_copy(
+        update={"sql": chunk_packer.join([input_states[i].sql for i in pending])}
+    )
+    pack_stats.batches += 1
+    pack_stats.packed += len(pending)
+    parts = chunk_packer.split((await _run_graph(batch, checkpointer)).get("sql", ""), len(pending))
+    if parts is None:
+        pack_stats.split_failed += 1
+        return results
+
+    job = job_store.get(batch.job_id)
+    dialect = job.destination_sql_language
+    for i, part in zip(pending, parts):
+        if dialect:
+            (e, _, _), issues = await chunk_method.check_output(input_states[i].sql, part, job)
+            if e or issues:
+                pack_stats.fallback += 1
+                continue
+        results[i] = part
+        if keys[i]:
+            cache.put(keys[i], part)
+    return results
+
+
+async def _run_graph(input_state: ChunkState, checkpointer: AsyncSqliteSaver = None)->dict:
+    """运行（或恢复）chunk 图，返回最终状态的 channel 值；调用方据此判断结果能否写入缓存。"""
+    # 带批处理结果的 chunk 按源 SQL 取 thread_id，与在线方式翻译同一 chunk 时相同
+    input_state.task_id=utils.chunk_thread_id(input_state.task_id, input_state.source or input_state.sql)
 
     thread_id = input_state.task_id
     config: RunnableConfig = {
@@ -47,33 +185,21 @@ async def start_or_resume(input_state: ChunkState, checkpointer: AsyncSqliteSave
     # 确保传递的是 DirectorState 类，而不是模块
     graph = await get_graph(checkpointer)
 
-    checkpoint_list = graph.checkpointer.alist(config=config)
-
-    # 获取最晚的检查点继续
-    latest_checkpoint = None
+    # 一次索引查询取最新 checkpoint
+    snapshot = await checkpointer_pool.latest_snapshot(graph, config)
 
-    async for i in checkpoint_list:
-        i_topic = i.checkpoint.get("channel_values").get('task_id')
-        # 获取每个对象的时间戳
-        ts_str = i.checkpoint.get('ts')
-        # 将时间戳字符串转换为 datetime 对象
-        ts = datetime.fromisoformat(ts_str)
-        # 如果是第一次遍历或当前时间戳更大，更新最大时间戳
-        if ('latest_ts' not in locals() or ts > latest_ts) and i_topic == input_state.task_id:
-            latest_ts = ts
-            latest_checkpoint = i
-
-    if latest_checkpoint:
+    if snapshot is None:
+        rs = await graph.ainvoke(input_state, config=config)
+    elif not snapshot.next:
+        # 已完成：直接返回存储的结果，不再执行图
+        return snapshot.values
+    else:
         print(f"[LangGraph] 检测到未完成的chunk, idx:{input_state.sql[:50]}")
-
-        config['configurable']["checkpoint"] = latest_checkpoint
         # 自动恢复 + 继续执行
         rs = await graph.ainvoke(
             None,  # resume 时必须传 None，表示从 checkpoint 恢复
             config=config
         )
-    else:
-        rs = await graph.ainvoke(input_state, config=config)
-    return rs["sql"]
+    return rs
 
 
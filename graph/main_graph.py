@@ -1,38 +1,48 @@
-from datetime import datetime
-
 from langchain_core.runnables import RunnableConfig
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
-from utils import checkpointer_pool
+import CONFIG
+from utils import checkpointer_pool, graph_registry
 
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
-from method import main_method
+from method import batch_method, main_method
 from states.main_state import MainState
 
 
-async def get_graph(checkpointer: AsyncSqliteSaver=None):
-    # 初始化 RedisSaver
-    # checkpointer = AsyncRedisSaver(redis_url=CONFIG.REDIS_HOST, ttl={"default_ttl": CONFIG.REDIS_EXPIRE, "refresh_on_read": True})
-    if checkpointer is None:
-        checkpointer = await checkpointer_pool.get_checkpointer()
-
+@graph_registry.register("sql-transfer-agent")
+def _build_graph(checkpointer: AsyncSqliteSaver=None):
     _builder = StateGraph(MainState)
 
     _builder.add_node("prompt_normalize",main_method.prompt_normalize)
     _builder.add_node("chunk_sql", main_method.chunk_sql)
     _builder.add_node("send_tasks", main_method.send_tasks)
+    _builder.add_node("submit_batch", batch_method.submit_batch)
+    _builder.add_node("wait_batch", batch_method.wait_batch)
     # _builder.add_node("final_join",method.final_join)
 
     _builder.add_edge(START,"prompt_normalize")
     _builder.add_edge("prompt_normalize","chunk_sql")
     # _builder.add_edge("prompt_normalize", "chunk_sql")
-    _builder.add_edge("chunk_sql","send_tasks")
+    # 离线批处理：先整体提交、等待完成，send_tasks 再用批处理结果逐 chunk 校验，失败的在线重试
+    _builder.add_conditional_edges("chunk_sql", lambda x:"submit_batch" if CONFIG.EXECUTION_MODE == "batch" else "send_tasks")
+    _builder.add_edge("submit_batch","wait_batch")
+    _builder.add_edge("wait_batch","send_tasks")
     _builder.add_edge( "send_tasks",END)
 
     return _builder.compile(name="sql-transfer-agent", checkpointer=checkpointer)
 
 
+async def get_graph(checkpointer: AsyncSqliteSaver=None):
+    # 初始化 RedisSaver
+    # checkpointer = AsyncRedisSaver(redis_url=CONFIG.REDIS_HOST, ttl={"default_ttl": CONFIG.REDIS_EXPIRE, "refresh_on_read": True})
+    if checkpointer is None:
+        checkpointer = await checkpointer_pool.get_checkpointer()
+
+    # 同一个 checkpointer 只编译一次，进程内复用
+    return graph_registry.get("sql-transfer-agent", checkpointer)
+
+
 
 async def start_or_resume(input_state: MainState, checkpointer: AsyncSqliteSaver = None)->str:
 
@@ -48,36 +58,25 @@ async def start_or_resume(input_state: MainState, checkpointer: AsyncSqliteSaver
     # 确保传递的是 DirectorState 类，而不是模块
     graph = await get_graph(checkpointer)
 
-    checkpoint_list = graph.checkpointer.alist(config=config)
-
-    # 获取最晚的检查点继续
-    latest_checkpoint = None
-
-    async for i in checkpoint_list:
-        i_task_id = i.checkpoint.get("channel_values").get('task_id')
-        # 获取每个对象的时间戳
-        ts_str = i.checkpoint.get('ts')
-        # 将时间戳字符串转换为 datetime 对象
-        ts = datetime.fromisoformat(ts_str)
-        # 如果是第一次遍历或当前时间戳更大，更新最大时间戳
-        if ('latest_ts' not in locals() or ts > latest_ts) and i_task_id == input_state.task_id:
-            latest_ts = ts
-            latest_checkpoint = i
+    # 一次索引查询取最新 checkpoint
+    snapshot = await checkpointer_pool.latest_snapshot(graph, config)
 
-    if latest_checkpoint:
+    if snapshot is None:
+        print(f"[LangGraph] 未检测到 checkpoint，开始新的转化流程: from {input_state.source_format} to {input_state.destination_format} for {input_state.source_path or input_state.source_sql[:50]}...\n")
+        rs = await graph.ainvoke(input_state, config=config)
+    elif not snapshot.next:
+        # 已完成：直接返回存储的结果，不再执行图
+        print(f"[LangGraph] 检测到已完成的转化，直接返回结果: from {input_state.source_format} to {input_state.destination_format}")
+        return snapshot.values.get("result", "")
+    else:
         print(
-            f"[LangGraph] 检测到未完成的转化 from {input_state.source_format} to {input_state.destination_format} for {input_state.source_sql[:50]}...\n"
-            f"将从检查点继续执行director_graph: {list(latest_checkpoint.checkpoint.get('channel_values').keys())[-1]}")
-
-        config['configurable']["checkpoint"] = latest_checkpoint
+            f"[LangGraph] 检测到未完成的转化 from {input_state.source_format} to {input_state.destination_format} for {input_state.source_path or input_state.source_sql[:50]}...\n"
+            f"将从检查点继续执行director_graph: {list(snapshot.next)}")
         # 自动恢复 + 继续执行
         rs = await graph.ainvoke(
             None,  # resume 时必须传 None，表示从 checkpoint 恢复
             config=config
         )
-    else:
-        print(f"[LangGraph] 未检测到 checkpoint，开始新的转化流程: from {input_state.source_format} to {input_state.destination_format} for {input_state.source_sql[:50]}...\n")
-        rs = await graph.ainvoke(input_state, config=config)
     return rs["result"]
 
 
@@ -1,13 +1,13 @@
 import logging
 import time
 
-import backoff
 # from langchain_community.chat_models import ChatTongyi as _ChatModel
 from langchain_openai import ChatOpenAI as _ChatModel
 from langchain_core.messages import AIMessage
 
 import CONFIG
 import utils
+from utils import adaptive_rate, chunk_packer, fair_queue, limiter_backend, prefix_cache, retry_policy
 from CONFIG import API_KEY as _api_key
 from CONFIG import LLM_TYPE as _model
 
@@ -16,14 +16,60 @@ from CONFIG import LLM_TYPE as _model
 logger = logging.getLogger(__name__)
 
 
+def _estimate_tokens(input) -> int:
+    """预扣 TPM 用：输入按字符比估算，再加上输出的估计值。"""
+    return chunk_packer.estimate_tokens(str(input), chars_per_token=CONFIG.PACK_CHARS_PER_TOKEN,
+                                        tokenizer=CONFIG.PACK_TOKENIZER) + CONFIG.LLM_OUTPUT_TOKENS
+
+
+_rate_controller = adaptive_rate.AdaptiveRateController(
+    max_rpm=CONFIG.LLM_RPM,
+    min_rpm=min(CONFIG.LLM_MIN_RPM, CONFIG.LLM_RPM),
+    step_rpm=CONFIG.LLM_RPM_STEP,
+    failure_threshold=CONFIG.LLM_BREAKER_FAILURES,
+    cooldown=CONFIG.LLM_BREAKER_COOLDOWN,
+) if CONFIG.LLM_ADAPTIVE else None
+
+
+def get_rate_controller():
+    return _rate_controller
+
+
+_retry_policy = retry_policy.RetryPolicy(
+    {cls: retry_policy.RetryRule(**rule) for cls, rule in CONFIG.RETRY_RULES.items()}
+)
+
+
+def get_retry_policy():
+    return _retry_policy
+
+
+# 按客户端 / 任务加权公平排队，交互请求优先于批量 chunk
+_fair_queue = fair_queue.FairQueue(tenant_cap=CONFIG.TENANT_MAX_IN_FLIGHT)
+
+
+def get_fair_queue():
+    return _fair_queue
+
+
+def _controlled(func):
+    return adaptive_rate.controlled(_rate_controller)(func) if _rate_controller else func
+
+
 class _SynchronizedChatModel(_ChatModel):
     def __init__(self, **kwargs):
         super(_SynchronizedChatModel, self).__init__(**kwargs)
 
     # @utils.semaphore(CONFIG.LLM_MAX_THREADS)
-    @backoff.on_exception(backoff.expo, Exception, max_tries=CONFIG.MAX_TRY,raise_on_giveup=True)
+    @_retry_policy.retrying
     # @utils.semaphore(CONFIG.LLM_RPM)
-    @utils.rate_limited(qpm=CONFIG.LLM_RPM)
+    @_controlled
+    @utils.rate_limited(qpm=CONFIG.LLM_RPM, mode=CONFIG.LLM_LIMITER, burst=CONFIG.LLM_BURST, tpm=CONFIG.LLM_TPM,
+                        scope="llm", backend=limiter_backend.get_backend(CONFIG.LLM_LIMITER_BACKEND, CONFIG.LLM_LIMITER_PATH),
+                        cost=lambda self, input, *args, **kwargs: _estimate_tokens(input),
+                        usage=lambda result: (getattr(result, "usage_metadata", None) or {}).get("total_tokens"),
+                        refund=retry_policy.not_counted if CONFIG.LLM_REFUND_THROTTLED else retry_policy.not_sent,
+                        gate=_fair_queue)
     async def ainvoke(self, *args, **kwargs):
         start_time = time.time()
 
@@ -32,6 +78,8 @@ class _SynchronizedChatModel(_ChatModel):
 
             end_time = time.time()
             duration = end_time - start_time
+            # 输入 token / 命中前缀缓存的 token 记到当前任务（prefix_cache.tracking）名下
+            prefix_cache.record(result, duration)
             # 你可以改成写数据库、写文件、打 metrics 等
             if duration > CONFIG.TIME_WARN:
                 logger.info(
@@ -43,6 +91,7 @@ class _SynchronizedChatModel(_ChatModel):
             end_time = time.time()
             duration = end_time - start_time
             logger.info(f"[LLM CALL Error] {e} , duration={duration:.3f}s")
+            _retry_policy.record(retry_policy.CONTENT_FILTER, retried=False)
             return AIMessage("")
 
 
@@ -58,6 +107,11 @@ def get_llm():
     global _llm
     return _llm
 
+
+def get_limiter():
+    """LLM 调用共用的限流器（rate_limited 暴露的 .limiter），供准入控制估算排队时间。"""
+    return _SynchronizedChatModel.ainvoke.limiter
+
 #
 # class _EmbeddingClient:
 #     def __init__(self, model: str = CONFIG.EMBEDDING_MODEL):
@@ -104,7 +158,7 @@ def get_llm():
 #         embeddings_array = np.vstack([np.asarray(emb, dtype=np.float32) for emb in embeddings])
 #         return embeddings_array
 #
-#     @backoff.on_exception(backoff.expo, Exception, max_tries=CONFIG.MAX_TRY,raise_on_giveup=True)
+#     @_retry_policy.retrying
 #     async def _try_batch_request(self, batch: List[str]) -> List[List[float]]:
 #         """
 #         尝试请求一个批次的嵌入，并启用 backoff 重试机制。
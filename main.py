@@ -4,9 +4,24 @@ import warnings
 
 import CONFIG
 from graph import main_graph
+from method import chunk_method
 import utils
+from utils import checkpointer_pool, job_progress, ordered_writer
 from states.main_state import MainState
 
+async def run(state: MainState, sink: job_progress.ProgressSink = None) -> str:
+    # 与 webapp 共用同一个 lifespan：打开 checkpointer 并预编译图
+    async with checkpointer_pool.lifespan():
+        try:
+            if sink is None:
+                return await main_graph.start_or_resume(state)
+            with job_progress.reporting(sink):
+                return await main_graph.start_or_resume(state)
+        finally:
+            # 关闭校验进程池，不残留 worker 进程
+            chunk_method.get_validator().close()
+
+
 if __name__=="__main__":
     sql_file_path = r"resources/sqls/其他备份建表-gbase 8C/gbase 8C备份建表语句-STG/gbase8c建表（财务税务）.txt"
     destination_sql_example_path= r"resources/sqls/example-gbase hd/STG层建表HD--产业协同供需（错误表、结果表、error表）.sql"
@@ -60,9 +75,6 @@ if __name__=="__main__":
             warnings.warn(f"Unsupported sql checker format: {destination_format}, grammar check not available.")
             destination_sql_language=""
 
-    with open(sql_file_path, "r", encoding="utf-8") as f:
-        source_sql = f.read()
-
     if destination_sql_example_path:
         with open(destination_sql_example_path, "r", encoding="utf-8") as f:
             destination_sql = f.read()
@@ -70,18 +82,18 @@ if __name__=="__main__":
         destination_sql = ""
 
     state=MainState(
+        # 与整文件读入时的 stable_cache_key(source_sql) 相同，旧 checkpoint 仍可复用
         task_id=utils.task_id(general_prompt, source_format, destination_format, sql_file_path,
-                              utils.stable_cache_key(source_sql)),
+                              utils.text_digest(sql_file_path)),
         general_prompt=general_prompt,
         source_format=source_format,
         destination_format=destination_format,
         destination_sql_language=destination_sql_language,
-        source_sql=source_sql,
+        # 不整文件读入：send_tasks 按块流式切分，边切边调度
+        source_path=sql_file_path,
         destination_example=destination_sql,
     )
 
-    result_sql=asyncio.run(main_graph.start_or_resume(state))
-
     # ===== 文件名生成逻辑 =====
     base_dir = os.path.dirname(sql_file_path)
     base_name = os.path.splitext(os.path.basename(sql_file_path))[0]
@@ -92,8 +104,24 @@ if __name__=="__main__":
         f"{base_name}_to_{destination_format}.sql"
     )
 
-    # ===== 保存结果 =====
-    with open(destination_file_path, "w", encoding="utf-8") as f:
-        f.write(result_sql)
+    # ===== 转换并保存结果 =====
+    # 流式写出：chunk 的有序前缀完成即落盘，中断后重跑会从已落盘处继续
+    writer = ordered_writer.OrderedFileWriter(
+        # 续写按 chunk 序号对齐，换了切分方式就不能接着上次的进度写
+        destination_file_path, key=f"{state.task_id}:{CONFIG.SPLITTER}", max_buffer=CONFIG.STREAM_BUFFER_CHARS,
+    ) if CONFIG.STREAM_OUTPUT else None
+    try:
+        result_sql=asyncio.run(run(state, writer))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if result_sql or writer is None:
+        # 未开启流式写出，或命中了未流式写出时完成的 checkpoint
+        with open(destination_file_path, "w", encoding="utf-8") as f:
+            f.write(result_sql)
+    elif not writer.complete:
+        raise SystemExit(f"任务的 checkpoint 已完成，但 {destination_file_path} 不完整（可能被删除或改动），"
+                         f"请删除该任务的 checkpoint 后重跑。")
 
     print(f"转换完成，结果已保存至：{destination_file_path}")
@@ -0,0 +1,110 @@
+import asyncio
+import os
+from typing import Iterator, Tuple
+
+import CONFIG
+import utils
+from graph import chunk_graph
+from method import chunk_method, main_method
+from states.main_state import BatchRecord, ChunkState, JobContext, MainState
+from utils import batch_api, job_store, rule_translate as rules
+
+_client = None
+
+
+def get_batch_client() -> batch_api.BatchClient:
+    global _client
+    if _client is None:
+        if CONFIG.BATCH_PROVIDER == "local":
+            _client = batch_api.LocalBatchClient(
+                os.path.join(CONFIG.BATCH_DIR, "local"),
+                batch_api.http_handler(base_url=CONFIG.BATCH_API_BASE, api_key=CONFIG.API_KEY),
+                concurrency=CONFIG.BATCH_LOCAL_CONCURRENCY,
+            )
+        else:
+            _client = batch_api.OpenAIBatchClient(
+                api_key=CONFIG.API_KEY,
+                base_url=CONFIG.BATCH_API_BASE,
+                completion_window=CONFIG.BATCH_COMPLETION_WINDOW,
+            )
+    return _client
+
+
+def _requests(state: MainState, job: JobContext, job_id: str) -> Iterator[Tuple[str, dict]]:
+    """
+    逐 chunk 生成 (custom_id, 请求 body)，custom_id 为源 SQL 的哈希（send_tasks 据此取回结果）。
+    相同的 chunk 只请求一次；命中翻译缓存、或规则翻译能完整处理的 chunk 不请求，留给 send_tasks 按原方式处理。
+    """
+    cache = chunk_graph.get_translation_cache()
+    rule_set = chunk_method.get_rule_set(job.destination_format)
+    seen = set()
+    for sql in main_method._iter_chunks(state):
+        custom_id = utils.stable_cache_key(sql)
+        if custom_id in seen:
+            continue
+        seen.add(custom_id)
+        if cache is not None and cache.get(chunk_graph._cache_key(
+                ChunkState(task_id=state.task_id, job_id=job_id, sql=sql))) is not None:
+            continue
+        if rule_set is not None:
+            try:
+                rules.translate(sql, rule_set, source_dialect=main_method._source_dialect(state),
+                                destination_dialect=job.destination_sql_language, target_schema=job.target_schema)
+                continue
+            except rules.Unsupported:
+                pass
+        yield custom_id, chunk_method.chunk_request_body(job, sql)
+
+
+async def submit_batch(state: MainState):
+    update = {}
+    if not state.prompt_normalized:
+        # 批处理不做投机执行：所有请求都要用规范化后的提示词
+        update = {"general_prompt": await main_method.normalize_prompt(state), "prompt_normalized": True}
+        state = state.model_copy(update=update)
+    job = JobContext.from_state(state)
+
+    directory = os.path.join(CONFIG.BATCH_DIR, state.task_id)
+    # 构造请求要切分、规则翻译和序列化整份 SQL，放到线程里避免卡住事件循环
+    with job_store.hold(job) as job_id:
+        parts = await asyncio.to_thread(batch_api.write_parts, directory, _requests(state, job, job_id),
+                                        max_requests=CONFIG.BATCH_MAX_REQUESTS, max_bytes=CONFIG.BATCH_MAX_BYTES)
+
+    client = get_batch_client()
+    records = []
+    for i, (path, n) in enumerate(parts):
+        # 提交后、checkpoint 写入前中断时，重跑会按 metadata 找回同一批次，不会重复提交（重复计费）
+        metadata = {"task_id": state.task_id, "part": str(i), "requests": utils.text_digest(path)}
+        batch_id = await client.find(metadata) or await client.submit(path, metadata=metadata)
+        records.append(BatchRecord(id=batch_id, part=i, requests=n))
+        print(f"[Batch] 已提交 {i + 1}/{len(parts)}：{batch_id}，{n} 个请求")
+    return {**update, "batches": records}
+
+
+async def wait_batch(state: MainState):
+    """轮询到所有批次结束（完成 / 失败 / 过期 / 取消），把结果下载到本地；没有结果的 chunk 之后走在线翻译。"""
+    client = get_batch_client()
+    directory = os.path.join(CONFIG.BATCH_DIR, state.task_id)
+    records = [b.model_copy() for b in state.batches]
+    while True:
+        for b in records:
+            if b.output_path:
+                continue
+            info = await client.retrieve(b.id)
+            if info.status != b.status:
+                print(f"[Batch] {b.id}: {info.status} {info.counts}")
+                b.status = info.status
+            if info.done:
+                path = os.path.join(directory, f"results-{b.part}.jsonl")
+                if info.output_file_id or info.error_file_id:
+                    await client.download(info, path)
+                else:
+                    open(path, "w").close()
+                b.output_path = path
+        if all(b.output_path for b in records):
+            break
+        await asyncio.sleep(CONFIG.BATCH_POLL_INTERVAL)
+
+    if records:
+        print(f"[Batch] {batch_api.BatchResults(b.output_path for b in records).usage()}")
+    return {"batches": records}
@@ -1,50 +1,280 @@
+import functools
+import json
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage, convert_to_openai_messages
+from langchain_core.utils.json import parse_json_markdown
+
+import CONFIG
 import llm_client
 from states.main_state import ChunkResult, ChunkState
-import utils
+from utils import chunk_packer, job_store, prefix_cache, retry_policy, rule_translate as rules, statement_repair, structure_check, validation_pool
 
 
-async def process_chunk(state:ChunkState):
+@dataclass
+class RouteStats:
+    rules: int = 0            # 规则直接产出结果的 chunk 数
+    fallback: int = 0         # 规则无法处理、转交 LLM 的 chunk 数
+    rule_seconds: float = 0.0
+    llm_calls: int = 0
+    llm_seconds: float = 0.0
 
-    llm = llm_client.get_llm()
-    llm = llm.with_structured_output(ChunkResult)
+    @property
+    def saved_seconds(self) -> float:
+        """按 LLM 平均耗时估算规则路径节省的时间（未计入排队与限流）。"""
+        if not self.llm_calls:
+            return 0.0
+        return self.rules * self.llm_seconds / self.llm_calls - self.rule_seconds
 
-    prompt = (
-        "你是一名专业的 SQL 迁移与语法转换专家。\n"
-        "当前任务是将一个大型数据库中的 SQL 建表语句，从一种数据库格式转换为另一种数据库格式。\n\n"
 
-        f"【源数据库类型】{state.source_format}\n"
-        f"【目标数据库类型】{state.destination_format}\n\n"
+route_stats = RouteStats()
 
-        "【任务要求】\n"
-        f"{state.general_prompt}\n\n"
+_validator = None
+
+
+def get_validator() -> validation_pool.ValidationExecutor:
+    global _validator
+    if _validator is None:
+        _validator = validation_pool.ValidationExecutor(
+            mode=CONFIG.VALIDATION_EXECUTOR,
+            workers=CONFIG.VALIDATION_WORKERS,
+            max_pending=CONFIG.VALIDATION_MAX_PENDING,
+            cache_size=CONFIG.VALIDATION_CACHE_SIZE,
+        )
+    return _validator
+
+
+def get_rule_set(destination_format: str):
+    """返回目标格式对应的规则；未开启规则翻译或没有配置时返回 None。"""
+    if not CONFIG.RULE_TRANSLATE:
+        return None
+    return get_template_rules(destination_format)
+
+
+def get_template_rules(destination_format: str):
+    """目标格式的类型映射和模板要求（CONFIG.RULE_SETS），结构校验也用它；没有配置时返回 None。"""
+    cfg = CONFIG.RULE_SETS.get(destination_format.lower())
+    return rules.RuleSet(**cfg) if cfg else None
+
+
+@dataclass
+class StructureStats:
+    checked: int = 0
+    failed: int = 0           # 结构不一致、反馈给 LLM 重新翻译的次数
+    issues: int = 0
+
+
+structure_stats = StructureStats()
+
+
+async def check_output(source: str, output: str, job):
+    """
+    语法校验译文；开启结构校验且知道源 chunk 时，语法通过后再与源 chunk 比对结构。
+    返回 ((错误信息, 出错语句下标, 语句数), 结构差异)。
+    """
+    if not CONFIG.STRUCTURE_CHECK:
+        source = ""
+    result, issues = await get_validator().check(
+        output, job.destination_sql_language,
+        source=source,
+        source_dialect=CONFIG.SQLGLOT_DIALECT_MAP.get(job.source_format.lower(), ""),
+        rules=get_template_rules(job.destination_format) if source else None,
+        target_schema=job.target_schema,
+    )
+    if source and not result[0]:
+        structure_stats.checked += 1
+        if issues:
+            structure_stats.failed += 1
+            structure_stats.issues += len(issues)
+    return result, issues
+
+
+async def rule_translate(state:ChunkState):
+    job = job_store.get(state.job_id)
+    start = time.perf_counter()
+    try:
+        sql = rules.translate(
+            state.sql,
+            get_rule_set(job.destination_format),
+            source_dialect=CONFIG.SQLGLOT_DIALECT_MAP.get(job.source_format.lower(), ""),
+            destination_dialect=job.destination_sql_language,
+            target_schema=job.target_schema,
+        )
+    except rules.Unsupported as e:
+        route_stats.fallback += 1
+        return {"route": "llm", "route_reason": str(e)}
+    finally:
+        route_stats.rule_seconds += time.perf_counter() - start
+
+    route_stats.rules += 1
+    return {"sql": sql, "route": "rules"}
+
+
+# 服务端前缀缓存（OpenAI 兼容接口按请求开头的相同字节复用）：同一任务的所有 chunk 调用共用逐字节相同的
+# system 消息，按“所有任务相同 → 同一源/目标格式相同 → 同一任务相同”的顺序排列，每个 chunk 只有 user 消息不同
+@functools.lru_cache(maxsize=256)
+def chunk_system_prompt(source_format: str, destination_format: str, general_prompt: str) -> str:
+    return (
+        "你是一名专业的 SQL 迁移与语法转换专家。\n"
+        "当前任务是将一个大型数据库中的 SQL 建表语句，从一种数据库格式转换为另一种数据库格式。\n\n"
 
         "【转换规则与约束】\n"
         "1. 仅对输入的 SQL 语句进行格式和语法层面的转换，不要引入输入中不存在的表或字段。\n"
         "2. 必须保证输出 SQL 在目标数据库中语法合法、可执行。\n"
         "3. 不要省略任何字段定义、表级属性或注释信息。\n"
         "4. 严格保持输入 SQL 中各建表语句及字段的原始顺序。\n"
-        "5. 如果源数据库中的某些语法或特性在目标数据库中不支持，请使用目标数据库中语义最接近的实现方式。\n"
+        "5. 如果源数据库中的某些语法或特性在目标数据库中不支持，请使用目标数据库中语义最接近的实现方式。\n\n"
         # "6. 你不用对输入进行检查。\n"
         # "6. 不要输出任何解释性文字、说明或 Markdown，只输出转换后的 SQL 语句本身。\n\n"
 
-        "\n\n"
-        "【待转换的 SQL 语句（当前分片）】\n"
-        f"{state.sql}\n"
+        f"【源数据库类型】{source_format}\n"
+        f"【目标数据库类型】{destination_format}\n\n"
 
-        +(f"上次运行的错误：{state.exception}" if state.exception else "")
+        "【任务要求】\n"
+        f"{general_prompt}\n"
+    )
+
+
+def chunk_messages(job, sql: str, exception: str = "") -> list:
+    """process_chunk 的请求：[任务级 system 前缀, chunk 级 user 后缀]。"""
+    suffix = (
+        (chunk_packer.PROMPT_RULE + "\n" if chunk_packer.is_packed(sql) else "")
+        + "【待转换的 SQL 语句（当前分片）】\n"
+        f"{sql}\n"
+        + (f"上次运行的错误：{exception}" if exception else "")
     )
+    return [SystemMessage(chunk_system_prompt(job.source_format, job.destination_format, job.general_prompt)),
+            HumanMessage(suffix)]
+
+
+def chunk_request_body(job, sql: str) -> dict:
+    """
+    与 process_chunk 相同的请求（消息、结构化输出格式、模型），按 OpenAI chat/completions 的公开请求格式
+    构造 body，供批处理使用。
+    """
+    return {
+        "model": llm_client.get_llm().model_name,
+        "messages": convert_to_openai_messages(chunk_messages(job, sql)),
+        "response_format": _response_format(),
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def _response_format() -> dict:
+    # 与 with_structured_output(ChunkResult) 的默认方式一致：json_schema，非 strict
+    return {"type": "json_schema",
+            "json_schema": {"name": ChunkResult.__name__, "strict": False, "schema": ChunkResult.model_json_schema()}}
+
+
+def parse_chunk_response(body: Optional[dict]) -> Optional[ChunkResult]:
+    """
+    解析批处理返回的 chat.completion body：取 choices[0].message，结构化结果在 content（json_schema）
+    或 tool_calls[0].function.arguments（function calling）中。没有结果或无法解析时返回 None（该 chunk 回到在线调用）。
+    """
+    if not body:
+        return None
+    try:
+        message = body["choices"][0]["message"]
+        if message.get("tool_calls"):
+            return ChunkResult(**json.loads(message["tool_calls"][0]["function"]["arguments"]))
+        return ChunkResult(**parse_json_markdown(message["content"]))
+    except Exception:
+        return None
+
+
+# 按 job_id 统计 chunk 调用的前缀缓存命中
+prefix_stats = prefix_cache.PrefixCacheRegistry()
+
+
+async def process_chunk(state:ChunkState):
+    job = job_store.get(state.job_id)
+    source = state.source or state.sql
+    # 语法错误让模型在上次输出上修；结构不一致（漏字段等）只看上次输出修不出来，改为基于源 SQL 重新翻译
+    sql = source if state.exception.startswith(structure_check.PREFIX) else state.sql
+
+    llm = llm_client.get_llm()
+    llm = llm.with_structured_output(ChunkResult)
 
-    cr:ChunkResult=await llm.ainvoke(prompt)
+    start = time.perf_counter()
+    # 本次调用占 1 次，调用层的重试从剩余次数里扣，和图内的语法重试共用 limiter
+    with retry_policy.attempt_budget(state.limiter - 1) as budget, prefix_cache.tracking(prefix_stats.get(state.job_id)):
+        cr:ChunkResult=await llm_client.get_retry_policy().call(llm.ainvoke, chunk_messages(job, sql, state.exception))
+    route_stats.llm_calls += 1
+    route_stats.llm_seconds += time.perf_counter() - start
 
-    return {"sql":cr.sql+"\n\n" if cr else "","limiter":state.limiter-1}
+    return {"sql":cr.sql+"\n\n" if cr else "","limiter":budget.remaining,"route":"llm","source":source}
 
 
 async def validate_sql(state:ChunkState):
     if not state.limiter:
         raise RuntimeError(f"重试耗尽，报错:{state.exception}，语句：{state.sql}")
     if not state.sql:
-        return {"exception","[warnning]上次调用没有返回sql语句"}
+        return {"exception":"[warnning]上次调用没有返回sql语句","broken":[]}
     else:
-        e= utils.validate_sql(state.sql, state.destination_sql_language)
+        job = job_store.get(state.job_id)
+        # 解析在校验进程池里完成，出错时顺带定位出错语句，通过时顺带与源 chunk 比对结构
+        (e, broken, n_statements), issues = await check_output(state.source, state.sql, job)
         if e:
-            return {"exception":str(e)}
\ No newline at end of file
+            # 只有少数语句出错时走语句级修复，否则整段重新生成
+            if len(broken) * 2 > n_statements:
+                broken = []
+            return {"exception":e,"broken":broken}
+        # 结构不一致时把具体差异反馈给下一次生成
+        if issues:
+            return {"exception":structure_check.describe(issues),"broken":[]}
+        return {"exception":"","broken":[]}
+
+
+@dataclass
+class RepairStats:
+    repairs: int = 0          # 语句级修复调用次数
+    statements: int = 0       # 被修复的语句数
+    input_tokens: int = 0
+    output_tokens: int = 0
+    seconds: float = 0.0
+
+
+repair_stats = RepairStats()
+
+
+async def repair_statements(state:ChunkState):
+    """只把出错的语句和报错发给 LLM，修复结果拼回原 chunk，其余语句保持不变。"""
+    job = job_store.get(state.job_id)
+    dialect = job.destination_sql_language
+    statements = statement_repair.split_statements(state.sql, dialect)
+
+    llm = llm_client.get_llm().with_structured_output(ChunkResult, include_raw=True)
+    repaired = {}
+    budget = retry_policy.AttemptBudget(state.limiter - 1)
+    for i in state.broken:
+        prompt = (
+            "你是一名专业的 SQL 迁移与语法转换专家。\n"
+            f"下面这条 {job.destination_format}（{dialect}）建表语句存在语法错误，请只修复语法问题，"
+            "不要改动字段、类型、注释和表名，不要输出任何解释。\n\n"
+            f"【报错】{await get_validator().validate(statements[i], dialect)}\n\n"
+            "【待修复的 SQL 语句】\n"
+            f"{statements[i].strip()}\n"
+        )
+        start = time.perf_counter()
+        with retry_policy.attempt_budget(budget.remaining) as used:
+            rs = await llm_client.get_retry_policy().call(llm.ainvoke, prompt)
+        budget.remaining = used.remaining
+        duration = time.perf_counter() - start
+
+        raw = rs.get("raw") if isinstance(rs, dict) else None
+        usage = getattr(raw, "usage_metadata", None) or {}
+        repair_stats.repairs += 1
+        repair_stats.seconds += duration
+        repair_stats.input_tokens += usage.get("input_tokens", 0)
+        repair_stats.output_tokens += usage.get("output_tokens", 0)
+        print(f"[Repair] statement={i + 1}/{len(statements)}, duration={duration:.2f}s, "
+              f"tokens={usage.get('input_tokens', 0)}+{usage.get('output_tokens', 0)}")
+
+        cr = rs.get("parsed") if isinstance(rs, dict) else None
+        if cr and cr.sql.strip():
+            repaired[i] = cr.sql
+            repair_stats.statements += 1
+
+    return {"sql": statement_repair.splice(statements, repaired), "limiter": budget.remaining, "broken": []}
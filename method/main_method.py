@@ -1,18 +1,144 @@
+import asyncio
+import contextlib
+import functools
+import json
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional
+
 from pydantic import BaseModel, Field
 
 import CONFIG
 import llm_client
 from graph import chunk_graph
-from states.main_state import MainState, ChunkState
+from method import chunk_method
+from states.main_state import MainState, ChunkState, JobContext
 from tqdm.asyncio import tqdm
 import utils
+from utils import batch_api, chunk_packer, ddl_splitter, fair_queue, job_progress, job_store, sql_template, structure_check, \
+    translation_cache
 
 # async def requirement_alignment(state:MainState):
 #     llm=llm_client.get_llm()
 #     prompt=""
 
 
+# 规范化提示词的模板（下面 _llm_normalize 中的文字）或取样方式改动时递增，旧缓存条目自然失效
+_PROMPT_VERSION = 1
+
+_prompt_cache = None
+
+
+def get_prompt_cache():
+    global _prompt_cache
+    if _prompt_cache is None and CONFIG.PROMPT_CACHE:
+        # 与 chunk 翻译缓存同一实现（LRU + TTL），存放在单独的文件里
+        _prompt_cache = translation_cache.TranslationCache(
+            CONFIG.PROMPT_CACHE_PATH,
+            max_entries=CONFIG.PROMPT_CACHE_MAX_ENTRIES,
+            ttl=CONFIG.PROMPT_CACHE_TTL,
+        )
+    return _prompt_cache
+
+
+@dataclass
+class PromptStats:
+    cache_hits: int = 0
+    llm_calls: int = 0
+    llm_seconds: float = 0.0
+    speculative_chunks: int = 0    # 规范化完成前用原始 general_prompt 开始的 chunk 数
+
+
+prompt_stats = PromptStats()
+
+# 进行中的规范化调用：相同 key 的并发请求（多个任务 / /api/normalize_prompt）只调用一次 LLM
+_normalizing: Dict[str, asyncio.Future] = {}
+# 本进程内各任务开始运行的时间，用于统计首个 chunk 完成的耗时
+_run_started: Dict[str, float] = {}
+
+
+def _source_sample(state: MainState) -> str:
+    source_sample = state.source_sql[:10000]
+    if not source_sample and state.source_path:
+        with open(state.source_path, "r", encoding="utf-8") as f:
+            source_sample = f.read(10000)
+    return source_sample
+
+
+def _prompt_key(state: MainState, source_sample: str) -> str:
+    payload = {
+        "v": _PROMPT_VERSION,
+        "model": CONFIG.LLM_TYPE,
+        "prompt": utils.stable_cache_key(state.general_prompt),
+        "source_format": state.source_format,
+        "destination_format": state.destination_format,
+        "target_schema": state.target_schema,
+        "merge_n": state.merge_n,
+        "source_sample": utils.stable_cache_key(source_sample),
+        "destination_example": utils.stable_cache_key(state.destination_example[:10000]),
+    }
+    return utils.stable_cache_key(json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")))
+
+
+def cached_prompt(state: MainState) -> Optional[str]:
+    """已缓存的规范化结果，没有时返回 None（不调用 LLM）。"""
+    cache = get_prompt_cache()
+    if cache is None:
+        return None
+    prompt = cache.get(_prompt_key(state, _source_sample(state)))
+    if prompt is not None:
+        prompt_stats.cache_hits += 1
+    return prompt
+
+
+async def normalize_prompt(state: MainState) -> str:
+    """
+    把用户的 general_prompt 规范化为逐 chunk 使用的提示词。
+    结果按 (general_prompt, 源/目标格式, target_schema, merge_n, 示例摘要, 模型, 模板版本) 持久化缓存，
+    相同参数的并发调用共用一次 LLM 请求。
+    """
+    source_sample = _source_sample(state)
+    key = _prompt_key(state, source_sample)
+    cache = get_prompt_cache()
+    if cache is not None:
+        prompt = cache.get(key)
+        if prompt is not None:
+            prompt_stats.cache_hits += 1
+            return prompt
+    if key in _normalizing:
+        return await asyncio.shield(_normalizing[key])
+
+    fut = _normalizing[key] = asyncio.get_running_loop().create_future()
+    try:
+        start = time.perf_counter()
+        prompt = await _llm_normalize(state, source_sample)
+        prompt_stats.llm_calls += 1
+        prompt_stats.llm_seconds += time.perf_counter() - start
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()   # 没有并发等待者时避免 "exception was never retrieved"
+        raise
+    finally:
+        _normalizing.pop(key, None)
+    fut.set_result(prompt)
+    if cache is not None:
+        cache.put(key, prompt)
+    return prompt
+
+
 async def prompt_normalize(state: MainState):
+    _run_started.setdefault(state.task_id, time.perf_counter())
+    if CONFIG.PROMPT_SPECULATIVE:
+        prompt = cached_prompt(state)
+        if prompt is None:
+            # 不阻塞：send_tasks 在后台规范化，先用原始提示词开始前几个 chunk
+            return {}
+    else:
+        prompt = await normalize_prompt(state)
+    return {"general_prompt": prompt, "prompt_normalized": True}
+
+
+async def _llm_normalize(state: MainState, source_sample: str) -> str:
     llm = llm_client.get_llm()
 
     class Prompt(BaseModel):
@@ -70,8 +196,8 @@ async def prompt_normalize(state: MainState):
             "- 是否需要在真实任务中新增此类字段，必须以【用户规则或目标模板】为依据；\n"
             "- 示例仅用于总结模式，不得被直接复用到最终输出中。\n\n"
 
-            + (f"【源数据库建表 SQL 示例】\n'''\n{state.source_sql[:10000]}\n'''\n\n"
-               if state.source_sql else "")
+            + (f"【源数据库建表 SQL 示例】\n'''\n{source_sample}\n'''\n\n"
+               if source_sample else "")
 
             + (f"【目标数据库 / 数仓建表 SQL 示例】\n'''\n{state.destination_example[:10000]}\n'''\n\n"
                if state.destination_example else "")
@@ -82,30 +208,246 @@ async def prompt_normalize(state: MainState):
               "不要输出任何背景说明、分析过程或与提示词无关的内容。\n"
     )
 
-    result: Prompt = await llm.ainvoke(prompt)
+    result: Prompt = await llm_client.get_retry_policy().call(llm.ainvoke, prompt)
 
-    return {"general_prompt": result.prompt}
+    return result.prompt
 
 
 async def chunk_sql(state: MainState):
-    chunked_sql = utils.split_sql(state.source_sql)
+    if state.source_path:
+        # 文件模式：send_tasks 边读边切，chunk 列表不进 state / checkpoint
+        return {"chunked_sql": []}
+    if CONFIG.SPLITTER == "ddl":
+        chunked_sql = ddl_splitter.split_ddl(state.source_sql, _source_dialect(state))
+    else:
+        chunked_sql = utils.split_sql(state.source_sql)
     return {"chunked_sql": chunked_sql}
 
+def _source_dialect(state: MainState) -> str:
+    return CONFIG.SQLGLOT_DIALECT_MAP.get(state.source_format.lower(), "")
+
+def _iter_chunks(state: MainState) -> Iterable[str]:
+    if state.source_path:
+        if CONFIG.SPLITTER == "ddl":
+            return ddl_splitter.iter_split_ddl_file(state.source_path, _source_dialect(state))
+        return utils.iter_split_sql(state.source_path, block_size=CONFIG.SPLIT_BLOCK_SIZE, use_mmap=CONFIG.SPLIT_MMAP)
+    return state.chunked_sql
+
+
 
 async def send_tasks(state: MainState):
-    chunk_states = [
-        ChunkState(
-            **state.model_dump(),
-            sql=sql,
-            limiter=CONFIG.MAX_TRY
+    # chunk 运行期间固定用到的 JobContext，不会被 job_store 的 LRU 淘汰
+    with contextlib.ExitStack() as pins:
+        return await _send_tasks(state, pins)
+
+
+async def _send_tasks(state: MainState, pins: contextlib.ExitStack):
+    started = _run_started.setdefault(state.task_id, time.perf_counter())
+    # 共享参数只存一份，chunk 状态里只带 job_id
+    job_id = pins.enter_context(job_store.hold(JobContext.from_state(state)))
+    job_ids = [job_id]
+
+    # 投机执行：规范化在后台进行，完成前最多 PROMPT_SPECULATIVE_CHUNKS 个 chunk 用原始提示词开始，
+    # 之后的 chunk 等待规范化结果；完成后新派发的 chunk 改用新的 job_id（规范化后的提示词）
+    normalizing = asyncio.ensure_future(normalize_prompt(state)) \
+        if CONFIG.PROMPT_SPECULATIVE and not state.prompt_normalized else None
+    normalized = ""
+    speculative_left = CONFIG.PROMPT_SPECULATIVE_CHUNKS
+
+    def adopt_prompt() -> None:
+        nonlocal job_id, normalizing, normalized
+        try:
+            normalized = normalizing.result()
+        except Exception as e:
+            print(f"[PromptNormalize] 规范化失败，继续使用原始提示词：{type(e).__name__}: {e}")
+        else:
+            job_id = pins.enter_context(
+                job_store.hold(JobContext.from_state(state.model_copy(update={"general_prompt": normalized}))))
+            job_ids.append(job_id)
+        normalizing = None
+
+    async def wait_prompt(n: int) -> None:
+        nonlocal speculative_left
+        if normalizing is None:
+            return
+        if not normalizing.done() and speculative_left >= n:
+            speculative_left -= n
+            prompt_stats.speculative_chunks += n
+            return
+        await asyncio.wait([normalizing])
+        if normalizing is not None:
+            adopt_prompt()
+
+    # 离线批处理模式：已下载的批处理结果按源 SQL 的哈希取用
+    batch_results = batch_api.BatchResults(b.output_path for b in state.batches if b.output_path) \
+        if state.batches else None
+    prefilled = missing = 0
+
+    def new_state(sql: str) -> ChunkState:
+        nonlocal prefilled, missing
+        # ChunkState 在 worker 真正开始时才构建，避免一次性创建上千个状态对象
+        if batch_results is not None:
+            cr = chunk_method.parse_chunk_response(batch_results.get(utils.stable_cache_key(sql)))
+            if cr is not None:
+                # 批处理那次调用算一次尝试，剩余次数用于校验失败后的在线重试
+                prefilled += 1
+                return ChunkState(task_id=state.task_id, job_id=job_id, sql=cr.sql + "\n\n", source=sql,
+                                  route="batch", limiter=CONFIG.MAX_TRY - 1)
+            missing += 1
+        return ChunkState(task_id=state.task_id, job_id=job_id, sql=sql, limiter=CONFIG.MAX_TRY)
+
+    async def translate(sql: str) -> str:
+        return await chunk_graph.start_or_resume(new_state(sql))
+
+    job = JobContext.from_state(state)
+
+    async def check_instance(source: str, sql: str) -> str:
+        (e, _, _), issues = await chunk_method.check_output(source, sql, job)
+        return e or (structure_check.describe(issues) if issues else "")
+
+    # 结构相同、只有表名不同的 chunk 只让代表调用 LLM；替换表名后的译文与 LLM 译文一样做语法 + 结构校验
+    templates = sql_template.TemplateReuse(
+        _source_dialect(state),
+        state.destination_sql_language,
+        validate=check_instance,
+    ) if CONFIG.TEMPLATE_REUSE else None
+
+    async def run_chunk(sql: str) -> str:
+        if templates is None:
+            return await translate(sql)
+        return await templates.run(sql, translate)
+
+    # 相邻小表按 token 预算合并，每批最多 merge_n 张；拆分或校验失败的表回退为逐表翻译
+    estimate = functools.partial(chunk_packer.estimate_tokens,
+                                 chars_per_token=CONFIG.PACK_CHARS_PER_TOKEN, tokenizer=CONFIG.PACK_TOKENIZER)
+    batches = chunk_packer.iter_pack(
+        _iter_chunks(state),
+        # 批处理结果是逐 chunk 的，不再合并
+        max_items=1 if batch_results is not None else state.merge_n,
+        input_budget=CONFIG.PACK_INPUT_TOKENS,
+        output_budget=CONFIG.PACK_OUTPUT_TOKENS,
+        overhead=CONFIG.PACK_PROMPT_OVERHEAD + estimate(state.general_prompt),
+        output_ratio=CONFIG.PACK_OUTPUT_RATIO,
+        estimate=estimate,
+    )
+
+    sink = job_progress.current()
+    if sink is not None and not state.source_path:
+        sink.set_total(len(state.chunked_sql))
+    # 流式写出（utils.ordered_writer）时结果由 sink 落盘，不再在内存里拼全文；已落盘的有序前缀不必重跑
+    owns_output = getattr(sink, "owns_output", False)
+    resume_from = getattr(sink, "resume_from", 0)
+    # 每个派发出去的 batch 第一个 chunk 在原文件中的序号，用于向进度接收方按原序号上报
+    starts: List[int] = []
+    total = 0
+
+    def dispatch() -> Iterator[List[str]]:
+        nonlocal total
+        for batch in batches:
+            first, total = total, total + len(batch)
+            if total <= resume_from:
+                bar.update(len(batch))
+                continue
+            starts.append(first)
+            yield batch
+
+    async def run_batch(batch: List[str]) -> List[str]:
+        await wait_prompt(len(batch))
+        if len(batch) == 1:
+            return [await run_chunk(batch[0])]
+        results = await chunk_graph.start_or_resume_batch([new_state(sql) for sql in batch])
+        return [r if r is not None else await run_chunk(sql) for sql, r in zip(batch, results)]
+
+    first_chunk = None
+    with tqdm(desc="Transferring sqls: ", total=None if state.source_path else len(state.chunked_sql)) as bar:
+        def on_done(idx, result, stats):
+            nonlocal first_chunk
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - started
+            bar.update(len(result))
+            bar.set_postfix(queued=stats.queued, in_flight=stats.in_flight, refresh=False)
+            if sink is not None:
+                for i, sql in enumerate(result, starts[idx]):
+                    sink.put(i, sql)
+
+        scheduler = utils.ChunkScheduler(
+            run_batch,
+            concurrency=CONFIG.MAX_CONCURRENCY,
+            policy=CONFIG.CHUNK_ORDER,
+            max_attempts=CONFIG.CHUNK_MAX_ATTEMPTS,
+            size_of=lambda batch: sum(len(sql) for sql in batch),
+            on_done=on_done,
+            keep_results=not owns_output,
         )
-        for sql in state.chunked_sql]
+        with fair_queue.tenant(state.task_id, "bulk"):
+            result = [sql for batch in await scheduler.run(dispatch()) for sql in batch]
+    if sink is not None:
+        sink.set_total(total)
+    if normalizing is not None:
+        # chunk 都已完成：规范化结果不再用于本次任务，但仍等它写入缓存并记入 state
+        await asyncio.wait([normalizing])
+        adopt_prompt()
+    _run_started.pop(state.task_id, None)
+
+    # first_chunk 从本进程开始运行该任务（含提示词规范化）算起
+    print(f"[Timing] first_chunk={'-' if first_chunk is None else f'{first_chunk:.2f}s'}, "
+          f"total={time.perf_counter() - started:.2f}s, prompt_cache_hits={prompt_stats.cache_hits}, "
+          f"prompt_llm={prompt_stats.llm_calls}/{prompt_stats.llm_seconds:.2f}s, "
+          f"speculative_chunks={prompt_stats.speculative_chunks}")
+
+    if batch_results is not None:
+        # missing：没有可用结果（请求失败、无法解析、批次过期）而改为在线翻译的 chunk
+        print(f"[Batch] results={len(batch_results)}, used={prefilled}, missing={missing}")
+
+    packed = chunk_graph.pack_stats
+    if packed.batches:
+        print(f"[ChunkPacker] batches={packed.batches}, packed={packed.packed}, split_failed={packed.split_failed}, "
+              f"fallback={packed.fallback}, calls_saved={packed.calls_saved}")
+
+    if templates is not None:
+        print(f"[TemplateReuse] representatives={templates.representatives}, fast_path={templates.fast_path}, "
+              f"fallback={templates.fallback}")
+
+    stats = chunk_method.route_stats
+    if stats.rules or stats.fallback:
+        print(f"[RuleTranslate] rules={stats.rules}, fallback={stats.fallback}, "
+              f"rule_time={stats.rule_seconds:.2f}s, est_saved={stats.saved_seconds:.1f}s")
+
+    controller = llm_client.get_rate_controller()
+    if controller is not None and (controller.stats.throttled or controller.stats.outages):
+        print(f"[RateControl] {controller.snapshot()}")
+
+    retries = llm_client.get_retry_policy().snapshot()
+    if retries:
+        print(f"[Retry] {retries}")
+
+    repaired = chunk_method.repair_stats
+    if repaired.repairs:
+        print(f"[Repair] calls={repaired.repairs}, statements={repaired.statements}, "
+              f"tokens={repaired.input_tokens}+{repaired.output_tokens}, "
+              f"avg_latency={repaired.seconds / repaired.repairs:.2f}s")
+
+    checked = chunk_method.structure_stats
+    if checked.failed:
+        print(f"[StructureCheck] checked={checked.checked}, failed={checked.failed}, issues={checked.issues}")
+
+    prefix = chunk_method.prefix_stats.combined(job_ids)
+    if prefix.calls:
+        print(f"[PrefixCache] calls={prefix.calls}, hits={prefix.hits}, "
+              f"cached_tokens={prefix.cached_tokens}/{prefix.prompt_tokens}, hit_ratio={prefix.hit_ratio:.1%}, "
+              f"est_saved={prefix.saved_seconds:.1f}s")
 
-    tasks = [chunk_graph.start_or_resume(i) for i in chunk_states]
+    validation = chunk_method.get_validator().snapshot()
+    if validation["calls"]:
+        print(f"[Validation] {validation}")
 
-    result = await tqdm.gather(*tasks, desc="Transferring sqls: ", total=len(tasks))
+    cache = chunk_graph.get_translation_cache()
+    if cache is not None:
+        print(f"[TranslationCache] hits={cache.stats.hits}, misses={cache.stats.misses}, "
+              f"hit_ratio={cache.stats.hit_ratio:.1%}, evictions={cache.stats.evictions}")
 
-    return {"result": "".join(result)}
+    update = {"general_prompt": normalized, "prompt_normalized": True} if normalized else {}
+    return {"result": "" if owns_output else "".join(result), **update}
 
 # async def final_join(state: MainState):
 #     state.result_chunks.sort(key=lambda x: x.id)
@@ -10,22 +10,80 @@ class ChunkResult(BaseModel):
 
 
 
+class BatchRecord(BaseModel):
+    """离线批处理模式下提交的一个批次（一个请求文件）。"""
+    id: str = Field(description="提供方返回的批次 id")
+    part: int = Field(description="请求文件序号")
+    requests: int = Field(default=0, description="请求数")
+    status: str = Field(default_factory=str, description="最近一次查询到的状态")
+    output_path: str = Field(default_factory=str, description="结果下载到本地的路径，未下载时为空")
+
+
+
 class MainState(BaseModel):
     task_id: str = Field(description="用于恢复任务")
     general_prompt: str = Field(description="每次请求LLM会带的语句")
+    prompt_normalized: bool = Field(default=False, description="general_prompt 是否已经过 prompt_normalize 规范化")
     source_format: str = Field(description="源sql数据类型")
     destination_format: str = Field(description="目标sql数据类型(数仓规范)")
     destination_sql_language:str=Field(default_factory=str,description="目标数据库语言。")
     source_sql: str = Field(default_factory=str,description="原始sql语句")
+    source_path: str = Field(default_factory=str, description="源sql文件路径；非空时按块流式读取并切分，source_sql 可为空")
     target_schema:str = Field(default_factory=str,description="修改库名为...，如果为空不修改")
     destination_example: str = Field(default_factory=str, description="目标格式示例")
     chunked_sql: List[str] = Field(default_factory=list, description="分片后的sql，按表定义分")
-    result_chunks: List[ChunkResult] = Field(default_factory=list, description="结果sql，按表定义分片")
     result: str = Field(default_factory=str, description="最后输出的sql语句")
     merge_n:int = Field(default=1,description="几个分片合并为一个分片")
+    batches: List[BatchRecord] = Field(default_factory=list, description="离线批处理模式提交的批次，随 checkpoint 保存")
 
 
 
-class ChunkState(MainState, ChunkResult):
+class JobContext(BaseModel):
+    """一次转换任务内所有 chunk 共享的参数，只在 utils.job_store 中保存一份。"""
+    general_prompt: str = Field(description="每次请求LLM会带的语句")
+    source_format: str = Field(description="源sql数据类型")
+    destination_format: str = Field(description="目标sql数据类型(数仓规范)")
+    destination_sql_language: str = Field(default_factory=str, description="目标数据库语言。")
+    target_schema: str = Field(default_factory=str, description="修改库名为...，如果为空不修改")
+
+    @classmethod
+    def from_state(cls, state: BaseModel) -> "JobContext":
+        return cls(**state.model_dump(include=set(cls.model_fields)))
+
+
+
+class ChunkState(ChunkResult):
+    task_id: str = Field(description="用于恢复任务")
+    job_id: str = Field(description="共享参数在 job_store 中的 key（JobContext 的内容哈希）")
+    source: str = Field(default_factory=str, description="chunk 原始 SQL（sql 被译文覆盖后用于结构校验和重新翻译）")
     exception:str=Field(default_factory=str, description="解析的错误")
     limiter: int = Field(default=1,description="剩余尝试次数")
+    broken: List[int] = Field(default_factory=list, description="校验失败、需要单独修复的语句下标")
+    route: str = Field(default_factory=str, description="实际走的路径：rules / llm")
+    route_reason: str = Field(default_factory=str, description="规则翻译回退到 LLM 的原因")
+
+
+
+class ChunkRequest(JobContext, ChunkResult):
+    """/api/convert_chunk 的请求体：单个 chunk + 共享参数。"""
+    task_id: str = Field(default_factory=str, description="前端 chunk id")
+
+
+
+class PromptRequest(JobContext):
+    """
+    /api/normalize_prompt 的请求体。没有 source_path：服务端不按客户端给出的路径读文件，
+    源 SQL 示例只取 source_sql（前端多传的 chunked_sql 等字段会被忽略）。
+    """
+    task_id: str = Field(default_factory=str, description="前端会话 id")
+    source_sql: str = Field(default_factory=str, description="原始sql语句")
+    destination_example: str = Field(default_factory=str, description="目标格式示例")
+    merge_n: int = Field(default=1, description="几个分片合并为一个分片")
+
+
+
+class JobRequest(JobContext):
+    """/api/jobs 的请求体：整个文件 + 共享参数，由服务端切分并运行 main_graph。"""
+    source_sql: str = Field(description="原始sql语句")
+    destination_example: str = Field(default_factory=str, description="目标格式示例")
+    merge_n: int = Field(default=1, description="几个分片合并为一个分片")
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# CONFIG 在导入时要求 API_KEY；测试不访问真实模型
+os.environ.setdefault("API_KEY", "test")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# CONFIG 的资源目录等是相对路径，与 main.py / uvicorn 一样从仓库根目录运行
+os.chdir(ROOT)
@@ -0,0 +1,79 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from graph import chunk_graph
+from utils import admission, fair_queue
+from webapp import server
+
+
+def _queue_calls(queue: fair_queue.FairQueue, tenant: str, n: int, priority: str = "bulk"):
+    """在 queue 里排入 n 个等待中的调用（tenant_cap=1 时第一个被放行后其余都在排队）。"""
+    async def call():
+        with fair_queue.tenant(tenant, priority):
+            await queue.enter()
+
+    return [asyncio.ensure_future(call()) for _ in range(n)]
+
+
+def test_wait_is_estimated_from_queue_backlog_and_limiter():
+    async def run():
+        queue = fair_queue.FairQueue(tenant_cap=1)
+        controller = admission.AdmissionController(max_queue=100, tenant_queue=100, max_wait=30,
+                                                   rate=lambda: 60.0, queue=queue, next_free=lambda: 2.0)
+        assert controller.estimate_wait("a") == 2.0
+
+        tasks = _queue_calls(queue, "b", 11)
+        await asyncio.sleep(0)
+        queue.dispatched()
+        # b 有 1 个在途、10 个排队；a 新来的调用按 WFQ 只排在 b 的 1 个之后
+        assert queue.backlog("a") == 1
+        assert controller.estimate_wait("a") == 3.0
+        # b 自己再来一个要排在自己的 10 个之后
+        assert controller.estimate_wait("b") == 12.0
+        # 交互请求排在所有 bulk 之前
+        assert controller.estimate_wait("b", "interactive") == 2.0
+        for t in tasks:
+            t.cancel()
+
+    asyncio.run(run())
+
+
+def test_rejects_with_retry_after_when_wait_exceeds_limit():
+    queue = fair_queue.FairQueue(tenant_cap=1)
+    controller = admission.AdmissionController(max_queue=100, tenant_queue=100, max_wait=30,
+                                               rate=lambda: 60.0, queue=queue, next_free=lambda: 45.0)
+    try:
+        controller.enter("a")
+    except admission.Rejected as e:
+        assert e.retry_after == 15
+    else:
+        raise AssertionError("expected Rejected")
+    assert controller.snapshot()["rejected"] == 1
+
+
+def test_convert_chunk_returns_429(monkeypatch):
+    monkeypatch.setattr(server, "_admission", admission.AdmissionController(
+        max_queue=100, tenant_queue=100, max_wait=30, rate=lambda: 60.0,
+        queue=fair_queue.FairQueue(tenant_cap=1), next_free=lambda: 90.0))
+    monkeypatch.setattr(chunk_graph, "cached", lambda state: None)
+
+    response = TestClient(server.app).post("/api/convert_chunk", json={
+        "task_id": "session:0", "sql": "CREATE TABLE t (id INT);", "general_prompt": "p",
+        "source_format": "mysql", "destination_format": "hive"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "60"
+
+
+def test_convert_chunk_cache_hit_skips_admission(monkeypatch):
+    monkeypatch.setattr(server, "_admission", admission.AdmissionController(
+        max_queue=0, tenant_queue=0, max_wait=0, rate=lambda: 60.0,
+        queue=fair_queue.FairQueue(tenant_cap=1), next_free=lambda: 90.0))
+    monkeypatch.setattr(chunk_graph, "cached", lambda state: "CREATE TABLE t (id INTEGER);")
+
+    response = TestClient(server.app).post("/api/convert_chunk", json={
+        "task_id": "session:0", "sql": "CREATE TABLE t (id INT);", "general_prompt": "p",
+        "source_format": "mysql", "destination_format": "hive"})
+    assert response.status_code == 200
+    assert response.json()["sql"] == "CREATE TABLE t (id INTEGER);"
+    assert server._admission.snapshot()["rejected"] == 0
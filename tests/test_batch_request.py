@@ -0,0 +1,28 @@
+import json
+
+from method import chunk_method
+from states.main_state import ChunkResult, JobContext
+
+_JOB = JobContext(general_prompt="p", source_format="mysql", destination_format="hive")
+
+
+def test_request_body_uses_public_chat_completions_schema():
+    body = json.loads(json.dumps(chunk_method.chunk_request_body(_JOB, "CREATE TABLE t (id INT);")))
+    assert set(body) == {"model", "messages", "response_format"}
+    assert [m["role"] for m in body["messages"]] == ["system", "user"]
+    assert "CREATE TABLE t (id INT);" in body["messages"][1]["content"]
+    assert body["response_format"]["type"] == "json_schema"
+    assert body["response_format"]["json_schema"]["schema"] == ChunkResult.model_json_schema()
+
+
+def test_parse_chunk_response():
+    def completion(message):
+        return {"object": "chat.completion", "choices": [{"index": 0, "message": {"role": "assistant", **message}}]}
+
+    assert chunk_method.parse_chunk_response(completion({"content": '{"sql": "a"}'})).sql == "a"
+    assert chunk_method.parse_chunk_response(completion({"content": '```json\n{"sql": "b"}\n```'})).sql == "b"
+    tool_call = {"id": "1", "type": "function", "function": {"name": "ChunkResult", "arguments": '{"sql": "c"}'}}
+    assert chunk_method.parse_chunk_response(completion({"content": None, "tool_calls": [tool_call]})).sql == "c"
+    assert chunk_method.parse_chunk_response(completion({"content": "not json"})) is None
+    assert chunk_method.parse_chunk_response({"choices": []}) is None
+    assert chunk_method.parse_chunk_response(None) is None
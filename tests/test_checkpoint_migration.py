@@ -0,0 +1,100 @@
+import asyncio
+import sqlite3
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+import utils
+from graph import chunk_graph
+from states.main_state import ChunkState, JobContext
+from utils import checkpoint_migration, checkpointer_pool, job_store
+
+# job_id 引入之前的 ChunkState：共享参数直接存在 channel 里，thread_id 为 "<task_id>:<chunk sql>"
+_SQL = "CREATE TABLE t (id INT);"
+_OLD_VALUES = {
+    "task_id": f"task:{_SQL}",
+    "general_prompt": "p",
+    "source_format": "mysql",
+    "destination_format": "hive",
+    "destination_sql_language": "hive",
+    "target_schema": "",
+    "sql": "CREATE TABLE t (id INT)\n",
+    "exception": "",
+    "limiter": 2,
+}
+
+
+def _write_old_checkpoint(path: str) -> None:
+    saver = SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+    saver.setup()
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = dict(_OLD_VALUES)
+    checkpoint["channel_versions"] = {k: 1 for k in _OLD_VALUES}
+    saver.put({"configurable": {"thread_id": _OLD_VALUES["task_id"], "checkpoint_ns": ""}},
+              checkpoint, {"source": "loop", "step": 1}, {})
+    saver.conn.close()
+
+
+def test_old_chunk_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    _write_old_checkpoint(path)
+
+    async def run():
+        async with checkpointer_pool.lifespan(path=path):
+            graph = await chunk_graph.get_graph(await checkpointer_pool.get_checkpointer())
+            thread_id = utils.chunk_thread_id("task", _SQL)
+            snapshot = await checkpointer_pool.latest_snapshot(graph, {"configurable": {"thread_id": thread_id}})
+            return snapshot.values
+
+    values = asyncio.run(run())
+    # thread_id 和 channel 中的 task_id 改为定长哈希，并补上与 job_store.put 一致的 job_id
+    state = ChunkState.model_validate(values)
+    assert state.task_id == utils.chunk_thread_id("task", _SQL)
+    assert state.job_id == job_store.put(JobContext.model_validate(_OLD_VALUES))
+    assert state.sql == _OLD_VALUES["sql"]
+    assert state.limiter == 2
+
+    con = sqlite3.connect(path)
+    assert con.execute("PRAGMA user_version").fetchone()[0] == 2
+    con.close()
+
+
+def test_pinned_jobs_are_not_evicted(monkeypatch):
+    monkeypatch.setattr(job_store, "_MAX_JOBS", 2)
+    monkeypatch.setattr(job_store, "_JOBS", type(job_store._JOBS)())
+    running = JobContext(general_prompt="running", source_format="mysql", destination_format="hive")
+    with job_store.hold(running) as job_id:
+        for i in range(5):
+            job_store.put(JobContext(general_prompt=str(i), source_format="mysql", destination_format="hive"))
+        assert job_store.get(job_id) == running
+    job_store.put(JobContext(general_prompt="after", source_format="mysql", destination_format="hive"))
+    assert len(job_store._JOBS) == 2
+
+
+def test_chunk_thread_id_is_fixed_width():
+    small = utils.chunk_thread_id("task", _SQL)
+    large = utils.chunk_thread_id("task", _SQL * 10000)
+    assert len(small) == len(large) == 64 and ":" not in large
+    assert small != utils.chunk_thread_id("other", _SQL)
+
+
+def test_thread_id_migration_runs_once(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    _write_old_checkpoint(path)
+    checkpoint_migration.migrate_thread_ids(path)
+    checkpoint_migration.migrate_thread_ids(path)
+
+    con = sqlite3.connect(path)
+    assert con.execute("SELECT DISTINCT thread_id FROM checkpoints").fetchall() == \
+        [(utils.chunk_thread_id("task", _SQL),)]
+    assert con.execute("PRAGMA user_version").fetchone()[0] == checkpoint_migration.THREAD_ID_VERSION
+    con.close()
+
+    # 新库（还没有表）直接记为已迁移
+    fresh = str(tmp_path / "fresh.db")
+    sqlite3.connect(fresh).close()
+    checkpoint_migration.migrate_thread_ids(fresh)
+    con = sqlite3.connect(fresh)
+    assert con.execute("PRAGMA user_version").fetchone()[0] == checkpoint_migration.THREAD_ID_VERSION
+    con.close()
@@ -0,0 +1,48 @@
+import asyncio
+import operator
+from typing import Annotated
+
+from langgraph.constants import END, START
+from langgraph.graph import StateGraph
+from pydantic import BaseModel
+
+from utils import checkpointer_pool
+
+
+class _State(BaseModel):
+    steps: Annotated[int, operator.add] = 0
+
+
+def _graph(checkpointer, interrupt_before=None):
+    builder = StateGraph(_State)
+    builder.add_node("first", lambda s: {"steps": 1})
+    builder.add_node("second", lambda s: {"steps": 1})
+    builder.add_edge(START, "first")
+    builder.add_edge("first", "second")
+    builder.add_edge("second", END)
+    return builder.compile(checkpointer=checkpointer, interrupt_before=interrupt_before)
+
+
+def test_latest_snapshot_reads_newest_checkpoint(tmp_path):
+    config = {"configurable": {"thread_id": "t"}}
+
+    async def run():
+        async with checkpointer_pool.lifespan(path=str(tmp_path / "checkpoints.db")):
+            saver = await checkpointer_pool.get_checkpointer()
+            assert await checkpointer_pool.latest_snapshot(_graph(saver), config) is None
+
+            # 中断在 second 之前：未完成，next 非空
+            paused = _graph(saver, interrupt_before=["second"])
+            await paused.ainvoke(_State(), config=config)
+            snapshot = await checkpointer_pool.latest_snapshot(paused, config)
+            assert snapshot.next == ("second",) and snapshot.values["steps"] == 1
+
+            # 续跑完成：最新的 checkpoint 在多个历史 checkpoint 之后，next 为空
+            await paused.ainvoke(None, config=config)
+            snapshot = await checkpointer_pool.latest_snapshot(paused, config)
+            history = [c async for c in saver.alist(config)]
+            return snapshot, len(history)
+
+    snapshot, history = asyncio.run(run())
+    assert history > 1
+    assert snapshot.next == () and snapshot.values["steps"] == 2
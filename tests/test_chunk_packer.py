@@ -0,0 +1,45 @@
+import pytest
+
+from utils import chunk_packer
+
+_TABLES = [f"CREATE TABLE t{i} (id INT);" for i in range(5)]
+
+
+def _pack(chunks, **kwargs):
+    args = dict(max_items=3, input_budget=10_000, output_budget=10_000, estimate=len)
+    return chunk_packer.pack(chunks, **{**args, **kwargs})
+
+
+def test_pack_respects_merge_n_and_budgets():
+    assert _pack(_TABLES) == [_TABLES[:3], _TABLES[3:]]
+    # 每个 chunk 25 个字符：输入预算（含 overhead）只容得下两个
+    assert _pack(_TABLES, input_budget=60, overhead=10) == [_TABLES[:2], _TABLES[2:4], _TABLES[4:]]
+    assert _pack(_TABLES, output_budget=60, output_ratio=2.0) == [[t] for t in _TABLES]
+    assert _pack(_TABLES, max_items=1) == [[t] for t in _TABLES]
+
+
+def test_non_table_chunks_are_not_packed():
+    chunks = ["SET x = 1;", *_TABLES[:2], "CREATE TABLE a (id INT);\nCREATE TABLE b (id INT);", _TABLES[2]]
+    assert _pack(chunks) == [[chunks[0]], chunks[1:3], [chunks[3]], [chunks[4]]]
+
+
+def test_split_by_markers_round_trip():
+    output = "-- 说明\n" + chunk_packer.join([t.replace("INT", "BIGINT") for t in _TABLES[:3]])
+    parts = chunk_packer.split(output, 3)
+    assert parts == ["-- 说明\n" + _TABLES[0].replace("INT", "BIGINT") + "\n\n",
+                     _TABLES[1].replace("INT", "BIGINT") + "\n\n",
+                     _TABLES[2].replace("INT", "BIGINT") + "\n\n"]
+
+
+def test_split_without_markers_falls_back_to_create_table():
+    assert chunk_packer.split("SET x = 1;\n" + "\n".join(_TABLES[:2]), 2) == \
+        ["SET x = 1;\n" + _TABLES[0] + "\n\n", _TABLES[1] + "\n\n"]
+
+
+@pytest.mark.parametrize("output", [
+    chunk_packer.join(_TABLES[:2]),                              # 少了一张
+    chunk_packer.join(_TABLES[:3]).replace("@@table 2", "@@table 3"),  # 序号错乱
+    "\n".join(_TABLES[:2]),                                      # 无分隔行且数量不符
+])
+def test_split_rejects_unreliable_output(output):
+    assert chunk_packer.split(output, 3) is None
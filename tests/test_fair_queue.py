@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from utils import fair_queue, rate_limiter
+
+
+def test_failing_cost_does_not_stall_the_queue():
+    gate = fair_queue.FairQueue(tenant_cap=4)
+
+    def cost(payload):
+        if payload is None:
+            raise TypeError("cannot estimate")
+        return len(payload)
+
+    @rate_limiter.rate_limited(qpm=6000, mode="bucket", burst=10, tpm=10_000, cost=cost, gate=gate)
+    async def call(payload):
+        return payload
+
+    async def run():
+        with pytest.raises(TypeError):
+            await call(None)
+        # cost 抛错后 gate 仍能放行后续调用
+        return await asyncio.wait_for(call("ok"), timeout=1)
+
+    assert asyncio.run(run()) == "ok"
+
+
+def test_interactive_calls_overtake_queued_bulk_calls():
+    gate = fair_queue.FairQueue(tenant_cap=10)
+    order = []
+
+    @rate_limiter.rate_limited(qpm=600, mode="bucket", burst=1, gate=gate)
+    async def call(name):
+        order.append(name)
+
+    async def submit(name, priority):
+        with fair_queue.tenant(name, priority):
+            await call(name)
+
+    async def run():
+        tasks = [asyncio.create_task(submit(f"bulk{i}", "bulk")) for i in range(3)]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(submit("prompt", "interactive")))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    # bulk0 用掉突发额度，bulk1 已在等限流器预约；之后的第一个名额给后到的交互式调用
+    assert order == ["bulk0", "bulk1", "prompt", "bulk2"]
@@ -0,0 +1,57 @@
+import asyncio
+
+from utils import job_progress
+
+
+async def _events(job, start=0):
+    return [e async for e in job.events(start)]
+
+
+def test_job_writes_chunks_to_file_in_order(tmp_path):
+    async def run():
+        job = job_progress.JobProgress("j", str(tmp_path / "j.sql"))
+        job.start()
+        job.set_total(4)
+        for i in (2, 0, 3, 1, 1):
+            job.put(i, f"-- {i}\n")
+        job.finish("")
+        return job, await _events(job, start=1)
+
+    job, events = asyncio.run(run())
+    assert job.snapshot()["done"] == 4 and job.ready == 4
+    assert (tmp_path / "j.sql").read_text(encoding="utf-8") == "".join(f"-- {i}\n" for i in range(4))
+    chunks = [e["data"] for e in events if e["event"] == "chunk"]
+    assert chunks == [{"index": i, "sql": f"-- {i}\n"} for i in range(1, 4)]
+    assert events[-1]["event"] == "end"
+
+
+def test_failed_job_resumes_from_written_prefix(tmp_path):
+    path = str(tmp_path / "j.sql")
+
+    async def first():
+        job = job_progress.JobProgress("j", path, key="k")
+        job.put(0, "a;")
+        job.put(1, "b;")
+        job.put(3, "d;")
+        job.fail(RuntimeError("boom"))
+
+    async def second():
+        job = job_progress.JobProgress("j", path, key="k")
+        assert job.resume_from == 2
+        job.put(2, "c;")
+        job.put(3, "d;")
+        job.finish("")
+        return job.read(0, 4)
+
+    asyncio.run(first())
+    assert asyncio.run(second()) == ["a;", "b;", "c;", "d;"]
+
+
+def test_finished_checkpoint_result_is_written_once(tmp_path):
+    async def run():
+        job = job_progress.JobProgress("j", str(tmp_path / "j.sql"))
+        job.finish("CREATE TABLE t (id INT);")
+        return job
+
+    job = asyncio.run(run())
+    assert job.total == 1 and job.read(0, 1) == ["CREATE TABLE t (id INT);"]
@@ -0,0 +1,92 @@
+import pytest
+
+import CONFIG
+import llm_client
+from utils import adaptive_rate, rate_limiter
+from utils.limiter_backend import BucketSpec, MemoryLimiterBackend, SqliteLimiterBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryLimiterBackend()
+    return SqliteLimiterBackend(str(tmp_path / "limiter.db"))
+
+
+def test_burst_then_rate(backend):
+    spec = BucketSpec(rate=2.0, burst=3)
+    waits = [backend.take("k", spec, 0) for _ in range(6)]
+    # 前 burst 个立即放行，之后每个请求多等 1 / rate 秒
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3:] == pytest.approx([0.5, 1.0, 1.5], abs=0.05)
+    assert backend.next_free("k", spec) == pytest.approx(2.0, abs=0.05)
+
+
+def test_token_budget_and_refund(backend):
+    spec = BucketSpec(rate=100.0, burst=100, token_rate=10.0, token_capacity=100)
+    assert backend.take("k", spec, 100) == 0.0
+    # token 用完：下一次按 token 回填速率等待
+    assert backend.take("k", spec, 50) == pytest.approx(5.0, abs=0.05)
+    backend.refund("k", spec, 150)
+    assert backend.take("k", spec, 50) == 0.0
+
+
+def test_refunded_request_is_reusable(backend):
+    spec = BucketSpec(rate=1.0, burst=1)
+    assert backend.take("k", spec, 0) == 0.0
+    backend.refund("k", spec, 0, 1)
+    assert backend.take("k", spec, 0) == 0.0
+
+
+def test_adaptive_rate_is_shared_across_processes(tmp_path):
+    path = str(tmp_path / "limiter.db")
+    # 两个 backend 实例模拟两个进程
+    a, b = SqliteLimiterBackend(path), SqliteLimiterBackend(path)
+    limiter_a = rate_limiter._TokenBucketLimiter(qpm=600, burst=1, backend=a, key="llm")
+    limiter_b = rate_limiter._TokenBucketLimiter(qpm=600, burst=1, backend=b, key="llm")
+
+    # 进程 A 收到 429 后降速到 60 rpm，进程 B 的 limiter 没有被通知
+    limiter_a.set_rate(60)
+    assert b.take("llm", limiter_b.spec, 0) == 0.0
+    assert b.take("llm", limiter_b.spec, 0) == pytest.approx(1.0, abs=0.05)
+
+    # 初始速率的 set_rate（attach）不覆盖共享速率
+    limiter_b.set_rate(600)
+    assert b.take("llm", limiter_b.spec, 0) == pytest.approx(2.0, abs=0.05)
+
+
+def test_lowered_rate_recovers_after_restart(tmp_path):
+    path = str(tmp_path / "limiter.db")
+
+    def start_process():
+        limiter = rate_limiter._TokenBucketLimiter(qpm=60, backend=SqliteLimiterBackend(path), key="llm")
+        controller = adaptive_rate.AdaptiveRateController(max_rpm=60, step_rpm=1, success_window=10)
+        controller.attach(limiter)
+        return controller, limiter
+
+    # peer 在降速之前启动，自己记录的 rpm 一直是 max_rpm
+    peer, _ = start_process()
+    # 进程 A 被限流降到 20 rpm 后退出
+    controller, limiter = start_process()
+    controller._set_rpm(20)
+    shared = lambda: limiter.backend.get_rate("llm") * 60
+
+    # 重启后的进程从共享的 20 rpm 开始，成功调用照常逐步提速并写回共享速率
+    controller, limiter = start_process()
+    assert controller.rpm == pytest.approx(20) and shared() == pytest.approx(20)
+    for _ in range(100):
+        controller.on_success()
+    assert controller.rpm == pytest.approx(30) and shared() == pytest.approx(30)
+
+    # 以为自己在 max_rpm 的 peer 也采用共享速率并提速，而不是让共享速率停在被降低的值
+    assert peer.rpm == 60
+    for _ in range(10):
+        peer.on_success()
+    assert peer.rpm == pytest.approx(31) and shared() == pytest.approx(31)
+
+
+def test_default_llm_limiter_stays_within_rpm():
+    limiter = llm_client.get_limiter()
+    # 默认严格等间隔：不允许突发，任意一分钟内不超过 LLM_RPM
+    assert isinstance(limiter, rate_limiter._ExclusiveRateLimiter)
+    assert limiter.interval == pytest.approx(60.0 / CONFIG.LLM_RPM)
@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+
+from method import main_method
+from webapp import server
+
+
+def test_normalize_prompt_ignores_client_source_path(monkeypatch, tmp_path):
+    secret = tmp_path / "secret.txt"
+    secret.write_text("TOP-SECRET", encoding="utf-8")
+    samples = []
+
+    async def fake_llm(state, source_sample):
+        samples.append(source_sample)
+        return "normalized"
+
+    monkeypatch.setattr(main_method, "_llm_normalize", fake_llm)
+    monkeypatch.setattr(main_method, "get_prompt_cache", lambda: None)
+
+    resp = TestClient(server.app).post("/api/normalize_prompt", json={
+        "task_id": "s1", "general_prompt": "p", "source_format": "gbase8c", "destination_format": "gbasehd",
+        "source_sql": "", "source_path": str(secret),
+    })
+
+    assert resp.status_code == 200
+    assert resp.json()["general_prompt"] == "normalized"
+    assert "source_path" not in resp.json()
+    assert samples == [""]
@@ -0,0 +1,67 @@
+from utils.ordered_writer import OrderedFileWriter
+
+# 不自动提交：只有显式 commit/close 才更新进度文件
+_NEVER = 1e12
+
+
+def test_out_of_order_results_are_written_in_order_and_spilled(tmp_path):
+    path = str(tmp_path / "out.sql")
+    w = OrderedFileWriter(path, key="k", max_buffer=4, commit_interval=_NEVER, index=True)
+    w.set_total(5)
+    for i in (3, 1, 4, 2, 0):
+        assert w.put(i, f"s{i};")
+    # 重复上报被忽略
+    assert not w.put(2, "dup;")
+    assert w.spilled > 0 and w.complete
+    assert w.read(1, 4) == ["s1;", "s2;", "s3;"]
+    w.close()
+    assert (tmp_path / "out.sql").read_text(encoding="utf-8") == "s0;s1;s2;s3;s4;"
+    assert not (tmp_path / "out.sql.spill").exists()
+
+
+def test_reopen_truncates_uncommitted_tail_and_resumes(tmp_path):
+    path = str(tmp_path / "out.sql")
+    w = OrderedFileWriter(path, key="k", commit_interval=_NEVER, index=True)
+    w.put(0, "a;")
+    w.put(1, "b;")
+    w.commit()
+    w.put(2, "c;")
+    # 模拟崩溃：c; 已到达文件但进度没有提交
+    w._file.flush()
+    w._index.flush()
+    assert (tmp_path / "out.sql").read_text(encoding="utf-8") == "a;b;c;"
+
+    again = OrderedFileWriter(path, key="k", commit_interval=_NEVER, index=True)
+    assert again.resume_from == 2
+    assert (tmp_path / "out.sql").read_text(encoding="utf-8") == "a;b;"
+    assert again.read(0, 2) == ["a;", "b;"]
+    again.put(2, "c;")
+    again.close()
+    w._file.close()
+    w._index.close()
+    assert (tmp_path / "out.sql").read_text(encoding="utf-8") == "a;b;c;"
+
+
+def test_progress_is_discarded_for_other_key_or_truncated_output(tmp_path):
+    path = str(tmp_path / "out.sql")
+    w = OrderedFileWriter(path, key="k", commit_interval=_NEVER)
+    w.put(0, "a;")
+    w.put(1, "b;")
+    w.close()
+
+    # 另一个任务的进度记录不能复用
+    other = OrderedFileWriter(path, key="other", commit_interval=_NEVER)
+    assert other.resume_from == 0
+    assert (tmp_path / "out.sql").read_bytes() == b""
+    other.close()
+
+    w = OrderedFileWriter(path, key="k", commit_interval=_NEVER)
+    w.put(0, "a;")
+    w.put(1, "b;")
+    w.close()
+    # 输出文件被截短：进度作废，从头写
+    with open(path, "r+b") as f:
+        f.truncate(1)
+    again = OrderedFileWriter(path, key="k", commit_interval=_NEVER)
+    assert again.resume_from == 0
+    again.close()
@@ -0,0 +1,59 @@
+import asyncio
+
+from langchain_core.messages import AIMessage
+
+from method import chunk_method
+from states.main_state import JobContext
+from utils import prefix_cache
+
+
+def _message(prompt_tokens, cached_tokens):
+    return AIMessage("", usage_metadata={"input_tokens": prompt_tokens, "output_tokens": 1,
+                                         "total_tokens": prompt_tokens + 1,
+                                         "input_token_details": {"cache_read": cached_tokens}})
+
+
+def test_chunk_messages_share_a_byte_stable_prefix():
+    job = JobContext(general_prompt="p", source_format="gbase8c", destination_format="gbasehd")
+    first = chunk_method.chunk_messages(job, "CREATE TABLE a (id INT);")
+    second = chunk_method.chunk_messages(job, "CREATE TABLE b (id INT);", exception="boom")
+    assert first[0].content == second[0].content
+    assert "CREATE TABLE" not in first[0].content
+    assert "CREATE TABLE b" in second[1].content and "boom" in second[1].content
+
+
+def test_usage_is_recorded_per_tracked_job():
+    registry = prefix_cache.PrefixCacheRegistry()
+
+    async def call(job_id, prompt_tokens, cached_tokens, seconds):
+        with prefix_cache.tracking(registry.get(job_id)):
+            await asyncio.sleep(0)
+            prefix_cache.record(_message(prompt_tokens, cached_tokens), seconds)
+
+    async def run():
+        await asyncio.gather(call("a", 100, 0, 2.0), call("a", 100, 80, 0.5), call("b", 50, 0, 1.0))
+
+    asyncio.run(run())
+    # 不在 tracking 块内的调用不计入
+    prefix_cache.record(_message(10, 10), 1.0)
+
+    a = registry.get("a")
+    assert (a.calls, a.hits, a.prompt_tokens, a.cached_tokens) == (2, 1, 200, 80)
+    assert a.hit_ratio == 0.4
+    assert a.saved_seconds == 1.5
+    assert registry.get("b").snapshot()["hit_ratio"] == 0.0
+    assert registry.snapshot()["calls"] == 3
+    assert registry.combined(["a", "a", "missing"]).calls == 2
+
+
+def test_usage_without_metadata_and_registry_eviction():
+    assert prefix_cache.usage(AIMessage("")) == (0, 0)
+    assert prefix_cache.usage(object()) == (0, 0)
+
+    registry = prefix_cache.PrefixCacheRegistry(max_jobs=2)
+    registry.get("a").add(10, 0, 1.0)
+    registry.get("b")
+    registry.get("a")   # 最近使用过的保留
+    registry.get("c")
+    assert registry.combined(["a", "b", "c"]).calls == 1   # b 已被淘汰
+    assert registry.get("a").calls == 1
@@ -0,0 +1,67 @@
+import asyncio
+
+import CONFIG
+from method import main_method
+from states.main_state import MainState
+from utils import translation_cache
+
+
+def _state(**kwargs):
+    fields = dict(task_id="t", general_prompt="p", source_format="gbase8c", destination_format="gbasehd",
+                  source_sql="CREATE TABLE a (id INT);")
+    fields.update(kwargs)
+    return MainState(**fields)
+
+
+def _patch(monkeypatch, tmp_path, calls):
+    async def fake_llm(state, source_sample):
+        calls.append(state.general_prompt)
+        await asyncio.sleep(0.01)
+        return f"normalized:{state.general_prompt}:{state.target_schema}"
+
+    cache = translation_cache.TranslationCache(str(tmp_path / "prompt.db"), max_entries=10, ttl=0)
+    monkeypatch.setattr(main_method, "_llm_normalize", fake_llm)
+    monkeypatch.setattr(main_method, "get_prompt_cache", lambda: cache)
+    monkeypatch.setattr(main_method, "prompt_stats", main_method.PromptStats())
+
+
+def test_concurrent_normalizations_share_one_call_and_are_cached(monkeypatch, tmp_path):
+    calls = []
+    _patch(monkeypatch, tmp_path, calls)
+
+    async def run():
+        first = await asyncio.gather(*(main_method.normalize_prompt(_state()) for _ in range(3)))
+        again = await main_method.normalize_prompt(_state())
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert first == ["normalized:p:"] * 3 and again == "normalized:p:"
+    assert calls == ["p"]
+    assert main_method.prompt_stats.llm_calls == 1 and main_method.prompt_stats.cache_hits == 1
+    assert main_method.cached_prompt(_state()) == "normalized:p:"
+
+
+def test_prompt_key_covers_job_parameters(monkeypatch, tmp_path):
+    calls = []
+    _patch(monkeypatch, tmp_path, calls)
+    asyncio.run(main_method.normalize_prompt(_state()))
+    # 任一参数变化都不能命中旧条目
+    for change in ({"target_schema": "ods"}, {"merge_n": 2}, {"destination_example": "x"},
+                   {"source_sql": "CREATE TABLE b (id INT);"}, {"general_prompt": "q"}):
+        assert main_method.cached_prompt(_state(**change)) is None
+    monkeypatch.setattr(CONFIG, "LLM_TYPE", CONFIG.LLM_TYPE + "-other")
+    assert main_method.cached_prompt(_state()) is None
+    assert calls == ["p"]
+
+
+def test_speculative_mode_does_not_wait_for_normalization(monkeypatch, tmp_path):
+    calls = []
+    _patch(monkeypatch, tmp_path, calls)
+    monkeypatch.setattr(CONFIG, "PROMPT_SPECULATIVE", True)
+    # 未命中缓存：不调用 LLM，保留原始提示词
+    assert asyncio.run(main_method.prompt_normalize(_state(task_id="spec"))) == {}
+    assert calls == []
+
+    asyncio.run(main_method.normalize_prompt(_state()))
+    assert asyncio.run(main_method.prompt_normalize(_state(task_id="spec"))) == {
+        "general_prompt": "normalized:p:", "prompt_normalized": True}
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from utils import rate_limiter, retry_policy
+
+
+class _HTTPError(Exception):
+    def __init__(self, code: int, headers=None):
+        super().__init__(f"HTTP {code}")
+        self.status_code = code
+        self.response = httpx.Response(code, headers=headers or {})
+
+
+@pytest.mark.parametrize("error, refund", [
+    (_HTTPError(429), True),
+    (_HTTPError(429, {"Retry-After": "3"}), False),
+    (_HTTPError(429, {"x-ratelimit-remaining-requests": "0"}), False),
+    (_HTTPError(500), False),
+])
+def test_not_counted(error, refund):
+    assert retry_policy.not_counted(error) is refund
+
+
+def test_throttled_calls_keep_their_token_without_refund():
+    async def run(refund):
+        @rate_limiter.rate_limited(qpm=60, mode="bucket", burst=1, refund=refund)
+        async def call():
+            raise _HTTPError(429)
+
+        with pytest.raises(_HTTPError):
+            await call()
+        return call.limiter.next_free()
+
+    # 默认不退还：被拒的请求仍占着名额，下一次要等约 1 秒
+    assert asyncio.run(run(None)) == pytest.approx(1.0, abs=0.05)
+    assert asyncio.run(run(retry_policy.not_counted)) == 0.0
+
+
+def _wrapped(error: BaseException) -> BaseException:
+    request = httpx.Request("POST", "http://llm/v1/chat/completions")
+    wrapper = openai.APIConnectionError(request=request)
+    wrapper.__cause__ = error
+    return wrapper
+
+
+@pytest.mark.parametrize("error, sent", [
+    (httpx.ConnectError("refused"), False),
+    (_wrapped(httpx.ConnectTimeout("timeout")), False),
+    # 读超时：请求可能已经被服务端处理并计费
+    (_wrapped(httpx.ReadTimeout("timeout")), True),
+    (_HTTPError(500), True),
+])
+def test_connect_failures_are_refunded(error, sent):
+    assert retry_policy.not_sent(error) is not sent
+    assert retry_policy.not_counted(error) is not sent
+
+
+def test_strict_limiter_refunds_calls_that_never_left():
+    async def run():
+        attempts = []
+
+        @rate_limiter.rate_limited(qpm=60, refund=retry_policy.not_sent)
+        async def call():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise httpx.ConnectError("refused")
+
+        async def refused():
+            with pytest.raises(httpx.ConnectError):
+                await call()
+
+        await asyncio.gather(refused(), call())
+        return attempts
+
+    attempts = asyncio.run(run())
+    # 第一次连接失败退还名额：排在后面的调用不必再等一个完整间隔（1 秒）
+    assert attempts[1] - attempts[0] < 0.5
+
+
+def test_strict_limiter_keeps_spacing_after_later_release():
+    async def run():
+        limiter = rate_limiter._ExclusiveRateLimiter(qpm=60, fifo=False)
+        first = await limiter.acquire()
+        second = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.05)
+        # 第一次放行之后已有调用在排队而非放行：可以退还
+        await limiter.cancel(first)
+        released = await second
+        # 第二次已放行：再退还第一次的名额不能让下一次提前到间隔之内
+        await limiter.cancel(first)
+        return released - first, limiter.next_free()
+
+    gap, next_free = asyncio.run(run())
+    assert gap < 0.2
+    assert next_free == pytest.approx(1.0, abs=0.1)
+
@@ -0,0 +1,46 @@
+import pytest
+
+from utils import rule_translate, validate_sql
+
+_RULES = rule_translate.RuleSet(
+    type_map={"INT": "", "VARCHAR": "STRING"},
+    extra_columns=[("col_batch", "STRING", "批次")],
+    table_suffix="STORED AS ORC",
+)
+
+
+def _translate(sql, rules=_RULES, **kwargs):
+    return rule_translate.translate(sql, rules, source_dialect="postgres", destination_dialect="hive", **kwargs)
+
+
+def test_translates_table_with_comments_and_template():
+    sql = ("CREATE TABLE public.orders (id INT, note VARCHAR(10)) TABLESPACE fast;\n"
+           "COMMENT ON TABLE public.orders IS '订单';\n"
+           "COMMENT ON COLUMN public.orders.note IS 'it''s a note';\n"
+           "CREATE INDEX orders_id ON public.orders (id);")
+    out = _translate(sql, target_schema="ods")
+    assert out == ("CREATE TABLE ods.orders (\n"
+                   "    id INT,\n"
+                   "    note STRING COMMENT 'it\\'s a note',\n"
+                   "    col_batch STRING COMMENT '批次'\n"
+                   ")\n"
+                   "COMMENT '订单'\n"
+                   "STORED AS ORC;\n\n")
+    assert not validate_sql(out, "hive")
+
+
+@pytest.mark.parametrize("sql", [
+    "CREATE TABLE t (payload JSONB);",                 # 类型不在映射中
+    "CREATE TABLE t AS SELECT 1 AS id;",               # CTAS
+    "CREATE VIEW v AS SELECT 1;",                      # 非建表语句
+    "COMMENT ON TABLE other IS 'x';",                  # 指向 chunk 外的表
+])
+def test_unsupported_chunks_go_to_llm(sql):
+    with pytest.raises(rule_translate.Unsupported):
+        _translate(sql)
+
+
+def test_required_comments():
+    rules = rule_translate.RuleSet(type_map={"INT": ""}, require_column_comment=True)
+    with pytest.raises(rule_translate.Unsupported, match="缺少注释"):
+        _translate("CREATE TABLE t (id INT);", rules)
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pytest
+
+from utils import ChunkScheduler
+
+
+def test_results_keep_input_order_within_concurrency():
+    running = 0
+    peak = 0
+
+    async def work(n):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001 * (n % 3))
+        running -= 1
+        return n * 2
+
+    scheduler = ChunkScheduler(work, concurrency=3, policy="largest_first", size_of=lambda n: n)
+    assert asyncio.run(scheduler.run(iter(range(20)))) == [n * 2 for n in range(20)]
+    assert peak <= 3 and scheduler.stats.done == 20 and scheduler.stats.queued == 0
+
+
+def test_slow_source_does_not_block_event_loop():
+    def source():
+        for i in range(3):
+            # 模拟大文件上的同步读取和切分
+            time.sleep(0.05)
+            yield i
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        result = await ChunkScheduler(lambda n: asyncio.sleep(0, n), concurrency=2, size_of=lambda n: 0).run(source())
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(run())
+    assert result == [0, 1, 2]
+    # 生成器在线程里执行：0.15 秒里事件循环仍在调度其他协程
+    assert ticks >= 10
+
+
+def test_failed_chunk_is_requeued_then_raises():
+    calls = []
+
+    async def work(n):
+        calls.append(n)
+        if n == 1:
+            raise RuntimeError("boom")
+        return n
+
+    scheduler = ChunkScheduler(work, concurrency=1, policy="retry_first", max_attempts=2,
+                               size_of=lambda n: 0)
+    with pytest.raises(RuntimeError):
+        asyncio.run(scheduler.run([0, 1, 2, 3]))
+    # 第一次失败后重排：retry_first 让它排在尚未执行的 chunk 之前
+    assert calls[:3] == [0, 1, 1]
+    assert scheduler.stats.requeued == 1 and scheduler.stats.failed == 1
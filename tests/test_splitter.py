@@ -0,0 +1,67 @@
+import io
+
+import pytest
+
+from utils import iter_split_sql, split_sql
+from utils.ddl_splitter import iter_split_ddl_file, split_ddl
+
+# 附属语句紧跟所属表、没有引号内分号：split_ddl 与 split_sql 应当切出相同的 chunk
+_TABLES = (
+    "CREATE TABLE a{0} (id INT);\n"
+    "COMMENT ON TABLE a{0} IS 'x';\n"
+    "CREATE INDEX ia{0} ON a{0} (id);\n"
+    "\n"
+    "create   table b{0} (id int, name text);\n"
+    "ALTER TABLE b{0} ADD PRIMARY KEY (id);\n"
+    "CREATE\n\tTABLE c{0} (v VARCHAR(10));\n"
+)
+_DDL = "SET search_path = public;\n" + _TABLES.format(0)
+_LARGE = "SET search_path = public;\n" + "".join(_TABLES.format(i) for i in range(50))
+_CASES = {
+    "ddl": _DDL,
+    "large": _LARGE,
+    "crlf": _DDL.replace("\n", "\r\n"),
+    "single": "CREATE TABLE only_one (id INT)",
+    "no_table": "-- 没有建表语句\nSET x = 1;",
+    "empty": "",
+}
+
+
+@pytest.mark.parametrize("sql", _CASES.values(), ids=_CASES.keys())
+@pytest.mark.parametrize("block_size", [1, 7, 64, 1 << 20])
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_iter_split_sql_matches_split_sql(tmp_path, sql, block_size, use_mmap):
+    path = tmp_path / "in.sql"
+    path.write_bytes(sql.encode("utf-8"))
+    expected = split_sql(path.read_text(encoding="utf-8"))
+    assert list(iter_split_sql(str(path), block_size=block_size, use_mmap=use_mmap)) == expected
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 64])
+def test_iter_split_sql_matches_split_sql_on_streams(block_size):
+    sql = _LARGE
+    assert list(iter_split_sql(io.StringIO(sql), block_size=block_size)) == split_sql(sql)
+    assert list(iter_split_sql(io.BytesIO(sql.encode("utf-8")), block_size=block_size)) == split_sql(sql)
+
+
+@pytest.mark.parametrize("sql", [_DDL, _LARGE], ids=["ddl", "large"])
+def test_split_ddl_matches_split_sql(tmp_path, sql):
+    assert split_ddl(sql) == split_sql(sql)
+    path = tmp_path / "in.sql"
+    path.write_bytes(sql.encode("utf-8"))
+    assert list(iter_split_ddl_file(str(path))) == split_sql(sql)
+
+
+def test_split_ddl_differs_only_where_lexing_matters():
+    quoted = "CREATE TABLE a (note TEXT DEFAULT 'x; create table fake');\nCREATE TABLE b (id INT);"
+    # split_sql 会在字符串里的 ';' 处切开；split_ddl 不会
+    assert len(split_sql(quoted)) == 3
+    assert split_ddl(quoted) == ["CREATE TABLE a (note TEXT DEFAULT 'x; create table fake');",
+                                 "CREATE TABLE b (id INT);"]
+
+    late_index = "CREATE TABLE a (id INT);\nCREATE TABLE b (id INT);\nCREATE INDEX ia ON a (id);"
+    # 后出现的索引并入所属表；两种切法覆盖的语句相同
+    assert split_ddl(late_index) == ["CREATE TABLE a (id INT);\nCREATE INDEX ia ON a (id);",
+                                     "CREATE TABLE b (id INT);"]
+    statements = lambda chunks: sorted("\n".join(chunks).splitlines())
+    assert statements(split_ddl(late_index)) == statements(split_sql(late_index))
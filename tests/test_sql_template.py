@@ -0,0 +1,45 @@
+import asyncio
+
+from utils import sql_template
+
+_ORDERS = "CREATE TABLE orders (id INT, orders_note VARCHAR(10));"
+_ORDERS_TMP = "create table ORDERS_tmp (id INT, ORDERS_tmp_note VARCHAR(10));"
+
+
+def test_tables_differing_only_by_name_share_a_structure():
+    a = sql_template.structure_of(_ORDERS, "mysql")
+    b = sql_template.structure_of(_ORDERS_TMP, "mysql")
+    assert a.key == b.key and a.tables == ("orders",) and b.tables == ("orders_tmp",)
+    assert sql_template.structure_of("CREATE TABLE orders (id BIGINT);", "mysql").key != a.key
+    assert sql_template.structure_of("SELECT 1;", "mysql") is None
+
+
+def test_instantiate_renames_tables_in_translation():
+    a = sql_template.structure_of(_ORDERS, "mysql")
+    b = sql_template.structure_of(_ORDERS_TMP, "mysql")
+    translated = "CREATE TABLE ods.orders (id INT, orders_note STRING);"
+    assert sql_template.instantiate(translated, a, b, "hive") == \
+        "CREATE TABLE ods.orders_tmp (id INT, orders_tmp_note STRING);"
+
+
+def test_members_are_checked_against_their_own_source():
+    checked = []
+
+    async def validate(source, sql):
+        checked.append((source, sql))
+        return "结构不一致" if "reject" in source else ""
+
+    async def translate(sql):
+        await asyncio.sleep(0)
+        return sql.replace("VARCHAR(10)", "STRING")
+
+    async def run():
+        reuse = sql_template.TemplateReuse("mysql", "hive", validate=validate)
+        sources = [_ORDERS, _ORDERS_TMP, _ORDERS.replace("orders", "reject")]
+        return reuse, await asyncio.gather(*(reuse.run(s, translate) for s in sources))
+
+    reuse, results = asyncio.run(run())
+    assert results[1] == "CREATE TABLE orders_tmp (id INT, orders_tmp_note STRING);"
+    # 校验拿到的是成员自己的源 chunk；被拒绝的成员回退到 translate
+    assert [source for source, _ in checked] == [_ORDERS_TMP, _ORDERS.replace("orders", "reject")]
+    assert reuse.representatives == 1 and reuse.fast_path == 1 and reuse.fallback == 1
@@ -0,0 +1,25 @@
+from utils import statement_repair
+
+_SQL = ("-- 订单表\n"
+        "CREATE TABLE a (id INT, note STRING COMMENT 'x;y');\n\n"
+        "CREATE TABLE b (id INT) PARTITIONED;\n"
+        "COMMENT ON TABLE a IS 'z';\n")
+
+
+def test_split_statements_is_lossless():
+    statements = statement_repair.split_statements(_SQL, "hive")
+    assert len(statements) == 3
+    assert "".join(statements) == _SQL
+    assert statement_repair.split_statements("CREATE TABLE t (note STRING COMMENT 'open", "hive") is None
+
+
+def test_find_broken_reports_only_failing_statements():
+    statements = statement_repair.split_statements(_SQL, "hive")
+    assert list(statement_repair.find_broken(statements, "hive")) == [1]
+
+
+def test_splice_keeps_layout_around_repaired_statement():
+    statements = statement_repair.split_statements(_SQL, "hive")
+    out = statement_repair.splice(statements, {1: "  CREATE TABLE b (id INT)\n"})
+    assert out == _SQL.replace("CREATE TABLE b (id INT) PARTITIONED;", "CREATE TABLE b (id INT);")
+    assert statement_repair.splice(statements, {}) == _SQL
@@ -0,0 +1,57 @@
+from utils import rule_translate, structure_check
+
+_RULES = rule_translate.RuleSet(
+    type_map={"INT": "", "VARCHAR": "STRING"},
+    extra_columns=[("col_batch", "STRING", "批次")],
+    table_suffix="STORED AS ORC",
+)
+_SOURCE = ("CREATE TABLE public.a (id INT, name VARCHAR(10)) TABLESPACE fast;\n"
+           "CREATE TABLE public.b (v INT);")
+
+
+def _check(output, rules=_RULES, target_schema="ods"):
+    return structure_check.check(_SOURCE, output, source_dialect="postgres", destination_dialect="hive",
+                                 rules=rules, target_schema=target_schema)
+
+
+def test_faithful_translation_passes():
+    out = ("CREATE TABLE ods.a (id INT, name STRING, col_batch STRING) STORED AS ORC;\n"
+           "CREATE TABLE ods.b (v INT, col_batch STRING) STORED AS ORC;")
+    assert _check(out) == []
+
+
+def test_reports_each_structural_mismatch():
+    out = ("CREATE TABLE ods.b (v INT, col_batch STRING) STORED AS ORC;\n"
+           "CREATE TABLE dw.a (name VARCHAR(10), id INT, extra INT);")
+    issues = _check(out)
+    assert "表顺序与源 SQL 不一致，应为：a, b" in issues
+    assert "表 a 的库名应为 ods，实际为 dw" in issues
+    assert "表 a 多出源表中不存在的字段：extra" in issues
+    assert "表 a 缺少模板字段：col_batch" in issues
+    assert "表 a 字段顺序与源表不一致：第 1 个字段应为 id，实际为 name" in issues
+    assert "表 a 字段 name 类型应为 STRING（源类型 VARCHAR(10)），实际为 VARCHAR(10)" in issues
+    assert "表 a 缺少模板子句：STORED AS ORC" in issues
+    # 表 b 完全符合，不应出现在问题里
+    assert not [i for i in issues if i.startswith("表 b")]
+
+
+def test_missing_and_unexpected_tables():
+    issues = _check("CREATE TABLE ods.a (id INT, name STRING, col_batch STRING) STORED AS ORC;\n"
+                    "CREATE TABLE ods.c (v INT, col_batch STRING) STORED AS ORC;")
+    assert issues == ["缺少表：b", "多出源 SQL 中不存在的表：c"]
+
+
+def test_compare_accepts_parsed_output_and_skips_unparseable_source():
+    out = structure_check.parse_tables("CREATE TABLE a (id INT);", "hive")
+    issues = structure_check.compare(_SOURCE, out, source_dialect="postgres", destination_dialect="hive")
+    assert issues == ["缺少表：b", "表 a 缺少字段：name"]
+    # 源 SQL 无法解析或不含建表语句时不比较
+    assert structure_check.compare("CREATE TABLE (", out, source_dialect="postgres", destination_dialect="hive") == []
+    assert structure_check.compare("SET x = 1;", out, source_dialect="postgres", destination_dialect="hive") == []
+
+
+def test_describe_prefixes_and_caps_issues():
+    text = structure_check.describe([f"问题{i}" for i in range(structure_check.MAX_ISSUES + 5)])
+    assert text.startswith(structure_check.PREFIX)
+    assert text.count("\n- 问题") == structure_check.MAX_ISSUES
+    assert text.endswith(f"共 {structure_check.MAX_ISSUES + 5} 处")
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from graph import chunk_graph
+from states.main_state import ChunkState, JobContext
+from utils import job_store, translation_cache
+
+_KEY_ARGS = dict(source_dialect="mysql", prompt="p", destination_format="hive", destination_dialect="hive",
+                 target_schema="", model="m")
+
+
+def test_key_ignores_layout_but_not_job_parameters():
+    key = translation_cache.cache_key("CREATE TABLE t (id INT)", **_KEY_ARGS)
+    assert key == translation_cache.cache_key("create  table t(\n  id int\n)", **_KEY_ARGS)
+    assert key != translation_cache.cache_key("CREATE TABLE t (id BIGINT)", **_KEY_ARGS)
+    assert key != translation_cache.cache_key("CREATE TABLE t (id INT)", **{**_KEY_ARGS, "target_schema": "ods"})
+    assert key != translation_cache.cache_key("CREATE TABLE t (id INT)", **{**_KEY_ARGS, "model": "other"})
+
+
+def test_lru_and_ttl_eviction(tmp_path, monkeypatch):
+    cache = translation_cache.TranslationCache(str(tmp_path / "cache.db"), max_entries=10, ttl=60)
+    for i in range(11):
+        cache.put(str(i), f"sql {i}")
+        cache.get("0")
+    # 超出上限时删掉最久未访问的（"0" 一直在被读取）
+    assert cache.get("0") == "sql 0" and cache.get("1") is None
+    assert cache.stats.evictions == 2
+
+    now = translation_cache.time.time()
+    monkeypatch.setattr(translation_cache.time, "time", lambda: now + 61)
+    assert cache.get("0") is None
+
+
+@pytest.mark.parametrize("final, cached", [
+    ({"sql": "ok;", "exception": "", "limiter": 1, "route": "llm"}, True),
+    ({"sql": "ok;", "exception": "", "limiter": 0, "route": "rules"}, True),
+    # 重试耗尽：最后一次输出没有通过（或没有经过）校验
+    ({"sql": "bad;", "exception": "ParseError", "limiter": 0, "route": "llm"}, False),
+    ({"sql": "unchecked;", "exception": "", "limiter": 0, "route": "llm"}, False),
+])
+def test_only_accepted_results_are_cached(tmp_path, monkeypatch, final, cached):
+    cache = translation_cache.TranslationCache(str(tmp_path / "cache.db"), max_entries=10, ttl=0)
+    monkeypatch.setattr(chunk_graph, "_translation_cache", cache)
+
+    async def run_graph(state, checkpointer=None):
+        return final
+
+    monkeypatch.setattr(chunk_graph, "_run_graph", run_graph)
+    job_id = job_store.put(JobContext(general_prompt="p", source_format="mysql", destination_format="hive",
+                                      destination_sql_language="hive"))
+    state = ChunkState(task_id="t", job_id=job_id, sql="CREATE TABLE t (id INT);")
+
+    assert asyncio.run(chunk_graph.start_or_resume(state)) == final["sql"]
+    assert (chunk_graph.cached(state) is not None) is cached
@@ -0,0 +1,32 @@
+import asyncio
+import multiprocessing
+
+from utils import validation_pool
+
+
+def test_zero_workers_runs_inline():
+    validator = validation_pool.ValidationExecutor(mode="process", workers=0)
+    assert validator.mode == "inline"
+
+    async def run():
+        await validator.start()
+        return await validator.validate("CREATE TABLE t (id INT)", "hive")
+
+    assert asyncio.run(run()) == ""
+    assert validator._executor is None
+
+
+def test_start_warms_workers_and_close_reaps_them():
+    validator = validation_pool.ValidationExecutor(mode="process", workers=2)
+
+    async def run():
+        await validator.start()
+        started = len(multiprocessing.active_children())
+        error = await validator.validate("CREATE TABLE t (id INT", "hive")
+        return started, error
+
+    started, error = asyncio.run(run())
+    assert started == 2
+    assert error
+    validator.close()
+    assert multiprocessing.active_children() == []
@@ -10,7 +10,9 @@ from typing import List, Any
 import sqlglot
 
 from .rate_limiter import rate_limited
+from .scheduler import ChunkScheduler
 from .singleflight import singleflight
+from .stream_split import iter_split_sql, text_digest
 # from .checkpointer_pool import lifespan,get_checkpointer
 
 
@@ -57,6 +59,13 @@ def split_sql(sql: str) -> List[str]:
 def task_id(*args)->str:
     return stable_cache_key("_".join(args))
 
+def chunk_thread_id(task_id: str, sql: str) -> str:
+    """
+    chunk 图的 thread_id：对 "<task_id>:<sql>" 取定长哈希，避免整段 SQL 进入 thread_id 和 checkpoint。
+    （旧版本直接使用 "<task_id>:<sql>"，checkpoint_migration 依赖这一拼接方式迁移旧数据）
+    """
+    return stable_cache_key(task_id + ":" + sql)
+
 def stable_cache_key(sentence: str) -> str:
     return hashlib.sha256(sentence.encode("utf-8")).hexdigest()
 
@@ -0,0 +1,185 @@
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from functools import wraps
+from typing import Any, Awaitable, Callable, List, TypeVar
+
+from . import retry_policy
+
+T = TypeVar("T")
+
+
+@dataclass
+class ControllerStats:
+    throttled: int = 0         # 收到的 429 次数
+    decreases: int = 0         # 乘性降速次数
+    increases: int = 0         # 加性提速次数
+    outages: int = 0           # 服务端故障次数
+    breaker_opened: int = 0    # 熔断次数
+
+
+class AdaptiveRateController:
+    """
+    位于限流器之上的 AIMD 速率控制 + 熔断：
+    - 429：有效 RPM 乘以 decrease（decrease_interval 内最多降一次，避免同一波 429 把速率压到底），
+      并按 Retry-After 暂停所有调用的派发；
+    - 连续 success_window 次成功：有效 RPM 加 step，直到 max_rpm；
+    - 连续 failure_threshold 次服务端故障：熔断 cooldown 秒，期间不派发；
+      到期后只放一个探测请求（half-open），成功则恢复，失败则冷却时间翻倍（不超过 max_cooldown）。
+    有效 RPM 通过 attach 的限流器的 set_rate 生效；限流器的速率由多个进程共享（SqliteLimiterBackend）时，
+    attach 和每次升降速前先采用共享的当前速率，重启或其他进程降过的速率也能按成功次数恢复。
+    """
+
+    def __init__(self, *, max_rpm: float, min_rpm: float = 1.0, step_rpm: float = 1.0, decrease: float = 0.7,
+                 success_window: int = 10, decrease_interval: float = 5.0,
+                 failure_threshold: int = 5, cooldown: float = 30.0, max_cooldown: float = 300.0):
+        if not 0 < min_rpm <= max_rpm:
+            raise ValueError("require 0 < min_rpm <= max_rpm")
+
+        self.max_rpm = float(max_rpm)
+        self.min_rpm = float(min_rpm)
+        self.step_rpm = float(step_rpm)
+        self.decrease = decrease
+        self.success_window = success_window
+        self.decrease_interval = decrease_interval
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.rpm = self.max_rpm
+        self.state = "closed"       # closed / open / half_open
+        self.stats = ControllerStats()
+
+        self._limiters: List[Any] = []
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._successes = 0
+        self._failures = 0
+        self._cooldown = cooldown
+        self._probing = False
+
+    def attach(self, limiter: Any) -> None:
+        self._limiters.append(limiter)
+        self._sync()
+        limiter.set_rate(self.rpm)
+
+    def _sync(self) -> None:
+        """采用共享后端记录的当前速率（只读，不写回）；没有共享速率时保持本进程的 rpm。"""
+        for limiter in self._limiters:
+            shared_rate = getattr(limiter, "shared_rate", None)
+            rpm = shared_rate() if shared_rate is not None else None
+            if rpm is not None:
+                self.rpm = min(self.max_rpm, max(self.min_rpm, rpm))
+                return
+
+    def _set_rpm(self, rpm: float) -> None:
+        self.rpm = min(self.max_rpm, max(self.min_rpm, rpm))
+        for limiter in self._limiters:
+            limiter.set_rate(self.rpm)
+
+    def _open(self, now: float) -> None:
+        self.state = "open"
+        self.stats.breaker_opened += 1
+        self._paused_until = max(self._paused_until, now + self._cooldown)
+
+    async def before_call(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if self.state == "open":
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probing:
+                    # 等探测结果
+                    await asyncio.sleep(min(1.0, self.base_cooldown))
+                    continue
+                self._probing = True
+            return
+
+    def on_success(self) -> None:
+        self._failures = 0
+        if self.state == "half_open":
+            self.state = "closed"
+            self._probing = False
+            self._cooldown = self.base_cooldown
+        self._successes += 1
+        if self._successes >= self.success_window:
+            self._successes = 0
+            self._sync()
+            if self.rpm < self.max_rpm:
+                self.stats.increases += 1
+                self._set_rpm(self.rpm + self.step_rpm)
+
+    def on_error(self, e: BaseException) -> None:
+        now = time.monotonic()
+        self._successes = 0
+        if self.state == "half_open":
+            self._probing = False
+
+        cls = retry_policy.classify(e)
+        if cls == retry_policy.THROTTLE:
+            self.stats.throttled += 1
+            if now - self._last_decrease >= self.decrease_interval:
+                self._last_decrease = now
+                self.stats.decreases += 1
+                self._sync()
+                self._set_rpm(self.rpm * self.decrease)
+            wait = retry_policy.retry_after(e)
+            self._paused_until = max(self._paused_until, now + (wait if wait is not None else 60.0 / self.rpm))
+            if self.state == "half_open":
+                self.state = "closed"
+            return
+
+        if cls == retry_policy.TRANSIENT:
+            self.stats.outages += 1
+            self._failures += 1
+            if self.state == "half_open":
+                self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+                self._open(now)
+            elif self.state == "closed" and self._failures >= self.failure_threshold:
+                self._open(now)
+            return
+
+        # 请求本身的问题（400 等）不影响速率；half-open 探测视为服务已恢复
+        if self.state == "half_open":
+            self.state = "closed"
+            self._cooldown = self.base_cooldown
+
+    def on_cancel(self) -> None:
+        # 探测请求被取消时让出探测名额
+        if self.state == "half_open":
+            self._probing = False
+
+    def snapshot(self) -> dict:
+        return {"effective_rpm": round(self.rpm, 2), "max_rpm": self.max_rpm, "state": self.state, **asdict(self.stats)}
+
+
+def controlled(controller: AdaptiveRateController) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """
+    装饰器：调用前经过熔断/暂停检查，调用结果反馈给 controller。
+    应放在 rate_limited 之外（rate_limited 暴露的 .limiter 会被 attach，由 controller 调整其速率）。
+    """
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        limiter = getattr(func, "limiter", None)
+        if limiter is not None:
+            controller.attach(limiter)
+
+        @wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            await controller.before_call()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                controller.on_error(e)
+                raise
+            except BaseException:
+                controller.on_cancel()
+                raise
+            controller.on_success()
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,85 @@
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict
+
+from .fair_queue import FairQueue
+
+
+class Rejected(Exception):
+    """请求未被接纳；retry_after 为建议客户端等待的秒数。"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    rejected: int = 0
+    max_pending: int = 0
+
+
+class AdmissionController:
+    """
+    服务端准入控制：请求进入后要排在限流器后面等 LLM 名额，排太久的请求只会占用内存和连接。
+    - 每个 tenant 已接纳未完成的请求数不超过 tenant_queue，全局不超过 max_queue；
+    - 预计等待 = 限流器下一个名额的等待时间 + 公平队列中排在前面的调用数 × 每个调用的间隔（60 / 当前有效 RPM），
+      超过 max_wait 秒时拒绝；
+    被拒绝时抛 Rejected，由调用方转成 429 + Retry-After。
+    """
+
+    def __init__(self, *, max_queue: int, tenant_queue: int, max_wait: float, rate: Callable[[], float],
+                 queue: FairQueue, next_free: Callable[[], float]):
+        self.max_queue = max_queue
+        self.tenant_queue = tenant_queue
+        self.max_wait = max_wait
+        self.rate = rate              # 当前每分钟可处理的调用数（有效 RPM）
+        self.queue = queue            # 限流器前的公平队列
+        self.next_free = next_free    # 限流器下一个名额还要等多少秒
+        self.stats = AdmissionStats()
+        self._pending: Dict[str, int] = {}
+        self._total = 0
+
+    def _slot(self) -> float:
+        """限流器放行两个调用之间的间隔（秒）。"""
+        return 60.0 / max(self.rate(), 1e-6)
+
+    def estimate_wait(self, tenant: str, priority: str = "bulk") -> float:
+        """tenant 现在发起一个 priority 类别的调用，预计要等多少秒才被限流器放行。"""
+        return self.next_free() + self.queue.backlog(tenant, priority) * self._slot()
+
+    def enter(self, tenant: str, priority: str = "bulk") -> None:
+        pending = self._pending.get(tenant, 0)
+        slot = self._slot()
+        wait = self.estimate_wait(tenant, priority)
+        if self._total >= self.max_queue:
+            reason = f"server queue full ({self._total})"
+        elif pending >= self.tenant_queue:
+            reason = f"too many queued requests for this client ({pending})"
+        elif wait > self.max_wait:
+            reason = f"expected queue wait {wait:.0f}s exceeds {self.max_wait:.0f}s"
+        else:
+            self._pending[tenant] = pending + 1
+            self._total += 1
+            self.stats.admitted += 1
+            self.stats.max_pending = max(self.stats.max_pending, self._total)
+            return
+
+        self.stats.rejected += 1
+        # 等到排在前面的请求消化掉一部分再来：超时拒绝时等超出的部分，队列满时等队列消化一半
+        retry_after = max(wait - self.max_wait if wait > self.max_wait else wait / 2, slot, 1.0)
+        raise Rejected(reason, min(60.0, math.ceil(retry_after)))
+
+    def leave(self, tenant: str) -> None:
+        pending = self._pending.get(tenant, 0) - 1
+        if pending > 0:
+            self._pending[tenant] = pending
+        else:
+            self._pending.pop(tenant, None)
+        self._total -= 1
+
+    def snapshot(self) -> dict:
+        return {"pending": self._total, "tenants": len(self._pending), "admitted": self.stats.admitted,
+                "rejected": self.stats.rejected, "max_pending": self.stats.max_pending}
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Tuple
+
+# OpenAI Batch API 的终止状态；其余（validating / in_progress / finalizing / cancelling）继续轮询
+TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+@dataclass
+class BatchInfo:
+    id: str
+    status: str
+    output_file_id: str = ""
+    error_file_id: str = ""
+    counts: Dict[str, int] = field(default_factory=dict)   # total / completed / failed
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL
+
+
+class BatchClient(Protocol):
+    """
+    批处理提供方：提交 JSONL 请求文件、查询状态、下载结果。
+    结果文件每行 {"custom_id": ..., "response": {"status_code": ..., "body": {...}}, "error": ...}，与 OpenAI 一致。
+    """
+
+    async def find(self, metadata: Dict[str, str]) -> Optional[str]:
+        """按提交时的 metadata 找到已提交的批次（提交后、checkpoint 写入前中断时避免重复提交）。"""
+        ...
+
+    async def submit(self, path: str, *, metadata: Dict[str, str]) -> str:
+        ...
+
+    async def retrieve(self, batch_id: str) -> BatchInfo:
+        ...
+
+    async def download(self, info: BatchInfo, path: str) -> None:
+        """把结果（含出错请求）写到本地 path。"""
+        ...
+
+
+def write_parts(directory: str, requests: Iterable[Tuple[str, dict]], *, max_requests: int, max_bytes: int,
+                endpoint: str = "/v1/chat/completions") -> List[Tuple[str, int]]:
+    """
+    按 OpenAI 批处理格式写请求文件，单个文件超过 max_requests 行或 max_bytes 字节时换下一个文件。
+    返回 [(文件路径, 行数)]。每个文件先写临时文件再改名，中断时不会留下半个文件。
+    """
+    os.makedirs(directory, exist_ok=True)
+    parts: List[Tuple[str, int]] = []
+    f, n, size = None, 0, 0
+
+    def close() -> None:
+        path = os.path.join(directory, f"requests-{len(parts)}.jsonl")
+        f.close()
+        os.replace(path + ".tmp", path)
+        parts.append((path, n))
+
+    for custom_id, body in requests:
+        line = (json.dumps({"custom_id": custom_id, "method": "POST", "url": endpoint, "body": body},
+                           ensure_ascii=False) + "\n").encode("utf-8")
+        if f is not None and (n >= max_requests or size + len(line) > max_bytes):
+            close()
+            f = None
+        if f is None:
+            f, n, size = open(os.path.join(directory, f"requests-{len(parts)}.jsonl.tmp"), "wb"), 0, 0
+        f.write(line)
+        n += 1
+        size += len(line)
+    if f is not None:
+        close()
+    return parts
+
+
+def _iter_lines(path: str) -> Iterator[Tuple[int, dict]]:
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                yield offset, json.loads(line)
+            offset += len(line)
+
+
+class BatchResults:
+    """
+    已下载的结果文件：只在内存里保存 custom_id -> (文件, 偏移)，取结果时再读对应的一行，
+    上万个 chunk 的译文不必同时驻留内存。
+    """
+
+    def __init__(self, paths: Iterable[str]):
+        self._index: Dict[str, Tuple[str, int]] = {}
+        for path in paths:
+            for offset, line in _iter_lines(path):
+                self._index[line["custom_id"]] = (path, offset)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, custom_id: str) -> bool:
+        return custom_id in self._index
+
+    def usage(self) -> Dict[str, int]:
+        """所有结果的请求数、失败数和 token 用量（遍历一遍结果文件）。"""
+        total = {"requests": 0, "failed": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+        for path in dict.fromkeys(p for p, _ in self._index.values()):
+            for _, line in _iter_lines(path):
+                total["requests"] += 1
+                response = line.get("response") or {}
+                if line.get("error") or response.get("status_code") != 200:
+                    total["failed"] += 1
+                    continue
+                usage = (response.get("body") or {}).get("usage") or {}
+                total["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                total["cached_tokens"] += (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+                total["completion_tokens"] += usage.get("completion_tokens", 0)
+        return total
+
+    def get(self, custom_id: str) -> Optional[dict]:
+        """成功时返回响应 body（chat.completion），请求出错或不存在时返回 None。"""
+        if custom_id not in self._index:
+            return None
+        path, offset = self._index[custom_id]
+        with open(path, "rb") as f:
+            f.seek(offset)
+            line = json.loads(f.readline())
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            return None
+        return response.get("body")
+
+
+class OpenAIBatchClient:
+    """OpenAI（及兼容 /v1/batches 的服务）的 Batch API。"""
+
+    def __init__(self, *, api_key: str, base_url: str, completion_window: str = "24h",
+                 endpoint: str = "/v1/chat/completions"):
+        from openai import AsyncOpenAI
+
+        self._client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        self.completion_window = completion_window
+        self.endpoint = endpoint
+
+    async def find(self, metadata: Dict[str, str]) -> Optional[str]:
+        async for batch in self._client.batches.list(limit=100):
+            if batch.status in ("failed", "expired", "cancelled"):
+                continue
+            if all((batch.metadata or {}).get(k) == v for k, v in metadata.items()):
+                return batch.id
+        return None
+
+    async def submit(self, path: str, *, metadata: Dict[str, str]) -> str:
+        with open(path, "rb") as f:
+            uploaded = await self._client.files.create(file=f, purpose="batch")
+        batch = await self._client.batches.create(input_file_id=uploaded.id, endpoint=self.endpoint,
+                                                  completion_window=self.completion_window, metadata=metadata)
+        return batch.id
+
+    async def retrieve(self, batch_id: str) -> BatchInfo:
+        batch = await self._client.batches.retrieve(batch_id)
+        counts = batch.request_counts.model_dump() if batch.request_counts else {}
+        return BatchInfo(batch.id, batch.status, batch.output_file_id or "", batch.error_file_id or "", counts)
+
+    async def download(self, info: BatchInfo, path: str) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            for file_id in (info.output_file_id, info.error_file_id):
+                if file_id:
+                    f.write((await self._client.files.content(file_id)).content)
+        os.replace(tmp, path)
+
+
+# 本地批处理的请求处理函数：请求 body -> (HTTP 状态码, 响应 body)
+Handler = Callable[[dict], Awaitable[Tuple[int, Any]]]
+
+
+def http_handler(*, base_url: str, api_key: str, timeout: float = 600.0) -> Handler:
+    """逐条转发到在线的 OpenAI 兼容接口（本地开发、联调用）。"""
+    import httpx
+
+    client = httpx.AsyncClient(base_url=base_url.rstrip("/") + "/", timeout=timeout,
+                               headers={"Authorization": f"Bearer {api_key}"})
+
+    async def handle(body: dict) -> Tuple[int, Any]:
+        response = await client.post("chat/completions", json=body)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, {"error": {"message": response.text}}
+
+    return handle
+
+
+class LocalBatchClient:
+    """
+    基于本地目录的批处理提供方，行为与 Batch API 相同（提交后异步处理、轮询状态、下载结果文件），
+    用于测试和离线联调：root/<batch_id>/ 下保存 input.jsonl、output.jsonl、batch.json。
+    处理过程逐行追加到 output.jsonl，进程中断后下一次 retrieve 从未完成的请求继续。
+    """
+
+    def __init__(self, root: str, handler: Handler, *, concurrency: int = 4):
+        self.root = root
+        self.handler = handler
+        self.concurrency = concurrency
+        self._tasks: Dict[str, asyncio.Task] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, batch_id: str) -> str:
+        return os.path.join(self.root, batch_id)
+
+    def _meta(self, batch_id: str) -> dict:
+        with open(os.path.join(self._dir(batch_id), "batch.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_meta(self, batch_id: str, meta: dict) -> None:
+        path = os.path.join(self._dir(batch_id), "batch.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    async def find(self, metadata: Dict[str, str]) -> Optional[str]:
+        for batch_id in sorted(os.listdir(self.root)):
+            try:
+                meta = self._meta(batch_id)
+            except (OSError, ValueError):
+                continue
+            if meta["status"] not in ("failed", "expired", "cancelled") and \
+                    all(meta["metadata"].get(k) == v for k, v in metadata.items()):
+                return batch_id
+        return None
+
+    async def submit(self, path: str, *, metadata: Dict[str, str]) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        os.makedirs(self._dir(batch_id))
+        with open(path, "rb") as src, open(os.path.join(self._dir(batch_id), "input.jsonl"), "wb") as dst:
+            dst.write(src.read())
+        self._save_meta(batch_id, {"status": "in_progress", "metadata": metadata, "created_at": time.time()})
+        self._start(batch_id)
+        return batch_id
+
+    def _start(self, batch_id: str) -> None:
+        task = self._tasks.get(batch_id)
+        if task is None or task.done():
+            self._tasks[batch_id] = asyncio.create_task(self._process(batch_id))
+
+    async def _process(self, batch_id: str) -> None:
+        directory = self._dir(batch_id)
+        output = os.path.join(directory, "output.jsonl")
+        done = set()
+        if os.path.exists(output):
+            # 上次中断时可能写了半行：截掉最后一个换行之后的内容
+            with open(output, "rb+") as f:
+                f.truncate(f.read().rfind(b"\n") + 1)
+            done = {line["custom_id"] for _, line in _iter_lines(output)}
+        slots = asyncio.Semaphore(self.concurrency)
+
+        with open(output, "a", encoding="utf-8") as out:
+            async def run(request: dict) -> None:
+                async with slots:
+                    try:
+                        status, body = await self.handler(request["body"])
+                        line = {"custom_id": request["custom_id"], "response": {"status_code": status, "body": body},
+                                "error": None}
+                    except Exception as e:
+                        line = {"custom_id": request["custom_id"], "response": None,
+                                "error": {"code": type(e).__name__, "message": str(e)}}
+                    out.write(json.dumps(line, ensure_ascii=False) + "\n")
+                    out.flush()
+
+            await asyncio.gather(*(run(request) for _, request in _iter_lines(os.path.join(directory, "input.jsonl"))
+                                   if request["custom_id"] not in done))
+
+        meta = self._meta(batch_id)
+        meta["status"] = "completed"
+        self._save_meta(batch_id, meta)
+
+    async def retrieve(self, batch_id: str) -> BatchInfo:
+        meta = self._meta(batch_id)
+        directory = self._dir(batch_id)
+        if meta["status"] not in TERMINAL:
+            # 本进程里没有在处理（例如重启后）：继续处理剩余请求
+            self._start(batch_id)
+        total = sum(1 for _ in _iter_lines(os.path.join(directory, "input.jsonl")))
+        lines = [line for _, line in _iter_lines(os.path.join(directory, "output.jsonl"))] \
+            if os.path.exists(os.path.join(directory, "output.jsonl")) else []
+        failed = sum(1 for line in lines if line.get("error") or (line.get("response") or {}).get("status_code") != 200)
+        return BatchInfo(batch_id, meta["status"], "output.jsonl" if meta["status"] == "completed" else "",
+                         counts={"total": total, "completed": len(lines) - failed, "failed": failed})
+
+    async def download(self, info: BatchInfo, path: str) -> None:
+        with open(os.path.join(self._dir(info.id), "output.jsonl"), "rb") as src, open(path + ".tmp", "wb") as dst:
+            dst.write(src.read())
+        os.replace(path + ".tmp", path)
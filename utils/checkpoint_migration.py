@@ -0,0 +1,153 @@
+import logging
+import os
+import sqlite3
+import time
+from typing import Callable, Optional
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from . import stable_cache_key
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA user_version：1 = chunk thread_id 已改为定长哈希；2 = chunk checkpoint 已补上 job_id
+THREAD_ID_VERSION = 1
+JOB_ID_VERSION = 2
+
+
+def _rewrite_checkpoint(serde: JsonPlusSerializer, type_: str, blob: bytes, old: str, new: str):
+    checkpoint = serde.loads_typed((type_, blob))
+    channel_values = checkpoint.get("channel_values") or {}
+    if channel_values.get("task_id") != old:
+        return None
+    channel_values["task_id"] = new
+    return serde.dumps_typed(checkpoint)
+
+
+def migrate_thread_ids(path: str) -> None:
+    """
+    一次性迁移旧 checkpoint 库：把 "<task_id>:<chunk sql>" 形式的 thread_id（以及 channel 中的 task_id）
+    改写为 utils.chunk_thread_id 的定长哈希，然后 VACUUM 回收空间。
+    通过 PRAGMA user_version 记录迁移状态，已迁移的库直接返回。
+    """
+    if not os.path.exists(path):
+        return
+
+    con = sqlite3.connect(path)
+    try:
+        if con.execute("PRAGMA user_version").fetchone()[0] >= THREAD_ID_VERSION:
+            return
+
+        tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        if not {"checkpoints", "writes"} <= tables:
+            # 新库：表由 AsyncSqliteSaver 创建，直接记为最新版本
+            con.execute(f"PRAGMA user_version = {THREAD_ID_VERSION}")
+            con.commit()
+            return
+
+        size_before = os.path.getsize(path)
+        start_time = time.perf_counter()
+        serde = JsonPlusSerializer()
+
+        # 新的 thread_id 均为 64 位十六进制，不含 ':'
+        old_ids = [r[0] for r in con.execute(
+            "SELECT thread_id FROM checkpoints WHERE thread_id LIKE '%:%' "
+            "UNION SELECT thread_id FROM writes WHERE thread_id LIKE '%:%'"
+        )]
+
+        for old in old_ids:
+            new = stable_cache_key(old)
+
+            rows = con.execute(
+                "SELECT checkpoint_ns, checkpoint_id, type, checkpoint FROM checkpoints WHERE thread_id = ?", (old,)
+            ).fetchall()
+            for checkpoint_ns, checkpoint_id, type_, blob in rows:
+                try:
+                    rewritten = _rewrite_checkpoint(serde, type_, blob, old, new)
+                except Exception as e:
+                    logger.warning(f"[Checkpoint Migration] 无法解析 checkpoint {checkpoint_id}，仅迁移 thread_id：{e}")
+                    continue
+                if rewritten:
+                    con.execute(
+                        "UPDATE checkpoints SET type = ?, checkpoint = ? "
+                        "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                        (*rewritten, old, checkpoint_ns, checkpoint_id),
+                    )
+
+            new_type, new_value = serde.dumps_typed(new)
+            con.execute(
+                "UPDATE writes SET type = ?, value = ? WHERE thread_id = ? AND channel = 'task_id'",
+                (new_type, new_value, old),
+            )
+            con.execute("UPDATE checkpoints SET thread_id = ? WHERE thread_id = ?", (new, old))
+            con.execute("UPDATE writes SET thread_id = ? WHERE thread_id = ?", (new, old))
+
+        con.execute(f"PRAGMA user_version = {THREAD_ID_VERSION}")
+        con.commit()
+        if old_ids:
+            con.execute("VACUUM")
+
+        logger.warning(
+            f"[Checkpoint Migration] 迁移 {len(old_ids)} 个 thread，"
+            f"{size_before / 1024 / 1024:.1f}MB -> {os.path.getsize(path) / 1024 / 1024:.1f}MB，"
+            f"耗时 {time.perf_counter() - start_time:.1f}s"
+        )
+    finally:
+        con.close()
+
+
+def migrate_job_ids(path: str, job_id: Callable[[dict], Optional[str]]) -> None:
+    """
+    一次性迁移：job_id 引入之前的 chunk checkpoint 把共享参数（prompt / 方言等）直接存在 channel 里，
+    没有 job_id，按新的 ChunkState 无法恢复。对每个缺少 job_id 的 checkpoint 调用 job_id(channel_values)，
+    返回非空时写回 channel_values["job_id"]；旧的共享参数 channel 不再属于图，恢复时被忽略。
+    job_id 与 job_store.put 同样按内容哈希计算，重新提交同样参数的任务即可续跑这些 chunk。
+    """
+    if not os.path.exists(path):
+        return
+
+    con = sqlite3.connect(path)
+    try:
+        if con.execute("PRAGMA user_version").fetchone()[0] >= JOB_ID_VERSION:
+            return
+
+        tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        if "checkpoints" not in tables:
+            con.execute(f"PRAGMA user_version = {JOB_ID_VERSION}")
+            con.commit()
+            return
+
+        start_time = time.perf_counter()
+        serde = JsonPlusSerializer()
+        migrated = 0
+        rows = con.execute("SELECT thread_id, checkpoint_ns, checkpoint_id, type, checkpoint FROM checkpoints").fetchall()
+        for thread_id, checkpoint_ns, checkpoint_id, type_, blob in rows:
+            try:
+                checkpoint = serde.loads_typed((type_, blob))
+            except Exception as e:
+                logger.warning(f"[Checkpoint Migration] 无法解析 checkpoint {checkpoint_id}，跳过：{e}")
+                continue
+            channel_values = checkpoint.get("channel_values") or {}
+            if "job_id" in channel_values:
+                continue
+            new = job_id(channel_values)
+            if not new:
+                continue
+            channel_values["job_id"] = new
+            checkpoint["channel_values"] = channel_values
+            con.execute(
+                "UPDATE checkpoints SET type = ?, checkpoint = ? "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (*serde.dumps_typed(checkpoint), thread_id, checkpoint_ns, checkpoint_id),
+            )
+            migrated += 1
+
+        con.execute(f"PRAGMA user_version = {JOB_ID_VERSION}")
+        con.commit()
+        if migrated:
+            logger.warning(
+                f"[Checkpoint Migration] 为 {migrated} 个 chunk checkpoint 补上 job_id，"
+                f"耗时 {time.perf_counter() - start_time:.1f}s"
+            )
+    finally:
+        con.close()
@@ -1,21 +1,49 @@
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
 from contextlib import asynccontextmanager
+from typing import Callable, List
+
+from . import checkpoint_migration, graph_registry
 
 
 
 _checkpointer=None
 
+# 依赖状态定义的迁移（例如 chunk_graph 补 job_id）由图模块在导入时登记，启动时在打开库之前依次执行
+_migrations: List[Callable[[str], None]] = []
+
+
+def register_migration(migrate: Callable[[str], None]) -> None:
+    _migrations.append(migrate)
+
+
 @asynccontextmanager
 async def lifespan(*args,path="resources/checkpoints.db",**kwargs):
     global _checkpointer
+    # 旧库一次性迁移（已迁移时只读一次 user_version）
+    checkpoint_migration.migrate_thread_ids(path)
+    for migrate in _migrations:
+        migrate(path)
     async with AsyncSqliteSaver.from_conn_string(
         path
     ) as saver:
         _checkpointer = saver
+        # 启动时预编译所有已登记的图，避免首批请求各自编译
+        graph_registry.warmup(saver)
         yield
 
 
+async def latest_snapshot(graph, config):
+    """
+    只取 thread 最新的一个 checkpoint（checkpoint_id 倒序 LIMIT 1，走主键索引），不遍历历史。
+    没有 checkpoint 时返回 None；snapshot.next 为空表示该 thread 已执行完成。
+    """
+    snapshot = await graph.aget_state(config)
+    if snapshot.created_at is None:
+        return None
+    return snapshot
+
+
 # @utils.semaphore(1)
 async def get_checkpointer():
     global _checkpointer
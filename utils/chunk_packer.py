@@ -0,0 +1,131 @@
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from . import split_sql
+
+# 合并后每张表前插入的分隔行，模型需要原样保留，用于把输出拆回每张表
+_MARKER = "-- @@table {}"
+_MARKER_RE = re.compile(r"^[ \t]*--[ \t]*@@table[ \t]+(\d+)[ \t]*$", re.MULTILINE)
+_CREATE_TABLE_RE = re.compile(r"create\s+table", re.IGNORECASE)
+
+# 与 chunk_method.process_chunk 中的提示词配套
+PROMPT_RULE = (
+    "【多表输入】输入包含多张表，每张表前有一行形如 `-- @@table N` 的分隔注释；"
+    "输出时必须在对应表的建表语句之前原样保留这些分隔行，顺序不变，不得合并或删除。\n"
+)
+
+
+@dataclass
+class PackStats:
+    batches: int = 0        # 实际合并调用的批次数
+    packed: int = 0         # 进入合并批次的 chunk 数
+    split_failed: int = 0   # 输出无法按表拆回的批次数（整批回退为逐表翻译）
+    fallback: int = 0       # 拆回后单表校验失败、回退逐表翻译的 chunk 数
+
+    @property
+    def calls_saved(self) -> int:
+        return self.packed - self.batches - self.fallback
+
+    @property
+    def degraded(self) -> bool:
+        """模型持续不按分隔行输出时停止合并，避免每批都白白多花一次调用。"""
+        return self.split_failed >= 3 and self.split_failed > self.batches - self.split_failed
+
+
+_encodings: Dict[str, object] = {}
+
+
+def estimate_tokens(text: str, *, chars_per_token: float = 3.0, tokenizer: str = "") -> int:
+    """
+    估算 token 数：指定 tokenizer（tiktoken 编码名）且本地可用时精确计数，
+    否则按 chars_per_token（按实际账单校准的字符/token 比）估算。
+    """
+    if tokenizer:
+        if tokenizer not in _encodings:
+            try:
+                import tiktoken
+                _encodings[tokenizer] = tiktoken.get_encoding(tokenizer)
+            except Exception:
+                _encodings[tokenizer] = None
+        encoding = _encodings[tokenizer]
+        if encoding is not None:
+            return len(encoding.encode(text))
+    return int(len(text) / chars_per_token) + 1
+
+
+def packable(sql: str) -> bool:
+    """只有恰好包含一个 CREATE TABLE 的 chunk 参与合并（前导语句等其他 chunk 单独处理）。"""
+    return len(_CREATE_TABLE_RE.findall(sql)) == 1
+
+
+def iter_pack(chunks: Iterable[str], *, max_items: int, input_budget: int, output_budget: int,
+              overhead: int = 0, output_ratio: float = 1.0,
+              estimate: Callable[[str], int] = estimate_tokens) -> Iterator[List[str]]:
+    """
+    按输入顺序把相邻 chunk 贪心合并为批次（惰性产出，可直接接流式切分）：
+    - 每批最多 max_items 个 chunk（即 merge_n）；
+    - overhead（提示词固定部分）+ 输入 token 不超过 input_budget；
+    - 输入 token * output_ratio 估算的输出不超过 output_budget。
+    单个 chunk 超预算时单独成批，不做拆分。
+    """
+    current: List[str] = []
+    tokens = 0
+    for sql in chunks:
+        n = estimate(sql)
+        if not packable(sql) or max_items <= 1:
+            if current:
+                yield current
+                current, tokens = [], 0
+            yield [sql]
+            continue
+        if current and (len(current) >= max_items
+                        or overhead + tokens + n > input_budget
+                        or (tokens + n) * output_ratio > output_budget):
+            yield current
+            current, tokens = [], 0
+        current.append(sql)
+        tokens += n
+    if current:
+        yield current
+
+
+def pack(chunks: Iterable[str], **kwargs) -> List[List[str]]:
+    return list(iter_pack(chunks, **kwargs))
+
+
+def join(chunks: List[str]) -> str:
+    return "\n\n".join(f"{_MARKER.format(i)}\n{sql}" for i, sql in enumerate(chunks, 1))
+
+
+def is_packed(sql: str) -> bool:
+    return _MARKER_RE.search(sql) is not None
+
+
+def split(output: str, n: int) -> Optional[List[str]]:
+    """
+    把合并批次的输出拆回 n 张表的结果，格式与单表调用一致（末尾两个换行）。
+    优先按分隔行拆分；没有分隔行时（例如规则翻译的输出）按 CREATE TABLE 拆分且数量必须一致。
+    无法可靠拆分时返回 None。
+    """
+    markers = list(_MARKER_RE.finditer(output))
+    if markers:
+        if [int(m.group(1)) for m in markers] != list(range(1, n + 1)):
+            return None
+        head = output[:markers[0].start()].strip()
+        parts = []
+        for i, m in enumerate(markers):
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(output)
+            parts.append(output[m.end():end].strip())
+        if head:
+            parts[0] = head + "\n" + parts[0]
+    else:
+        parts = split_sql(output)
+        if len(parts) > 1 and not packable(parts[0]):
+            head = parts.pop(0)
+            parts[0] = head + "\n" + parts[0]
+        if len(parts) != n:
+            return None
+    if not all(parts):
+        return None
+    return [p + "\n\n" for p in parts]
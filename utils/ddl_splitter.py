@@ -0,0 +1,289 @@
+import mmap
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+@dataclass(frozen=True)
+class LexRules:
+    """不同方言的词法差异。"""
+    backslash_escapes: bool = False   # '...' 内反斜杠转义（MySQL / Hive）
+    hash_comments: bool = False       # # 行注释（MySQL）
+    dollar_quotes: bool = True        # $tag$...$tag$（PostgreSQL 函数体）
+    e_strings: bool = True            # E'...' 内反斜杠转义（PostgreSQL）
+
+
+_MYSQL = LexRules(backslash_escapes=True, hash_comments=True, dollar_quotes=False, e_strings=False)
+_HIVE = LexRules(backslash_escapes=True, dollar_quotes=False, e_strings=False)
+_DIALECT_RULES: Dict[str, LexRules] = {
+    "mysql": _MYSQL, "doris": _MYSQL, "starrocks": _MYSQL,
+    "hive": _HIVE, "spark": _HIVE, "spark2": _HIVE, "databricks": _HIVE, "clickhouse": _HIVE,
+}
+
+
+def rules_for(dialect: str) -> LexRules:
+    """sqlglot 方言名 -> 词法规则；未知方言按 PostgreSQL 处理。"""
+    return _DIALECT_RULES.get((dialect or "").lower(), LexRules())
+
+
+# ---------- 词法：按顶层分隔符切语句 ----------
+
+_LEADING = re.compile(rb"(?:\s+|--[^\n]*|/\*.*?\*/)*", re.DOTALL)
+_LEADING_HASH = re.compile(rb"(?:\s+|--[^\n]*|#[^\n]*|/\*.*?\*/)*", re.DOTALL)
+_DELIMITER = re.compile(rb"delimiter[ \t]+(\S+)[ \t]*(?:\r?\n|\Z)", re.IGNORECASE)
+# 分隔符之后同一行的注释属于这条语句
+_TRAILING = re.compile(rb"[ \t]*(?:--[^\n]*)?")
+_TRAILING_HASH = re.compile(rb"[ \t]*(?:(?:--|#)[^\n]*)?")
+_NOT_IDENT = rb"(?<![A-Za-z0-9_])"
+
+
+@lru_cache(maxsize=None)
+def _statement_re(delimiter: bytes, rules: LexRules) -> "re.Pattern[bytes]":
+    """
+    一次匹配一条语句（到分隔符或文件末尾为止），整个扫描在正则引擎内完成。
+    各分支都是原子的（?>、++、*+），遇到未闭合的引号时回退到逐字符分支，不会指数回溯。
+    """
+    specials = {delimiter[:1], b"'", b'"', b"`", b"-", b"/"}
+    alts = []
+    if rules.backslash_escapes:
+        alts += [rb"'[^'\\]*+(?:(?:\\.|'')[^'\\]*+)*+'", rb'"[^"\\]*+(?:(?:\\.|"")[^"\\]*+)*+"']
+    else:
+        # E'...' 未闭合时不能再按普通字符串匹配
+        plain_quote = rb"(?:(?<![Ee])|(?<=[A-Za-z0-9_][Ee]))" if rules.e_strings else b""
+        alts += [plain_quote + rb"'[^']*+(?:''[^']*+)*+'", rb'"[^"]*+(?:""[^"]*+)*+"']
+    if rules.e_strings:
+        alts.append(rb"(?<=" + _NOT_IDENT + rb"[Ee])'[^'\\]*+(?:(?:\\.|'')[^'\\]*+)*+'")
+    alts += [rb"`[^`]*+(?:``[^`]*+)*+`", rb"--[^\n]*+", rb"/\*(?:.*?\*/|.*)"]
+    if rules.hash_comments:
+        specials.add(b"#")
+        alts.append(rb"#[^\n]*+")
+    if rules.dollar_quotes:
+        specials.add(b"$")
+        alts.append(_NOT_IDENT + rb"\$(?P<tag>(?:[A-Za-z_][A-Za-z_0-9]*)?)\$.*?\$(?P=tag)\$")
+    plain = b"[^" + b"".join(re.escape(c) for c in sorted(specials)) + b"]++"
+    alts = [plain] + alts + [rb"(?!" + re.escape(delimiter) + rb")."]
+    return re.compile(rb"(?>" + b"|".join(alts) + rb")*+(?P<end>" + re.escape(delimiter) + rb")?", re.DOTALL)
+
+
+def _statement_spans(buf: Buffer, rules: LexRules) -> Iterator[Tuple[int, int]]:
+    """
+    顶层语句的 [start, end) 区间（end 含分隔符），各区间首尾相接覆盖全文。
+    引号、注释、$$ 内的分隔符不切分；MySQL 客户端的 DELIMITER 指令单独成一段并切换分隔符。
+    未闭合的引号 / $tag$ 按普通字符处理，避免一个孤立的引号吞掉后面整个文件。
+    """
+    n = len(buf)
+    leading = _LEADING_HASH if rules.hash_comments else _LEADING
+    trailing = _TRAILING_HASH if rules.hash_comments else _TRAILING
+    statement = _statement_re(b";", rules)
+    start = 0
+    while start < n:
+        d = _DELIMITER.match(buf, leading.match(buf, start).end())
+        if d:
+            yield start, d.end()
+            statement = _statement_re(d.group(1), rules)
+            start = d.end()
+            continue
+        m = statement.match(buf, start)
+        end = trailing.match(buf, m.end()).end() if m.group("end") else m.end()
+        yield start, end
+        start = end
+
+
+# ---------- 语句分类：找出所属对象 ----------
+
+_PART = rb'(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|[^\s.;,()\'"`\[\]]+)'
+_NAME = _PART + rb"(?:\s*\.\s*" + _PART + rb")*"
+_PART_RE = re.compile(_PART)
+
+_I = re.IGNORECASE | re.DOTALL
+_CREATE_TABLE = re.compile(
+    rb"create\s+(?:or\s+replace\s+)?(?:(?:global|local)\s+)?(?:(?:temporary|temp|unlogged|external|transient)\s+)?"
+    rb"table\s+(?:if\s+not\s+exists\s+)?(" + _NAME + rb")", _I)
+_CREATE_VIEW = re.compile(
+    rb"create\s+(?:or\s+replace\s+)?(?:(?:algorithm\s*=\s*\w+|definer\s*=\s*\S+|sql\s+security\s+\w+|"
+    rb"temporary|temp|recursive|materialized)\s+)*view\s+(?:if\s+not\s+exists\s+)?(" + _NAME + rb")", _I)
+_CREATE_SEQUENCE = re.compile(
+    rb"create\s+(?:(?:temporary|temp|unlogged)\s+)?sequence\s+(?:if\s+not\s+exists\s+)?(" + _NAME + rb")", _I)
+_COMMENT_ON = re.compile(
+    rb"comment\s+on\s+(table|column|view|materialized\s+view|sequence)\s+(" + _NAME + rb")", _I)
+_CREATE_INDEX = re.compile(
+    rb"create\s+(?:unique\s+)?(?:(?:clustered|nonclustered|fulltext|spatial|bitmap)\s+)?index\s+"
+    rb"(?:concurrently\s+)?(?:if\s+not\s+exists\s+)?(?:" + _NAME + rb"\s+)?on\s+(?:only\s+)?(" + _NAME + rb")", _I)
+_ALTER = re.compile(
+    rb"alter\s+(table|view|materialized\s+view|sequence)\s+(?:if\s+exists\s+)?(?:only\s+)?(" + _NAME + rb")", _I)
+_OWNED_BY = re.compile(rb"\bowned\s+by\s+(" + _NAME + rb")", _I)
+
+# 语句类别
+OBJECT, ATTACH, OWNED, OTHER = "object", "attach", "owned", "other"
+
+Key = Tuple[str, ...]
+
+
+def _key(name: bytes) -> Key:
+    parts = []
+    for p in _PART_RE.findall(name):
+        p = p.decode("utf-8", "replace")
+        parts.append(p[1:-1] if p[0] in "\"`[" else p.lower())
+    return tuple(parts)
+
+
+def _classify(buf: Buffer, pos: int, end: int) -> Tuple[str, Optional[Key], Optional[Key]]:
+    """返回 (类别, 对象名, OWNED BY 的表名)。pos 为去掉前导注释后的语句开头，直接在原缓冲区上匹配。"""
+    for pattern in (_CREATE_TABLE, _CREATE_VIEW, _CREATE_SEQUENCE):
+        m = pattern.match(buf, pos, end)
+        if m:
+            return OBJECT, _key(m.group(1)), None
+    m = _COMMENT_ON.match(buf, pos, end)
+    if m:
+        key = _key(m.group(2))
+        return (ATTACH, key[:-1] if m.group(1).lower() == b"column" else key, None) if key else (OTHER, None, None)
+    m = _CREATE_INDEX.match(buf, pos, end)
+    if m:
+        return ATTACH, _key(m.group(1)), None
+    m = _ALTER.match(buf, pos, end)
+    if m:
+        key = _key(m.group(2))
+        owned = _OWNED_BY.search(buf, m.end(), end) if m.group(1).lower() == b"sequence" else None
+        if owned and len(_key(owned.group(1))) > 1:
+            return OWNED, key, _key(owned.group(1))[:-1]
+        return ATTACH, key, None
+    return OTHER, None, None
+
+
+# ---------- 分组 ----------
+
+class _Objects:
+    """对象名 -> 分组；不带 schema 的引用在名字唯一时也能匹配到。"""
+
+    def __init__(self):
+        self.full: Dict[Key, int] = {}
+        self.bare: Dict[str, Optional[int]] = {}
+        self.parent: List[int] = []
+
+    def new(self, key: Key) -> int:
+        gid = len(self.parent)
+        self.parent.append(gid)
+        self.full[key] = gid
+        self.bare[key[-1]] = gid if key[-1] not in self.bare else None   # 重名则不按短名匹配
+        return gid
+
+    def find(self, gid: int) -> int:
+        while self.parent[gid] != gid:
+            gid = self.parent[gid]
+        return gid
+
+    def lookup(self, key: Optional[Key]) -> Optional[int]:
+        if not key:
+            return None
+        gid = self.full.get(key)
+        if gid is None and len(key) == 1:
+            gid = self.bare.get(key[0])
+        if gid is None:
+            # 带 schema 的引用找不带 schema 的定义
+            gid = self.full.get(key[-1:])
+        return None if gid is None else self.find(gid)
+
+
+def _groups(buf: Buffer, rules: LexRules) -> Tuple[List[Tuple[int, int]], List[List[int]]]:
+    """第一遍：切语句并分类；返回语句区间和按输出顺序排列的分组（语句下标列表）。"""
+    leading = _LEADING_HASH if rules.hash_comments else _LEADING
+    spans: List[Tuple[int, int]] = []
+    owner: List[Optional[int]] = []   # 语句所属分组（合并前的 gid），None 表示不属于任何对象
+    objects = _Objects()
+
+    for start, end in _statement_spans(buf, rules):
+        idx = len(spans)
+        spans.append((start, end))
+        body = leading.match(buf, start, end).end()
+        if body >= end:
+            # 只有空白 / 注释：跟随前一条语句
+            owner.append(owner[-1] if idx else None)
+            continue
+        kind, key, table = _classify(buf, body, end)
+        if kind == OBJECT:
+            owner.append(objects.new(key))
+        elif kind == OWNED:
+            seq, tbl = objects.lookup(key), objects.lookup(table)
+            if tbl is not None and seq is not None and seq != tbl:
+                objects.parent[seq] = tbl   # 序列并入所属表
+            owner.append(tbl if tbl is not None else seq)
+        elif kind == ATTACH:
+            owner.append(objects.lookup(key))
+        else:
+            owner.append(None)
+
+    # 第二遍：按每组第一条语句的位置输出；不属于任何对象的相邻语句合成一组
+    members: Dict[int, List[int]] = {}
+    order: List[List[int]] = []
+    loose: Optional[List[int]] = None
+    for idx, gid in enumerate(owner):
+        if gid is None:
+            if loose is None:
+                loose = []
+                order.append(loose)
+            loose.append(idx)
+            continue
+        loose = None
+        gid = objects.find(gid)
+        group = members.get(gid)
+        if group is None:
+            group = members[gid] = []
+            order.append(group)
+        group.append(idx)
+    return spans, order
+
+
+def _render(buf: Buffer, spans: Sequence[Tuple[int, int]], group: List[int], normalize_newlines: bool) -> str:
+    # 相邻语句取原文连续片段，不相邻的（例如文件末尾的索引）换行拼接
+    pieces: List[bytes] = []
+    run_start = prev = None
+    for idx in group:
+        if prev is not None and idx == prev + 1:
+            prev = idx
+            continue
+        if run_start is not None:
+            pieces.append(bytes(buf[spans[run_start][0]:spans[prev][1]]).strip())
+        run_start = prev = idx
+    pieces.append(bytes(buf[spans[run_start][0]:spans[prev][1]]).strip())
+    data = b"\n".join(pieces)
+    if normalize_newlines:
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    return data.decode("utf-8")
+
+
+def _split(buf: Buffer, rules: LexRules, normalize_newlines: bool) -> Iterator[str]:
+    spans, order = _groups(buf, rules)
+    for group in order:
+        text = _render(buf, spans, group, normalize_newlines)
+        if text:
+            yield text
+
+
+def split_ddl(sql: str, dialect: str = "") -> List[str]:
+    """
+    按对象切分 DDL（split_sql 的词法感知版本）：
+    - 只在顶层分隔符处切语句，引号、注释、$$ 函数体内的 ';' 和 "create table" 不影响切分；
+    - 每个 CREATE TABLE / VIEW / SEQUENCE 一个 chunk，其 COMMENT ON、CREATE INDEX、ALTER 语句
+      即使出现在文件后部也并入该 chunk（ALTER SEQUENCE ... OWNED BY 把序列并入所属表）；
+    - 不属于文件内任何对象的相邻语句（SET、CREATE SCHEMA 等）合成一个 chunk，留在原位置。
+    """
+    return list(_split(sql.encode("utf-8"), rules_for(dialect), False))
+
+
+def iter_split_ddl_file(path: str, dialect: str = "", *, encoding: str = "utf-8") -> Iterator[str]:
+    """
+    split_ddl 的文件版本：mmap 整个文件，第一遍只记录语句区间和分组，第二遍按组取原文产出，
+    内存占用与语句数成正比，与文件大小无关。换行按文本模式读取的规则统一为 \\n。
+    """
+    if encoding.replace("-", "").replace("_", "").lower() not in ("utf8", "ascii"):
+        with open(path, "r", encoding=encoding) as f:
+            yield from split_ddl(f.read(), dialect)
+        return
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from _split(mm, rules_for(dialect), True)
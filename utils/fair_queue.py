@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+# 优先级类别：数值越小越优先。交互式请求（例如 prompt 规范化）排在批量 chunk 之前
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+_current: contextvars.ContextVar[Tuple[str, str]] = contextvars.ContextVar("tenant", default=("default", "bulk"))
+
+
+@contextmanager
+def tenant(tenant_id: str, priority: str = "bulk") -> Iterator[None]:
+    """在 with 块内发起的限流调用都记在 tenant_id 名下（客户端 / 会话 / job）。"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"unknown priority: {priority}")
+    token = _current.set((tenant_id or "default", priority))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@dataclass
+class _Flow:
+    waiting: Deque[asyncio.Future] = field(default_factory=deque)
+    finish: float = 0.0   # 虚拟完成时间（WFQ 的 finish tag）
+
+
+@dataclass
+class _Tenant:
+    weight: float = 1.0
+    in_flight: int = 0
+    flows: Dict[str, _Flow] = field(default_factory=dict)   # priority -> flow
+
+
+class FairQueue:
+    """
+    限流器前的加权公平队列（WFQ）：
+    - 先按优先级类别，再按各 (tenant, priority) 流的虚拟完成时间选下一个放行者；
+      每放行一次，该流的虚拟时间前进 1/weight，因此并发多的 tenant 不会挤占其他 tenant；
+    - 每个 tenant 同时在途（从放行到调用结束）的调用不超过 tenant_cap；
+    - 同一时刻只有一个放行者在等限流器预约（dispatched 之后才放下一个），
+      所以限流器的放行顺序就是这里的公平顺序。
+    """
+
+    def __init__(self, *, tenant_cap: int, weights: Optional[Dict[str, float]] = None):
+        if tenant_cap < 1:
+            raise ValueError("tenant_cap must be >= 1")
+        self.tenant_cap = tenant_cap
+        self.weights = weights or {}
+        self._tenants: Dict[str, _Tenant] = {}
+        self._vtime = 0.0
+        self._dispatching = False
+
+    def _pick(self) -> Optional[Tuple[str, str]]:
+        best, best_key = None, None
+        for tid, t in self._tenants.items():
+            if t.in_flight >= self.tenant_cap:
+                continue
+            for priority, flow in t.flows.items():
+                if not flow.waiting:
+                    continue
+                key = (PRIORITIES[priority], max(self._vtime, flow.finish) + 1.0 / t.weight)
+                if best_key is None or key < best_key:
+                    best, best_key = (tid, priority), key
+        return best
+
+    def _pump(self) -> None:
+        while not self._dispatching:
+            picked = self._pick()
+            if picked is None:
+                return
+            tid, priority = picked
+            t = self._tenants[tid]
+            flow = t.flows[priority]
+            fut = flow.waiting.popleft()
+            if fut.done():  # 已取消
+                continue
+            start = max(self._vtime, flow.finish)
+            flow.finish = start + 1.0 / t.weight
+            self._vtime = start
+            t.in_flight += 1
+            self._dispatching = True
+            fut.set_result(None)
+
+    async def enter(self) -> str:
+        """排队直到轮到当前 tenant；返回 tenant_id，调用结束后交给 release。"""
+        tid, priority = _current.get()
+        t = self._tenants.get(tid)
+        if t is None:
+            t = self._tenants[tid] = _Tenant(weight=float(self.weights.get(tid, 1.0)))
+        flow = t.flows.setdefault(priority, _Flow())
+
+        fut = asyncio.get_running_loop().create_future()
+        flow.waiting.append(fut)
+        self._pump()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 已被放行但调用方被取消：归还名额
+                self.dispatched()
+                self.release(tid)
+            raise
+        return tid
+
+    def dispatched(self) -> None:
+        """放行者已拿到限流器预约，可以放下一个。"""
+        self._dispatching = False
+        self._pump()
+
+    def release(self, tid: str) -> None:
+        t = self._tenants[tid]
+        t.in_flight -= 1
+        if not t.in_flight and not any(f.waiting for f in t.flows.values()):
+            # 空闲 tenant 不保留状态，重新出现时从当前虚拟时间开始
+            del self._tenants[tid]
+        self._pump()
+
+    def backlog(self, tid: str, priority: str = "bulk") -> float:
+        """
+        估算 tid 此时新排入 priority 类别的一个调用前面还有多少个排队调用：
+        更高优先级类别的排队调用全部在前；同一类别内按 WFQ，每轮到自己一次，其他流按权重各轮到若干次。
+        只数排队中的调用，已放行（在途）的不算。
+        """
+        rank = PRIORITIES[priority]
+        own = self._tenants.get(tid)
+        own_weight = own.weight if own else float(self.weights.get(tid, 1.0))
+        own_flow = own.flows.get(priority) if own else None
+        turns = (len(own_flow.waiting) if own_flow else 0) + 1
+        ahead = float(turns - 1)
+        for other, t in self._tenants.items():
+            for p, flow in t.flows.items():
+                if not flow.waiting:
+                    continue
+                if PRIORITIES[p] < rank:
+                    ahead += len(flow.waiting)
+                elif p == priority and other != tid:
+                    ahead += min(len(flow.waiting), turns * t.weight / own_weight)
+        return ahead
+
+    def snapshot(self) -> dict:
+        return {
+            tid: {"in_flight": t.in_flight, "waiting": {p: len(f.waiting) for p, f in t.flows.items() if f.waiting}}
+            for tid, t in self._tenants.items()
+        }
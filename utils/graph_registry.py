@@ -0,0 +1,47 @@
+import logging
+import time
+import weakref
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# 图名 -> 构建函数（接收 checkpointer，返回编译好的图）
+_BUILDERS: Dict[str, Callable[[Any], Any]] = {}
+
+# checkpointer -> {图名: 编译好的图}；checkpointer 被回收后对应的图一起释放
+_COMPILED: "weakref.WeakKeyDictionary[Any, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+# 没有 checkpointer（None）时单独缓存
+_COMPILED_NO_CHECKPOINTER: Dict[str, Any] = {}
+
+
+def register(name: str):
+    """
+    装饰器：登记一个图的构建函数。构建函数只会在每个 checkpointer 上调用一次。
+    """
+    def decorator(builder: Callable[[Any], Any]):
+        _BUILDERS[name] = builder
+        return builder
+
+    return decorator
+
+
+def get(name: str, checkpointer: Any) -> Any:
+    """
+    获取（必要时编译）指定 checkpointer 下的图。编译后的图是无状态的，可在并发调用间复用。
+    """
+    graphs = _COMPILED_NO_CHECKPOINTER if checkpointer is None else _COMPILED.setdefault(checkpointer, {})
+    graph = graphs.get(name)
+    if graph is None:
+        start_time = time.perf_counter()
+        graph = _BUILDERS[name](checkpointer)
+        graphs[name] = graph
+        logger.info(f"[Graph] compiled {name} in {(time.perf_counter() - start_time) * 1000:.1f}ms")
+    return graph
+
+
+def warmup(checkpointer: Any) -> None:
+    """
+    预编译所有已登记的图（在 lifespan / CLI 启动时调用）。
+    """
+    for name in list(_BUILDERS):
+        get(name, checkpointer)
@@ -0,0 +1,208 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Protocol
+
+from . import ordered_writer
+
+
+class ProgressSink(Protocol):
+    """send_tasks 逐个上报 chunk 结果的接收方（index 为 chunk 在原文件中的序号，到达顺序不定）。"""
+
+    def set_total(self, total: int) -> None:
+        ...
+
+    def put(self, index: int, sql: str) -> None:
+        ...
+
+
+_sink: contextvars.ContextVar[Optional[ProgressSink]] = contextvars.ContextVar("progress_sink", default=None)
+
+
+@contextmanager
+def reporting(sink: ProgressSink) -> Iterator[ProgressSink]:
+    """在 with 块内运行的 main_graph 会把每个 chunk 的结果交给 sink。"""
+    token = _sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _sink.reset(token)
+
+
+def current() -> Optional[ProgressSink]:
+    return _sink.get()
+
+
+class JobProgress:
+    """
+    一个服务端整文件任务的进度和输出：乱序到达的 chunk 结果交给 OrderedFileWriter 重排后写入 path，
+    内存里不保留译文；订阅者（SSE）从任意位置开始按原文件顺序从文件读回，断线后可从上次的位置重新订阅。
+    同一个 key 重新提交时从已落盘的有序前缀继续。
+    """
+
+    owns_output = True   # 结果由 path 保存，send_tasks 不必再把全文放进 MainState.result
+
+    def __init__(self, job_id: str, path: str, *, key: str = "", max_buffer: int = 64 << 20):
+        self.id = job_id
+        self.path = path
+        self.status = "queued"      # queued / running / done / failed
+        self.error = ""
+        self._writer = ordered_writer.OrderedFileWriter(path, key=key or job_id, max_buffer=max_buffer, index=True)
+        self.total: Optional[int] = self._writer.total
+        self.done = self._writer.next   # 已完成的 chunk 数（含乱序到达、尚未可读的）
+        self.created = time.time()
+        self.started_at: Optional[float] = None
+        self.first_chunk_at: Optional[float] = None   # 首个 chunk 结果到达的时间
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def ready(self) -> int:
+        """已按序写入、可以读取的 chunk 数。"""
+        return self._writer.next
+
+    @property
+    def resume_from(self) -> int:
+        """此前已落盘的 chunk 数，这些 chunk 不需要再跑。"""
+        return self._writer.resume_from
+
+    def _notify(self) -> None:
+        # 唤醒当前所有订阅者，之后的订阅者等待新的 Event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def set_total(self, total: int) -> None:
+        self.total = total
+        self._writer.set_total(total)
+        self._notify()
+
+    def put(self, index: int, sql: str) -> None:
+        if not self._writer.put(index, sql):
+            return
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.time()
+        self.done += 1
+        self._notify()
+
+    def read(self, start: int, stop: int) -> List[str]:
+        return self._writer.read(start, stop)
+
+    def start(self) -> None:
+        self.status = "running"
+        self.started_at = time.time()
+        self._notify()
+
+    def finish(self, result: str) -> None:
+        if not self.ready and result:
+            # 命中了不由 sink 落盘时完成的 checkpoint：没有逐 chunk 上报，整体作为一个结果
+            self.set_total(1)
+            self.put(0, result)
+        self._writer.close()
+        self.status = "done"
+        self.finished_at = time.time()
+        self._notify()
+
+    def fail(self, e: BaseException) -> None:
+        # 保留已落盘的前缀，重新提交时从这里继续
+        self._writer.close()
+        self.status = "failed"
+        self.error = f"{type(e).__name__}: {e}"
+        self.finished_at = time.time()
+        self._notify()
+
+    def snapshot(self) -> dict:
+        first = self.first_chunk_at - self.started_at if self.first_chunk_at and self.started_at else None
+        return {"job_id": self.id, "status": self.status, "total": self.total, "done": self.done,
+                "ready": self.ready, "error": self.error,
+                "first_chunk_seconds": None if first is None else round(first, 3)}
+
+    async def events(self, start: int = 0, *, heartbeat: float = 15.0, batch: int = 64) -> AsyncIterator[Dict[str, Any]]:
+        """
+        从第 start 个 chunk 开始按序产出事件：
+        chunk（id 为 chunk 序号）/ progress（完成数变化）/ ping（心跳）/ end（任务结束）。
+        chunk 每次从文件读回最多 batch 个。
+        """
+        cursor = start
+        while True:
+            # 先取 Event 再读状态：读完之后的变化一定会 set 这个 Event
+            changed = self._changed
+            ready, finished = self.ready, self.finished
+            while cursor < ready:
+                for sql in self.read(cursor, min(ready, cursor + batch)):
+                    yield {"event": "chunk", "id": cursor, "data": {"index": cursor, "sql": sql}}
+                    cursor += 1
+            yield {"event": "progress", "data": self.snapshot()}
+            if finished and cursor >= self.ready:
+                yield {"event": "end", "data": self.snapshot()}
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield {"event": "ping"}
+
+
+class JobRegistry:
+    """
+    进程内任务表：同一个 job_id 重复提交时复用已有任务（重新订阅即可），
+    同时运行的任务不超过 max_running，其余排队；结束的任务保留 ttl 秒供客户端取结果。
+    每个任务的结果写到 directory/<job_id>.sql。过期只从任务表移除，文件保留：
+    同样的参数重新提交时，已完成的 checkpoint 不再产出译文，结果仍从这个文件读取。
+    """
+
+    def __init__(self, *, max_running: int, ttl: float, directory: str, max_buffer: int = 64 << 20):
+        self.ttl = ttl
+        self.directory = directory
+        self.max_buffer = max_buffer
+        self._jobs: "OrderedDict[str, JobProgress]" = OrderedDict()
+        self._running = asyncio.Semaphore(max_running)
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _expire(self) -> None:
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished_at > self.ttl:
+                del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[JobProgress]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def submit(self, job_id: str, run: Callable[[], Awaitable[str]], *, key: str = "") -> JobProgress:
+        """
+        run() 在 reporting(job) 内执行。失败的任务重新提交时从 checkpoint 和已落盘的结果继续；
+        key 标识结果文件的内容（chunk 序号的含义），与上次不同时从头写。
+        """
+        job = self.get(job_id)
+        if job is not None and job.status != "failed":
+            return job
+
+        job = self._jobs[job_id] = JobProgress(job_id, os.path.join(self.directory, f"{job_id}.sql"),
+                                               key=key, max_buffer=self.max_buffer)
+
+        async def runner():
+            async with self._running:
+                job.start()
+                try:
+                    with reporting(job):
+                        result = await run()
+                except Exception as e:
+                    job.fail(e)
+                else:
+                    job.finish(result)
+                finally:
+                    self._tasks.pop(job_id, None)
+
+        # 任务与提交请求解耦：客户端断开不影响执行
+        self._tasks[job_id] = asyncio.create_task(runner())
+        return job
+
+    def snapshot(self) -> dict:
+        self._expire()
+        return {job_id: job.snapshot() for job_id, job in self._jobs.items()}
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from . import stable_model_hash
+
+# job_id -> JobContext。chunk 状态只保存 job_id，共享参数（prompt / 方言等）在进程内只存一份。
+# 内容哈希作 key：进程重启后重新 put 同样的参数即可恢复 chunk 的 checkpoint。
+# 超过 _MAX_JOBS 时按 LRU 淘汰，但 hold 住的（仍有 chunk 在运行的）job 不会被淘汰。
+_MAX_JOBS = 1024
+_JOBS: "OrderedDict[str, Any]" = OrderedDict()
+_PINS: Dict[str, int] = {}
+
+
+def _evict() -> None:
+    while len(_JOBS) > _MAX_JOBS:
+        victim = next((job_id for job_id in _JOBS if not _PINS.get(job_id)), None)
+        if victim is None:
+            # 全部在运行：暂时超出上限，release 后再淘汰
+            return
+        del _JOBS[victim]
+
+
+def put(context: Any) -> str:
+    job_id = stable_model_hash(context)
+    _JOBS[job_id] = context
+    _JOBS.move_to_end(job_id)
+    _evict()
+    return job_id
+
+
+@contextmanager
+def hold(context: Any) -> Iterator[str]:
+    """put 并在 with 块内固定该 job（引用计数），块内运行的 chunk 随时都能 get 到共享参数。"""
+    job_id = stable_model_hash(context)
+    _PINS[job_id] = _PINS.get(job_id, 0) + 1
+    try:
+        yield put(context)
+    finally:
+        pins = _PINS[job_id] - 1
+        if pins:
+            _PINS[job_id] = pins
+        else:
+            del _PINS[job_id]
+            _evict()
+
+
+def get(job_id: str) -> Any:
+    try:
+        context = _JOBS[job_id]
+    except KeyError:
+        raise KeyError(f"job {job_id} 未注册：恢复 chunk 前需先 job_store.put 其共享参数") from None
+    _JOBS.move_to_end(job_id)
+    return context
@@ -0,0 +1,215 @@
+import dataclasses
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Protocol
+
+
+@dataclass(frozen=True)
+class BucketSpec:
+    rate: float              # 每秒回填的请求数
+    burst: float             # 请求桶容量
+    token_rate: float = 0    # 每秒回填的 token 数，0 表示不限 token
+    token_capacity: float = 0
+
+
+def _refill(requests: float, tokens: float, elapsed: float, spec: BucketSpec):
+    requests = min(spec.burst, requests + elapsed * spec.rate)
+    if spec.token_rate:
+        tokens = min(spec.token_capacity, tokens + elapsed * spec.token_rate)
+    return requests, tokens
+
+
+def _refill_and_take(requests: float, tokens: float, elapsed: float, spec: BucketSpec, cost: float):
+    """
+    令牌桶的核心计算，各后端共用。采用预约方式：总是立即扣减（余额可以为负），
+    返回 (requests, tokens, wait)，wait 为这次预约生效前需要等待的秒数。
+    调用方按 wait 睡眠后直接放行，不再重试，因此多个进程之间按到达顺序排队，不会同时醒来争抢。
+    """
+    requests, tokens = _refill(requests, tokens, elapsed, spec)
+
+    wait = 0.0
+    if requests < 1:
+        wait = (1 - requests) / spec.rate
+    if cost and tokens < cost:
+        wait = max(wait, (cost - tokens) / spec.token_rate)
+    return requests - 1, tokens - cost, wait
+
+
+def _next_free(requests: float, elapsed: float, spec: BucketSpec) -> float:
+    """不预约，只估算下一个请求名额还要等多少秒。"""
+    requests, _ = _refill(requests, 0.0, elapsed, spec)
+    return max(0.0, (1 - requests) / spec.rate)
+
+
+class LimiterBackend(Protocol):
+    """
+    令牌桶状态的存储后端。take / refund 必须对同一 key 原子执行；
+    blocking=True 的后端会被放到线程池里调用，避免阻塞事件循环。
+    后续接入网络后端（例如 Redis）只需实现这两个方法。
+    """
+    blocking: bool
+
+    def take(self, key: str, spec: BucketSpec, cost: float) -> float:
+        """预约 1 个请求和 cost 个 token，返回预约生效前需要等待的秒数（0 表示立即可用）。"""
+        ...
+
+    def refund(self, key: str, spec: BucketSpec, tokens: float, requests: float = 0) -> None:
+        """结算：退还（tokens>0）或追扣（tokens<0）token，可欠账；requests>0 时同时退还请求名额。"""
+        ...
+
+    def next_free(self, key: str, spec: BucketSpec) -> float:
+        """只读：下一个请求名额还要等多少秒（供准入控制估算排队时间）。"""
+        ...
+
+    def set_rate(self, key: str, spec: BucketSpec) -> None:
+        """把 spec.rate 设为该桶的回填速率；共享后端对所有进程生效（最后一次设置为准）。"""
+        ...
+
+    def get_rate(self, key: str) -> Optional[float]:
+        """只读：该桶记录的共享回填速率（每秒请求数）；没有记录时返回 None。"""
+        ...
+
+
+class MemoryLimiterBackend:
+    """进程内后端（默认）。"""
+    blocking = False
+
+    def __init__(self):
+        self._state: Dict[str, list] = {}
+
+    def _get(self, key: str, spec: BucketSpec) -> list:
+        state = self._state.get(key)
+        if state is None:
+            state = self._state[key] = [spec.burst, spec.token_capacity, time.monotonic()]
+        return state
+
+    def take(self, key: str, spec: BucketSpec, cost: float) -> float:
+        state = self._get(key, spec)
+        now = time.monotonic()
+        state[0], state[1], wait = _refill_and_take(state[0], state[1], now - state[2], spec, cost)
+        state[2] = now
+        return wait
+
+    def refund(self, key: str, spec: BucketSpec, tokens: float, requests: float = 0) -> None:
+        state = self._get(key, spec)
+        state[0] = min(spec.burst, state[0] + requests)
+        state[1] = min(spec.token_capacity, state[1] + tokens)
+
+    def next_free(self, key: str, spec: BucketSpec) -> float:
+        state = self._get(key, spec)
+        return _next_free(state[0], time.monotonic() - state[2], spec)
+
+    def set_rate(self, key: str, spec: BucketSpec) -> None:
+        # 进程内的桶只有一个 limiter 使用，速率就在它传入的 spec 里
+        pass
+
+    def get_rate(self, key: str) -> Optional[float]:
+        return None
+
+
+class SqliteLimiterBackend:
+    """
+    单机多进程共享后端（例如 uvicorn --workers 8）：桶状态存在 SQLite 中，
+    每次扣减是一个 BEGIN IMMEDIATE 事务，由 SQLite 文件锁保证跨进程原子性。
+    使用墙上时钟，多个进程的时间基准一致。
+    回填速率（自适应降速后的有效速率）和余额存在同一行：任一进程降速后，所有进程按同一速率回填。
+    """
+    blocking = True
+
+    def __init__(self, path: str, *, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " key TEXT PRIMARY KEY,"
+            " requests REAL NOT NULL,"
+            " tokens REAL NOT NULL,"
+            " updated REAL NOT NULL,"
+            " rate REAL)"
+        )
+        if "rate" not in {r[1] for r in conn.execute("PRAGMA table_info(buckets)")}:
+            # 旧库没有 rate 列：为空时按各进程的 spec.rate
+            conn.execute("ALTER TABLE buckets ADD COLUMN rate REAL")
+
+    def _conn(self) -> sqlite3.Connection:
+        # to_thread 会在不同线程调用，每个线程一个连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _shared(spec: BucketSpec, rate: Optional[float]) -> BucketSpec:
+        """行里记录的共享速率优先于本进程的 spec.rate。"""
+        return dataclasses.replace(spec, rate=rate) if rate else spec
+
+    def _transaction(self, key: str, spec: BucketSpec, update, rate: Optional[float] = None) -> Optional[float]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT requests, tokens, updated, rate FROM buckets WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None:
+                row = (spec.burst, spec.token_capacity, now, spec.rate)
+            spec = self._shared(spec, row[3])
+            requests, tokens, wait = update(row[0], row[1], max(0.0, now - row[2]), spec)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, requests, tokens, updated, rate) VALUES (?, ?, ?, ?, ?)",
+                (key, requests, tokens, now, spec.rate if rate is None else rate),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def take(self, key: str, spec: BucketSpec, cost: float) -> float:
+        return self._transaction(key, spec, lambda r, t, elapsed, shared: _refill_and_take(r, t, elapsed, shared, cost))
+
+    def refund(self, key: str, spec: BucketSpec, tokens: float, requests: float = 0) -> None:
+        # 先按经过时间回填再结算，和 take 的口径一致
+        def update(r, t, elapsed, shared):
+            r, t = _refill(r, t, elapsed, shared)
+            return min(shared.burst, r + requests), min(shared.token_capacity, t + tokens), None
+        self._transaction(key, spec, update)
+
+    def set_rate(self, key: str, spec: BucketSpec) -> None:
+        # 先按旧速率回填到现在，之后按新速率回填
+        def update(r, t, elapsed, shared):
+            r, t = _refill(r, t, elapsed, shared)
+            return r, t, None
+        self._transaction(key, spec, update, rate=spec.rate)
+
+    def get_rate(self, key: str) -> Optional[float]:
+        row = self._conn().execute("SELECT rate FROM buckets WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def next_free(self, key: str, spec: BucketSpec) -> float:
+        row = self._conn().execute("SELECT requests, updated, rate FROM buckets WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return 0.0
+        return _next_free(row[0], max(0.0, time.time() - row[1]), self._shared(spec, row[2]))
+
+
+_BACKENDS: Dict[str, LimiterBackend] = {}
+
+
+def get_backend(name: str, path: str = "") -> Optional[LimiterBackend]:
+    """按名字取进程内单例后端：memory（返回 None，由 limiter 自建）/ sqlite。"""
+    if name in ("", "memory"):
+        return None
+    if name == "sqlite":
+        backend = _BACKENDS.get(path)
+        if backend is None:
+            backend = _BACKENDS[path] = SqliteLimiterBackend(path)
+        return backend
+    raise ValueError(f"unknown limiter backend: {name}")
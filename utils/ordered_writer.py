@@ -0,0 +1,174 @@
+import json
+import os
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class OrderedFileWriter:
+    """
+    按原文件顺序流式写出 chunk 结果（job_progress.ProgressSink）：
+    - 结果乱序到达，有序前缀一旦连续就立即写入目标文件；
+    - 重排缓冲超过 max_buffer 个字符后，新的乱序结果溢写到 <path>.spill，内存只保留偏移；
+    - 每隔 commit_interval 秒 fsync 一次，并把已写入的 chunk 数和字节数原子地记到 <path>.progress；
+      进程崩溃后用同一个 key 重新打开，会截掉未提交的尾部并从 resume_from 继续；
+    - index=True 时在 <path>.index 中记录每个 chunk 的结束偏移，可以用 read 按 chunk 序号读回已写入的结果。
+    """
+
+    owns_output = True   # 结果由 writer 落盘，send_tasks 不必再把全文放进 MainState.result
+
+    def __init__(self, path: str, *, key: str, max_buffer: int = 64 << 20, commit_interval: float = 1.0,
+                 index: bool = False):
+        self.path = path
+        self.key = key
+        self.max_buffer = max_buffer
+        self.commit_interval = commit_interval
+        self.total: Optional[int] = None
+        self.spilled = 0    # 溢写过的 chunk 数
+
+        self._state_path = path + ".progress"
+        self._spill_path = path + ".spill"
+        self._index_path = path + ".index" if index else None
+        self._buffer: Dict[int, str] = {}
+        self._buffered = 0
+        self._spill_index: Dict[int, Tuple[int, int]] = {}   # index -> (offset, length)
+        self._spill = None
+        self._last_commit = 0.0
+
+        state = self._load_state()
+        if not os.path.exists(path) or os.path.getsize(path) < state["offset"]:
+            # 输出文件被删除或截短：进度作废
+            state = {"next": 0, "offset": 0}
+        if index and (not os.path.exists(self._index_path) or os.path.getsize(self._index_path) < state["next"] * 8):
+            # 索引缺失或不完整：已写入的 chunk 无法按序号读回，进度作废
+            state = {"next": 0, "offset": 0}
+        self.next, self.offset = state["next"], state["offset"]
+        self.total = state.get("total")
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "r+b" if os.path.exists(path) else "wb")
+        # 丢弃上次崩溃前写入但未提交的部分
+        self._file.truncate(self.offset)
+        self._file.seek(self.offset)
+        self._index = None
+        if index:
+            self._index = open(self._index_path, "r+b" if os.path.exists(self._index_path) else "wb")
+            self._index.truncate(self.next * 8)
+            self._index.seek(self.next * 8)
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self._state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if state.get("key") != self.key:
+            # 没有进度记录或属于另一个任务：从头写
+            return {"next": 0, "offset": 0}
+        return state
+
+    @property
+    def resume_from(self) -> int:
+        """此前已提交的 chunk 数，这些 chunk 不需要再跑。"""
+        return self.next
+
+    @property
+    def complete(self) -> bool:
+        return self.total is not None and self.next >= self.total
+
+    def set_total(self, total: int) -> None:
+        self.total = total
+
+    def put(self, index: int, sql: str) -> bool:
+        """收下第 index 个 chunk 的结果；重复上报（已写入或已缓冲）时忽略并返回 False。"""
+        if index < self.next or index in self._buffer or index in self._spill_index:
+            return False
+        if index != self.next:
+            self._hold(index, sql)
+            return True
+
+        self._write(sql)
+        while True:
+            if self.next in self._buffer:
+                sql = self._buffer.pop(self.next)
+                self._buffered -= len(sql)
+            elif self.next in self._spill_index:
+                sql = self._read_spill(self.next)
+            else:
+                break
+            self._write(sql)
+
+        if time.monotonic() - self._last_commit >= self.commit_interval:
+            self.commit()
+        return True
+
+    def _hold(self, index: int, sql: str) -> None:
+        if self._buffered + len(sql) <= self.max_buffer:
+            self._buffer[index] = sql
+            self._buffered += len(sql)
+            return
+        if self._spill is None:
+            self._spill = open(self._spill_path, "w+b")
+        data = sql.encode("utf-8")
+        self._spill.seek(0, os.SEEK_END)
+        self._spill_index[index] = (self._spill.tell(), len(data))
+        self._spill.write(data)
+        self.spilled += 1
+
+    def _read_spill(self, index: int) -> str:
+        offset, length = self._spill_index.pop(index)
+        self._spill.seek(offset)
+        return self._spill.read(length).decode("utf-8")
+
+    def _write(self, sql: str) -> None:
+        data = sql.encode("utf-8")
+        self._file.write(data)
+        self.offset += len(data)
+        self.next += 1
+        if self._index is not None:
+            self._index.write(struct.pack("<q", self.offset))
+
+    def read(self, start: int, stop: int) -> List[str]:
+        """读回第 start 到 stop - 1 个已写入的 chunk（需要 index=True）。"""
+        stop = min(stop, self.next)
+        if start >= stop:
+            return []
+        if not self._file.closed:
+            self._file.flush()
+            self._index.flush()
+        # 第 i 个 chunk 位于 [ends[i - 1], ends[i])，第 0 个从 0 开始
+        with open(self._index_path, "rb") as ix, open(self.path, "rb") as f:
+            first = max(start - 1, 0)
+            ix.seek(first * 8)
+            offsets = list(struct.unpack(f"<{stop - first}q", ix.read((stop - first) * 8)))
+            if start == 0:
+                offsets.insert(0, 0)
+            f.seek(offsets[0])
+            data = f.read(offsets[-1] - offsets[0])
+        base = offsets[0]
+        return [data[a - base:b - base].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+
+    def commit(self) -> None:
+        """把已写入的有序前缀刷到磁盘，再原子地更新进度文件。"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if self._index is not None:
+            self._index.flush()
+            os.fsync(self._index.fileno())
+        tmp = self._state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "next": self.next, "offset": self.offset, "total": self.total}, f)
+        os.replace(tmp, self._state_path)
+        self._last_commit = time.monotonic()
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self.commit()
+        self._file.close()
+        if self._index is not None:
+            self._index.close()
+        if self._spill is not None:
+            self._spill.close()
+            os.remove(self._spill_path)
+            self._spill = None
@@ -0,0 +1,107 @@
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+
+
+@dataclass
+class PrefixCacheStats:
+    """一个任务（共享前缀相同的一组调用）的服务端前缀缓存命中情况。"""
+    calls: int = 0
+    hits: int = 0               # cached_tokens > 0 的调用数
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    hit_seconds: float = 0.0    # 命中调用的纯调用耗时（不含排队、限流）
+    miss_seconds: float = 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        """按 token 计的命中率：输入 token 中由前缀缓存提供的比例。"""
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    @property
+    def saved_seconds(self) -> float:
+        """按未命中调用的平均耗时估算命中调用节省的时间；没有未命中样本时无法估算，记为 0。"""
+        misses = self.calls - self.hits
+        if not self.hits or not misses:
+            return 0.0
+        return self.hits * (self.miss_seconds / misses) - self.hit_seconds
+
+    def add(self, prompt_tokens: int, cached_tokens: int, seconds: float) -> None:
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        if cached_tokens:
+            self.hits += 1
+            self.hit_seconds += seconds
+        else:
+            self.miss_seconds += seconds
+
+    def merge(self, other: "PrefixCacheStats") -> None:
+        for name in self.__dataclass_fields__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def snapshot(self) -> dict:
+        return {"calls": self.calls, "hits": self.hits, "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens, "hit_ratio": round(self.hit_ratio, 4),
+                "est_saved_seconds": round(self.saved_seconds, 2)}
+
+
+def usage(message) -> Tuple[int, int]:
+    """
+    从 LLM 返回的 AIMessage 取 (输入 token, 命中缓存的输入 token)。
+    langchain_openai 把 usage.prompt_tokens_details.cached_tokens 映射为 input_token_details.cache_read；
+    服务端不返回时为 0。
+    """
+    meta = getattr(message, "usage_metadata", None) or {}
+    details = meta.get("input_token_details") or {}
+    return meta.get("input_tokens", 0) or 0, details.get("cache_read", 0) or 0
+
+
+_current: contextvars.ContextVar[Optional[PrefixCacheStats]] = contextvars.ContextVar("prefix_cache", default=None)
+
+
+@contextmanager
+def tracking(stats: PrefixCacheStats) -> Iterator[PrefixCacheStats]:
+    """在 with 块内完成的 LLM 调用（含调用层重试）把 usage 记到 stats 上。"""
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def record(message, seconds: float) -> None:
+    """由 LLM 客户端在每次调用成功后调用；不在 tracking 块内时忽略。"""
+    stats = _current.get()
+    if stats is not None:
+        stats.add(*usage(message), seconds)
+
+
+class PrefixCacheRegistry:
+    """按 job_id 保存统计，只保留最近 max_jobs 个任务（服务端长期运行时不无限增长）。"""
+
+    def __init__(self, max_jobs: int = 1024):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, PrefixCacheStats]" = OrderedDict()
+
+    def get(self, job_id: str) -> PrefixCacheStats:
+        stats = self._jobs.get(job_id)
+        if stats is None:
+            stats = self._jobs[job_id] = PrefixCacheStats()
+            if len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        else:
+            self._jobs.move_to_end(job_id)
+        return stats
+
+    def combined(self, job_ids: Iterable[str]) -> PrefixCacheStats:
+        total = PrefixCacheStats()
+        for job_id in dict.fromkeys(job_ids):
+            if job_id in self._jobs:
+                total.merge(self._jobs[job_id])
+        return total
+
+    def snapshot(self) -> dict:
+        return self.combined(self._jobs).snapshot()
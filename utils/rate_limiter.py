@@ -1,10 +1,14 @@
 import asyncio
+import dataclasses
 import time
 from collections import deque
 from dataclasses import dataclass
 from functools import wraps
 from typing import  Any, Callable, Dict, TypeVar, Awaitable, Deque, Optional
 
+from .fair_queue import FairQueue
+from .limiter_backend import BucketSpec, LimiterBackend, MemoryLimiterBackend
+
 
 T = TypeVar("T")
 
@@ -13,6 +17,10 @@ class _LimiterKey:
     qpm: float
     fifo: bool
     scope: str  # 用于共享/隔离 limiter
+    mode: str = "strict"
+    burst: int = 1
+    tpm: float = 0
+    backend: Any = None
 
 
 class _ExclusiveRateLimiter:
@@ -38,31 +46,62 @@ class _ExclusiveRateLimiter:
         self._queue_lock = asyncio.Lock()
         self._pump_task: Optional[asyncio.Task[None]] = None
 
-    async def acquire(self) -> None:
+        # 正在睡到 _next_time 的那一方（非 FIFO 为持锁的调用，FIFO 为泵）；cancel 退还名额时提前唤醒它
+        self._wake: Optional[asyncio.Future[None]] = None
+
+    def set_rate(self, qpm: float) -> None:
+        if qpm <= 0:
+            raise ValueError("qpm must be > 0")
+        self.interval = 60.0 / float(qpm)
+
+    def next_free(self) -> float:
+        """下一次放行还要等多少秒（不含已在 FIFO 队列中等待的调用）。"""
+        return max(0.0, self._next_time - time.monotonic())
+
+    async def acquire(self) -> float:
+        """等到放行，返回放行时刻（供 cancel 退还名额）。"""
         if not self.fifo:
-            await self._acquire_non_fifo()
-        else:
-            await self._acquire_fifo()
+            return await self._acquire_non_fifo()
+        return await self._acquire_fifo()
 
-    async def _acquire_non_fifo(self) -> None:
-        async with self._lock:
+    async def cancel(self, slot: float) -> None:
+        """
+        放行后的调用没有到达服务端（例如连接失败）时退还名额：在它之后还没有其他调用放行，
+        就把下一次放行时刻退回到它的放行时刻，等待中的调用（或它的重试）不必再多等一个间隔。
+        已有调用在它之后放行时不退还，实际发出的请求之间仍然至少间隔 interval。
+        """
+        if self._next_time != slot + self.interval:
+            return
+        self._next_time = slot
+        if self._wake is not None and not self._wake.done():
+            self._wake.set_result(None)
+
+    async def _wait_turn(self) -> float:
+        """睡到 _next_time（期间 cancel 提前了 _next_time 则提前醒来），返回放行时刻。"""
+        while True:
             now = time.monotonic()
-            if now < self._next_time:
-                await asyncio.sleep(self._next_time - now)
-                now = time.monotonic()
+            if now >= self._next_time:
+                return now
+            self._wake = asyncio.get_running_loop().create_future()
+            await asyncio.wait([self._wake], timeout=self._next_time - now)
+
+    async def _acquire_non_fifo(self) -> float:
+        async with self._lock:
+            now = await self._wait_turn()
             # “严格节流”：每次放行都推进 next_time
-            self._next_time = max(now, self._next_time) + self.interval
+            self._next_time = now + self.interval
+            return now
 
-    async def _acquire_fifo(self) -> None:
+    async def _acquire_fifo(self) -> float:
         loop = asyncio.get_running_loop()
-        fut: asyncio.Future[None] = loop.create_future()
+        fut: asyncio.Future[float] = loop.create_future()
 
         async with self._queue_lock:
             self._queue.append(fut)
             if self._pump_task is None or self._pump_task.done():
                 self._pump_task = asyncio.create_task(self._pump())
 
-        await fut  # 等待轮到自己
+        return await fut  # 等待轮到自己，结果为放行时刻
 
     async def _pump(self) -> None:
         """
@@ -75,10 +114,7 @@ class _ExclusiveRateLimiter:
                 fut = self._queue[0]
 
             # 严格按 next_time 节流
-            now = time.monotonic()
-            if now < self._next_time:
-                await asyncio.sleep(self._next_time - now)
-                now = time.monotonic()
+            now = await self._wait_turn()
 
             # 唤醒队首（若它已取消/完成则弹掉继续）
             async with self._queue_lock:
@@ -88,13 +124,96 @@ class _ExclusiveRateLimiter:
                 self._queue.popleft()
 
             if not fut.done():
-                fut.set_result(None)
+                fut.set_result(now)
 
-            self._next_time = max(now, self._next_time) + self.interval
+            self._next_time = now + self.interval
+
+
+class _TokenBucketLimiter:
+    """
+    令牌桶：请求桶容量 burst、按 qpm/60 每秒回填，额度未用完时不等待；
+    可选 token 桶（tpm>0）：调用前按估算值预扣，调用后用实际用量结算（多退少补，可欠账）。
+    桶状态存放在 backend 中（默认进程内；SqliteLimiterBackend 可让多个进程共享同一个桶）。
+    每次调用先预约再按返回的时间睡眠，预约顺序即放行顺序，天然 FIFO。
+    """
+    def __init__(self, qpm: float, burst: int = 1, tpm: float = 0,
+                 backend: Optional[LimiterBackend] = None, key: str = "global"):
+        if qpm <= 0:
+            raise ValueError("qpm must be > 0")
+        if burst < 1:
+            raise ValueError("burst must be >= 1")
+
+        self.spec = BucketSpec(rate=float(qpm) / 60.0, burst=float(burst),
+                               token_rate=float(tpm) / 60.0, token_capacity=float(tpm))
+        self.backend = backend or MemoryLimiterBackend()
+        self.key = key
+
+    def set_rate(self, qpm: float) -> None:
+        """
+        调整请求回填速率（供自适应控制使用），容量与 token 预算不变。
+        速率同时写入 backend：共享后端的所有进程按同一速率回填，降速对它们同时生效。
+        """
+        if qpm <= 0:
+            raise ValueError("qpm must be > 0")
+        rate = float(qpm) / 60.0
+        if rate == self.spec.rate:
+            # 例如 attach 时设为初始速率：不覆盖其他进程已写入的共享速率
+            return
+        self.spec = dataclasses.replace(self.spec, rate=rate)
+        self.backend.set_rate(self.key, self.spec)
+
+    def shared_rate(self) -> Optional[float]:
+        """
+        共享后端记录的当前速率（qpm），例如其他进程或上次运行自适应降速后写入的值；没有记录时返回 None。
+        同时以它为本 limiter 的速率，之后 set_rate 与它比较是否变化。
+        """
+        rate = self.backend.get_rate(self.key)
+        if not rate:
+            return None
+        self.spec = dataclasses.replace(self.spec, rate=rate)
+        return rate * 60.0
+
+    def next_free(self) -> float:
+        """下一个请求名额还要等多少秒（共享后端时是所有进程合计的排队结果）。"""
+        return self.backend.next_free(self.key, self.spec)
+
+    async def _call(self, fn, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def acquire(self, cost: int = 0) -> int:
+        """预扣 1 个请求和 cost 个 token，返回实际预扣的 token 数（供 settle 结算）。"""
+        # 单次超过整桶容量的调用只要求桶满，否则永远等不到
+        cost = min(float(cost), self.spec.token_capacity) if self.spec.token_rate else 0.0
+        wait = await self._call(self.backend.take, self.key, self.spec, cost)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return int(cost)
+
+    async def settle(self, reserved: int, actual: Optional[int]) -> None:
+        """用实际 token 用量结算预扣值；actual 为 None（拿不到用量）时按预扣值计。"""
+        if not self.spec.token_rate or actual is None or actual == reserved:
+            return
+        await self._call(self.backend.refund, self.key, self.spec, reserved - actual)
+
+    async def cancel(self, reserved: int) -> None:
+        """调用未被服务端计数（例如 429 / 连接失败）时退还本次预约的请求名额和 token，重试不重复占用。"""
+        await self._call(self.backend.refund, self.key, self.spec, float(reserved) if self.spec.token_rate else 0.0, 1.0)
 
 
 # 全局 registry：支持“同 key 共享同 limiter”
-_LIMITERS: Dict[_LimiterKey, _ExclusiveRateLimiter] = {}
+_LIMITERS: Dict[_LimiterKey, Any] = {}
+
+
+def _new_limiter(key: _LimiterKey):
+    if key.mode == "bucket":
+        return _TokenBucketLimiter(qpm=key.qpm, burst=key.burst, tpm=key.tpm, backend=key.backend, key=key.scope)
+    if key.backend is not None:
+        raise ValueError("backend requires mode='bucket'")
+    if key.mode == "strict":
+        return _ExclusiveRateLimiter(qpm=key.qpm, fifo=key.fifo)
+    raise ValueError(f"unknown limiter mode: {key.mode}")
 
 
 def rate_limited(
@@ -103,37 +222,85 @@ def rate_limited(
     fifo: bool = False,
     scope: str = "global",
     shared: bool = False,
+    mode: str = "strict",
+    burst: int = 1,
+    tpm: float = 0,
+    cost: Optional[Callable[..., int]] = None,
+    usage: Optional[Callable[[Any], Optional[int]]] = None,
+    backend: Optional[LimiterBackend] = None,
+    refund: Optional[Callable[[BaseException], bool]] = None,
+    gate: Optional[FairQueue] = None,
 ) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
     """
-    装饰器：限制被装饰 async 函数的调用速率（严格 QPM，无 burst）。
+    装饰器：限制被装饰 async 函数的调用速率。
 
     参数：
     - qpm: 每分钟允许次数
-    - fifo: True = 严格 FIFO；False = 非 FIFO（更轻量）
+    - fifo: True = 严格 FIFO；False = 非 FIFO（更轻量）。bucket 模式始终 FIFO
     - scope: 用于共享/隔离 limiter 的命名空间（例如 "search-api" / "llm"）
-    - shared: True = 相同 (qpm,fifo,scope) 的函数共享同一个 limiter
+    - shared: True = 相同 (qpm,fifo,scope,...) 的函数共享同一个 limiter
               False = 每个被装饰函数独立 limiter
+    - mode: "strict" = 严格 QPM，无 burst；"bucket" = 令牌桶，允许 burst 次突发
+    - tpm: bucket 模式下每分钟 token 预算，0 表示不限
+    - cost: (*args, **kwargs) -> 本次调用预估 token 数，调用前预扣
+    - usage: (result) -> 实际 token 数，调用后结算；返回 None 表示按预估计
+    - backend: bucket 模式的桶状态后端，默认进程内；传入 SqliteLimiterBackend 时
+               所有进程中 scope 相同的 limiter 共用一个桶
+    - refund: (exception) -> 是否退还本次名额，用于没有计入服务端配额的失败（例如连接失败）；
+              strict 模式只在之后还没有其他调用放行时退还
+    - gate: 限流器前的加权公平队列，按 fair_queue.tenant 设置的 tenant / 优先级排队，并限制每个 tenant 的在途调用数
     """
     if qpm <= 0:
         raise ValueError("qpm must be > 0")
 
     def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        key = _LimiterKey(qpm=qpm, fifo=fifo, scope=scope, mode=mode, burst=burst, tpm=tpm, backend=backend)
         if shared:
-            key = _LimiterKey(qpm=qpm, fifo=fifo, scope=scope)
             limiter = _LIMITERS.get(key)
             if limiter is None:
-                limiter = _ExclusiveRateLimiter(qpm=qpm, fifo=fifo)
+                limiter = _new_limiter(key)
                 _LIMITERS[key] = limiter
         else:
-            limiter = _ExclusiveRateLimiter(qpm=qpm, fifo=fifo)
+            limiter = _new_limiter(key)
+
+        async def limited(*args: Any, **kwargs: Any) -> T:
+            # reserved：strict 模式为放行时刻，bucket 模式为预扣的 token 数；refund 认可的失败凭它退还名额
+            reserved = await _acquire(args, kwargs)
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if refund is not None and refund(e):
+                    await limiter.cancel(reserved)
+                raise
+            if isinstance(limiter, _TokenBucketLimiter):
+                await limiter.settle(reserved, usage(result) if usage else None)
+            return result
+
+        async def _acquire(args: tuple, kwargs: dict) -> Any:
+            # cost 也在 try 内计算：它抛错时同样要让 gate 放下一个，否则公平队列停在“派发中”
+            try:
+                if isinstance(limiter, _TokenBucketLimiter):
+                    return await limiter.acquire(cost(*args, **kwargs) if cost else 0)
+                return await limiter.acquire()
+            finally:
+                if gate is not None:
+                    gate.dispatched()
 
         @wraps(func)
         async def wrapper(*args: Any, **kwargs: Any) -> T:
             # 这里调用 get_running_loop，确保不会在 import 阶段触发事件循环错误
             _ = asyncio.get_running_loop()
-            await limiter.acquire()
-            return await func(*args, **kwargs)
+            if gate is None:
+                return await limited(*args, **kwargs)
+
+            tid = await gate.enter()
+            try:
+                return await limited(*args, **kwargs)
+            finally:
+                gate.release(tid)
 
+        # 暴露给 adaptive_rate.controlled 等外层装饰器调整速率
+        wrapper.limiter = limiter
         return wrapper
 
-    return decorator
\ No newline at end of file
+    return decorator
@@ -0,0 +1,203 @@
+import asyncio
+import contextvars
+import random
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 错误分类
+THROTTLE = "throttle"              # 429：服务端限流
+TRANSIENT = "transient"            # 网络错误 / 超时 / 5xx
+BAD_REQUEST = "bad_request"        # 其他 4xx（鉴权、参数错误等），重试没有意义
+CONTENT_FILTER = "content_filter"  # 内容安全拦截
+PARSE = "parse"                    # 结构化输出解析失败
+UNKNOWN = "unknown"
+
+# 按类名匹配，避免强依赖 openai / httpx / langchain 的异常类型
+_TRANSIENT_ERRORS = {
+    "APIConnectionError", "APITimeoutError", "InternalServerError",
+    "ConnectError", "ConnectTimeout", "ReadTimeout", "RemoteProtocolError", "TimeoutError",
+}
+_PARSE_ERRORS = {"OutputParserException", "ValidationError", "JSONDecodeError"}
+_CONTENT_FILTER_MARKERS = ("data_inspection_failed", "content_filter", "inappropriate content", "content_policy")
+# 请求根本没有被服务端处理的类别：对应的限流名额可以退还
+_NOT_COUNTED = {THROTTLE}
+# 连接阶段就失败的错误：请求没有发到服务端（openai 的 APIConnectionError 按 __cause__ 判断）
+_NOT_SENT_ERRORS = {"ConnectError", "ConnectTimeout", "ConnectionRefusedError"}
+
+
+def status_code(e: BaseException) -> Optional[int]:
+    code = getattr(e, "status_code", None)
+    if code is None:
+        code = getattr(getattr(e, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(e: BaseException) -> Optional[float]:
+    """从异常携带的响应头中取建议等待秒数：Retry-After / retry-after-ms / x-ratelimit-reset-requests。"""
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+        reset = headers.get("x-ratelimit-reset-requests")
+        if reset and reset.endswith("ms"):
+            return float(reset[:-2]) / 1000.0
+        if reset and reset.endswith("s"):
+            return float(reset[:-1])
+    except ValueError:
+        return None
+    return None
+
+
+def classify(e: BaseException) -> str:
+    name = type(e).__name__
+    code = status_code(e)
+    if code == 429 or name == "RateLimitError":
+        return THROTTLE
+    if any(m in str(e).lower() for m in _CONTENT_FILTER_MARKERS):
+        return CONTENT_FILTER
+    if name in _PARSE_ERRORS:
+        return PARSE
+    if (code is not None and code >= 500) or name in _TRANSIENT_ERRORS or isinstance(e, (ConnectionError, asyncio.TimeoutError)):
+        return TRANSIENT
+    if code is not None and 400 <= code < 500:
+        return BAD_REQUEST
+    return UNKNOWN
+
+
+def _has_rate_limit_headers(e: BaseException) -> bool:
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if not headers:
+        return False
+    return any(k.lower() in ("retry-after", "retry-after-ms") or k.lower().startswith("x-ratelimit-") for k in headers)
+
+
+def not_sent(e: BaseException) -> bool:
+    """请求是否确定没有到达服务端（连接失败 / 连接超时），这类失败不会计入服务端配额。"""
+    seen = set()
+    while e is not None and id(e) not in seen:
+        if type(e).__name__ in _NOT_SENT_ERRORS:
+            return True
+        seen.add(id(e))
+        e = e.__cause__
+    return False
+
+
+def not_counted(e: BaseException) -> bool:
+    """
+    失败的这次调用是否未被服务端计入配额（可退还本地限流名额）：没有发出的请求，以及不计入配额的 429。
+    带 Retry-After / x-ratelimit-* 头的 429 说明服务端在按配额记账，这类拒绝可能已计入 RPM / TPM，不退还。
+    """
+    return not_sent(e) or (classify(e) in _NOT_COUNTED and not _has_rate_limit_headers(e))
+
+
+@dataclass(frozen=True)
+class RetryRule:
+    attempts: int             # 该类错误单次调用内的最大尝试次数（含首次），1 表示不重试
+    base_delay: float = 1.0   # 指数退避的起始等待
+    max_delay: float = 30.0
+    shared: bool = True       # 重试是否消耗 chunk 的共享尝试预算（ChunkState.limiter）
+
+
+class AttemptBudget:
+    """一个 chunk 的剩余尝试次数，调用层重试和图层重试共用。"""
+
+    def __init__(self, remaining: int):
+        self.remaining = remaining
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+_budget: contextvars.ContextVar[Optional[AttemptBudget]] = contextvars.ContextVar("attempt_budget", default=None)
+
+
+@contextmanager
+def attempt_budget(remaining: int) -> Iterator[AttemptBudget]:
+    """在 with 块内发起的 LLM 调用，其重试都从这份预算里扣。"""
+    budget = AttemptBudget(remaining)
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+@dataclass
+class ClassCounter:
+    errors: int = 0     # 该类错误出现次数
+    retries: int = 0    # 因此重试的次数
+    gave_up: int = 0    # 放弃（不可重试 / 预算耗尽）的次数
+
+
+class RetryPolicy:
+    """
+    统一的重试策略：按错误分类决定是否重试、退避多久，并按类别计数。
+    - throttle 优先使用服务端给出的 Retry-After；
+    - shared=True 的类别每次重试还要从当前 chunk 的 AttemptBudget 扣一次；
+    - 放弃时在异常上打标记，外层再套一层 retrying 时不会重复重试同一个错误。
+    """
+
+    def __init__(self, rules: Dict[str, RetryRule]):
+        self.rules = {cls: rules.get(cls, RetryRule(attempts=1)) for cls in
+                      (THROTTLE, TRANSIENT, BAD_REQUEST, CONTENT_FILTER, PARSE, UNKNOWN)}
+        self.counters: Dict[str, ClassCounter] = {cls: ClassCounter() for cls in self.rules}
+
+    def _delay(self, cls: str, tries: int, e: BaseException) -> float:
+        rule = self.rules[cls]
+        wait = retry_after(e) if cls == THROTTLE else None
+        if wait is None:
+            wait = min(rule.max_delay, rule.base_delay * 2 ** (tries - 1))
+            wait *= random.uniform(0.5, 1.0)
+        return wait
+
+    def record(self, cls: str, *, retried: bool) -> None:
+        counter = self.counters[cls]
+        counter.errors += 1
+        if retried:
+            counter.retries += 1
+        else:
+            counter.gave_up += 1
+
+    def retrying(self, func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            tries: Counter = Counter()
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    if getattr(e, "_retry_gave_up", False):
+                        raise
+                    cls = classify(e)
+                    rule = self.rules[cls]
+                    tries[cls] += 1
+                    budget = _budget.get()
+                    if tries[cls] >= rule.attempts or (rule.shared and budget is not None and not budget.take()):
+                        self.record(cls, retried=False)
+                        try:
+                            e._retry_gave_up = True
+                        except AttributeError:
+                            pass
+                        raise
+                    self.record(cls, retried=True)
+                    await asyncio.sleep(self._delay(cls, tries[cls], e))
+
+        return wrapper
+
+    async def call(self, func: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        return await self.retrying(func)(*args, **kwargs)
+
+    def snapshot(self) -> dict:
+        return {cls: asdict(c) for cls, c in self.counters.items() if c.errors}
@@ -0,0 +1,174 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect
+from sqlglot.tokens import TokenType
+
+from . import validate_sql
+
+
+@dataclass
+class RuleSet:
+    """
+    规则翻译配置（对应 CONFIG.RULE_SETS 中的一项）。
+    type_map: sqlglot 类型名（DataType.Type 的 name）-> 目标类型；值为空串表示交给 sqlglot 按目标方言生成（保留精度）。
+              未列出的类型视为规则无法处理，交给 LLM。
+    extra_columns: 每张表末尾强制追加的字段 (name, type, comment)，例如 col_batch。
+    table_suffix: 表定义后的固定模板，例如 ROW FORMAT / STORED AS。
+    require_table_comment / require_column_comment: 缺少注释时交给 LLM（需要语义判断）。
+    """
+    type_map: Dict[str, str]
+    extra_columns: List[Tuple[str, str, str]] = field(default_factory=list)
+    table_suffix: str = ""
+    require_table_comment: bool = False
+    require_column_comment: bool = False
+
+
+class Unsupported(Exception):
+    """规则无法完整处理当前 chunk，原因作为异常信息。"""
+
+
+def _strip_storage_clauses(sql: str, dialect: str) -> str:
+    """
+    去掉表定义之后的源端存储参数：TABLESPACE xxx、WITH (...)。
+    在 token 层面处理，不会误删字符串和注释中的同名文本。
+    """
+    tokens = Dialect.get_or_raise(dialect or None)().tokenize(sql)
+    spans = []
+    depth = 0
+    i = 0
+    while i < len(tokens):
+        t = tokens[i]
+        if t.token_type == TokenType.L_PAREN:
+            depth += 1
+        elif t.token_type == TokenType.R_PAREN:
+            depth -= 1
+        elif depth == 0 and t.text.upper() == "TABLESPACE" and i + 1 < len(tokens):
+            spans.append((t.start, tokens[i + 1].end + 1))
+            i += 2
+            continue
+        elif (depth == 0 and t.token_type == TokenType.WITH and i + 1 < len(tokens)
+              and tokens[i + 1].token_type == TokenType.L_PAREN and i > 0
+              and tokens[i - 1].token_type == TokenType.R_PAREN):
+            j, d = i + 1, 0
+            while j < len(tokens):
+                if tokens[j].token_type == TokenType.L_PAREN:
+                    d += 1
+                elif tokens[j].token_type == TokenType.R_PAREN:
+                    d -= 1
+                    if d == 0:
+                        break
+                j += 1
+            if j >= len(tokens):
+                raise Unsupported("WITH (...) 未闭合")
+            spans.append((t.start, tokens[j].end + 1))
+            i = j + 1
+            continue
+        i += 1
+
+    out, last = [], 0
+    for start, end in spans:
+        out.append(sql[last:start])
+        last = end
+    out.append(sql[last:])
+    return "".join(out)
+
+
+def _quote(text: str) -> str:
+    return "'" + text.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _column_type(kind: exp.DataType, rules: RuleSet, dialect: str) -> str:
+    name = kind.this.name
+    if name not in rules.type_map:
+        raise Unsupported(f"类型 {kind.sql()} 不在规则映射中")
+    return rules.type_map[name] or kind.sql(dialect=dialect or None)
+
+
+def translate(sql: str, rules: RuleSet, *, source_dialect: str, destination_dialect: str,
+              target_schema: str = "") -> str:
+    """
+    用 sqlglot + 规则把 chunk 确定性地翻译为目标建表语句。
+    chunk 中只能包含 CREATE TABLE / COMMENT ON TABLE|COLUMN / CREATE INDEX（索引直接丢弃），
+    任何规则覆盖不到的情况都抛 Unsupported，由调用方交给 LLM。
+    """
+    try:
+        expressions = [e for e in sqlglot.parse(_strip_storage_clauses(sql, source_dialect), read=source_dialect or None)
+                       if e is not None]
+    except Unsupported:
+        raise
+    except Exception as e:
+        raise Unsupported(f"源 SQL 无法解析：{type(e).__name__}")
+
+    tables: Dict[str, dict] = {}
+    for e in expressions:
+        kind = str(e.args.get("kind") or "").upper()
+        if isinstance(e, exp.Create) and kind == "TABLE":
+            if not isinstance(e.this, exp.Schema) or e.args.get("expression") is not None:
+                raise Unsupported("CREATE TABLE 不是字段列表形式（如 CTAS / LIKE）")
+            table = e.this.this
+            columns = []
+            for c in e.this.expressions:
+                if isinstance(c, exp.ColumnDef):
+                    if c.args.get("kind") is None:
+                        raise Unsupported(f"字段 {c.name} 没有类型")
+                    columns.append({"name": c.name, "kind": c.args["kind"],
+                                    "comment": " ".join(x.strip() for x in c.comments or [] if x.strip())})
+                elif not isinstance(c, exp.Constraint):
+                    raise Unsupported(f"无法处理的表元素 {type(c).__name__}")
+            tables[table.name.lower()] = {"name": table.name, "db": table.db, "columns": columns, "comment": ""}
+        elif isinstance(e, exp.Comment) and kind in ("TABLE", "COLUMN"):
+            target = e.this
+            table_name = (target.name if kind == "TABLE" else target.table).lower()
+            if table_name not in tables:
+                raise Unsupported(f"COMMENT ON 指向本 chunk 之外的表 {table_name}")
+            text = e.expression.name if isinstance(e.expression, exp.Literal) else ""
+            if kind == "TABLE":
+                tables[table_name]["comment"] = text
+            else:
+                column = next((c for c in tables[table_name]["columns"] if c["name"].lower() == target.name.lower()), None)
+                if column is None:
+                    raise Unsupported(f"COMMENT ON COLUMN 指向不存在的字段 {target.name}")
+                column["comment"] = text
+        elif isinstance(e, exp.Create) and kind == "INDEX":
+            continue
+        else:
+            raise Unsupported(f"无法处理的语句 {type(e).__name__} {kind}".strip())
+
+    if not tables:
+        raise Unsupported("chunk 中没有 CREATE TABLE")
+
+    statements = []
+    for table in tables.values():
+        if rules.require_table_comment and not table["comment"]:
+            raise Unsupported(f"表 {table['name']} 缺少表注释")
+
+        lines = []
+        names = set()
+        for c in table["columns"]:
+            if rules.require_column_comment and not c["comment"]:
+                raise Unsupported(f"字段 {table['name']}.{c['name']} 缺少注释")
+            line = f"    {c['name']} {_column_type(c['kind'], rules, destination_dialect)}"
+            if c["comment"]:
+                line += f" COMMENT {_quote(c['comment'])}"
+            lines.append(line)
+            names.add(c["name"].lower())
+        for name, type_, comment in rules.extra_columns:
+            if name.lower() not in names:
+                lines.append(f"    {name} {type_} COMMENT {_quote(comment)}")
+
+        schema = target_schema or table["db"]
+        ddl = f"CREATE TABLE {schema + '.' if schema else ''}{table['name']} (\n" + ",\n".join(lines) + "\n)"
+        if table["comment"]:
+            ddl += f"\nCOMMENT {_quote(table['comment'])}"
+        if rules.table_suffix:
+            ddl += "\n" + rules.table_suffix.strip()
+        statements.append(ddl + ";")
+
+    out = "\n\n".join(statements) + "\n\n"
+    e = validate_sql(out, destination_dialect)
+    if e:
+        raise Unsupported(f"规则输出未通过语法校验：{e}")
+    return out
@@ -0,0 +1,211 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Generic, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+@dataclass
+class ScheduledItem(Generic[T]):
+    index: int        # 在输入中的原始位置，用于按序回填结果
+    payload: T
+    size: int = 0     # 用于 largest_first 排序（例如 chunk 的字符数）
+    attempts: int = 0  # 已失败次数，用于 retry_first 排序
+
+
+@dataclass
+class SchedulerStats:
+    queued: int = 0       # 已从生成器取出、尚未开始执行的数量
+    in_flight: int = 0    # 正在执行的数量
+    done: int = 0
+    failed: int = 0
+    requeued: int = 0
+    exhausted: bool = False  # 生成器是否已取完
+    max_queued: int = 0
+    max_in_flight: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "done": self.done,
+            "failed": self.failed,
+            "requeued": self.requeued,
+        }
+
+
+# 排序策略：返回值越小越先执行。只在“预取窗口”内生效，保证生成器仍然是惰性消费的。
+ORDER_POLICIES: Dict[str, Callable[[ScheduledItem], Tuple]] = {
+    # 输入顺序
+    "input": lambda it: (it.index,),
+    # 大的先跑：近似 LPT，缩短整体 makespan
+    "largest_first": lambda it: (-it.size, it.index),
+    # 失败重排的优先：尽早暴露持续失败的 chunk，也让已有进度的 checkpoint 先收尾
+    "retry_first": lambda it: (-it.attempts, it.index),
+}
+
+
+@dataclass(order=True)
+class _Entry:
+    key: Tuple
+    seq: int
+    item: ScheduledItem = field(compare=False)
+
+
+class ChunkScheduler(Generic[T, R]):
+    """
+    有界 worker 池：
+    - 同时最多 concurrency 个任务在执行；
+    - 输入从可迭代对象（生成器）惰性读取，预取窗口最多 lookahead 个；
+    - 窗口内按 policy 排序；
+    - 失败的任务在 max_attempts 允许时重新入队。
+    结果按输入顺序返回；keep_results=False 时不保留结果（只通过 on_done 交出），返回空列表。
+    """
+
+    def __init__(
+        self,
+        worker: Callable[[T], Awaitable[R]],
+        *,
+        concurrency: int,
+        policy: str = "input",
+        lookahead: Optional[int] = None,
+        max_attempts: int = 1,
+        size_of: Callable[[T], int] = len,
+        on_done: Optional[Callable[[int, R, SchedulerStats], Any]] = None,
+        keep_results: bool = True,
+    ):
+        if concurrency <= 0:
+            raise ValueError("concurrency must be > 0")
+        if policy not in ORDER_POLICIES:
+            raise ValueError(f"unknown order policy: {policy}, expected one of {list(ORDER_POLICIES)}")
+        if max_attempts <= 0:
+            raise ValueError("max_attempts must be > 0")
+
+        self.worker = worker
+        self.concurrency = concurrency
+        self.policy = policy
+        self.lookahead = max(lookahead or concurrency * 4, concurrency)
+        self.max_attempts = max_attempts
+        self.size_of = size_of
+        self.on_done = on_done
+        self.keep_results = keep_results
+
+        self.stats = SchedulerStats()
+        self._key = ORDER_POLICIES[policy]
+        self._heap: List[_Entry] = []
+        self._seq = itertools.count()
+        self._source: Optional[Iterator[Tuple[int, T]]] = None
+        # 有任务在跑时，窗口可能因重排而再次变为非空，空闲 worker 需等待
+        self._changed: Optional[asyncio.Condition] = None
+        # 生成器不可并发 next()：同一时间只允许一个 worker 从中取
+        self._pulling: Optional[asyncio.Lock] = None
+
+        if policy == "retry_first" and max_attempts == 1:
+            logger.warning("[Scheduler] policy=retry_first 但 max_attempts=1：失败不会重排，效果与 input 相同")
+
+    def _push(self, item: ScheduledItem) -> None:
+        heapq.heappush(self._heap, _Entry(self._key(item), next(self._seq), item))
+        self.stats.queued = len(self._heap)
+        self.stats.max_queued = max(self.stats.max_queued, self.stats.queued)
+
+    async def _refill(self) -> None:
+        """
+        把预取窗口补到 lookahead 个。生成器可能在读文件、切分（iter_split_sql 等），
+        next() 放到线程里执行，不阻塞事件循环，也不持有 _changed；同一时间只有一个 worker 在取。
+        """
+        if self._pulling.locked():
+            return
+        async with self._pulling:
+            while not self.stats.exhausted and len(self._heap) < self.lookahead:
+                nxt = await asyncio.to_thread(next, self._source, _END)
+                async with self._changed:
+                    if nxt is _END:
+                        self.stats.exhausted = True
+                    else:
+                        idx, payload = nxt
+                        self._push(ScheduledItem(index=idx, payload=payload, size=self.size_of(payload)))
+                    self._changed.notify_all()
+
+    def _pop(self) -> Optional[ScheduledItem]:
+        if not self._heap:
+            return None
+        item = heapq.heappop(self._heap).item
+        self.stats.queued = len(self._heap)
+        return item
+
+    async def _run_worker(self, results: Dict[int, R]) -> None:
+        while True:
+            await self._refill()
+            async with self._changed:
+                item = self._pop()
+                if item is None:
+                    # 窗口空且生成器取完：只有在仍有在途任务（可能重排）时才等待
+                    if self.stats.exhausted and self.stats.in_flight == 0:
+                        return
+                    # 其他 worker 正在取下一个 / 在途任务可能重排：等通知；否则回到循环开头自己去取
+                    if self.stats.exhausted or self._pulling.locked():
+                        await self._changed.wait()
+                    continue
+                self.stats.in_flight += 1
+                self.stats.max_in_flight = max(self.stats.max_in_flight, self.stats.in_flight)
+
+            try:
+                result = await self.worker(item.payload)
+            except Exception as e:
+                item.attempts += 1
+                async with self._changed:
+                    self.stats.in_flight -= 1
+                    if item.attempts < self.max_attempts:
+                        self.stats.requeued += 1
+                        logger.warning(f"[Scheduler] chunk #{item.index} 失败（第 {item.attempts} 次），重新入队：{e}")
+                        self._push(item)
+                        self._changed.notify_all()
+                        continue
+                    self.stats.failed += 1
+                    self._changed.notify_all()
+                raise
+
+            async with self._changed:
+                self.stats.in_flight -= 1
+                self.stats.done += 1
+                if self.keep_results:
+                    results[item.index] = result
+                self._changed.notify_all()
+            if self.on_done is not None:
+                self.on_done(item.index, result, self.stats)
+
+    async def run(self, items: Iterable[T]) -> List[R]:
+        self._source = iter(enumerate(items))
+        self._changed = asyncio.Condition()
+        self._pulling = asyncio.Lock()
+        results: Dict[int, R] = {}
+
+        workers = [asyncio.create_task(self._run_worker(results)) for _ in range(self.concurrency)]
+        try:
+            # 任一 worker 抛错即整体失败（与 gather 语义一致），其余 worker 取消
+            done, pending = await asyncio.wait(workers, return_when=asyncio.FIRST_EXCEPTION)
+            for t in done:
+                if t.exception() is not None:
+                    raise t.exception()
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            for t in workers:
+                if not t.done():
+                    t.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        logger.info(
+            f"[Scheduler] policy={self.policy}, concurrency={self.concurrency}, done={self.stats.done}, "
+            f"requeued={self.stats.requeued}, max_queued={self.stats.max_queued}, "
+            f"max_in_flight={self.stats.max_in_flight}"
+        )
+        return [results[i] for i in sorted(results)]
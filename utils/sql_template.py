@@ -0,0 +1,160 @@
+import asyncio
+import re
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect
+from sqlglot.tokens import Token, TokenType
+
+from . import stable_cache_key, validate_sql
+
+# 可能承载表名的 token：未加引号 / 加引号的标识符
+_NAME_TOKENS = {TokenType.VAR, TokenType.IDENTIFIER}
+
+
+@dataclass(frozen=True)
+class Structure:
+    key: str                      # 结构哈希：表名替换为占位符后的 token 序列哈希
+    tables: Tuple[str, ...]       # 按首次出现顺序的表名（不含 schema）
+    names: FrozenSet[str]         # 源 SQL 中出现的全部标识符
+
+
+def _tokenize(sql: str, dialect: str) -> List[Token]:
+    return Dialect.get_or_raise(dialect or None)().tokenize(sql)
+
+
+def _renamer(mapping: Dict[str, str]):
+    """
+    返回一个函数：把文本中出现的表名（包括 foo_pkey、foo_id 这类包含表名的标识符）按 mapping 替换。
+    长名优先，避免 foo 抢先匹配 foo_error；大小写不敏感（未加引号的标识符本身不区分大小写）。
+    """
+    lowered = {k.lower(): v for k, v in mapping.items()}
+    pattern = re.compile("|".join(re.escape(k) for k in sorted(lowered, key=len, reverse=True)), re.IGNORECASE)
+    return lambda text: pattern.sub(lambda m: lowered[m.group(0).lower()], text)
+
+
+def _names(tokens: List[Token]) -> FrozenSet[str]:
+    return frozenset(t.text.lower() for t in tokens if t.token_type in _NAME_TOKENS)
+
+
+def structure_of(sql: str, dialect: str = "") -> Optional[Structure]:
+    """
+    将 chunk 中的表名替换为占位符后做结构哈希；不含 CREATE TABLE 或无法解析时返回 None。
+    结构相同（只有表名不同）的 chunk 可以复用同一份翻译结果。
+    """
+    try:
+        expressions = [e for e in sqlglot.parse(sql, read=dialect or None) if e is not None]
+        tokens = _tokenize(sql, dialect)
+    except Exception:
+        return None
+    if not any(isinstance(e, exp.Create) and str(e.args.get("kind", "")).upper() == "TABLE" for e in expressions):
+        return None
+
+    tables: List[str] = []
+    for e in expressions:
+        for t in e.find_all(exp.Table):
+            if t.name and t.name.lower() not in tables:
+                tables.append(t.name.lower())
+    if not tables:
+        return None
+
+    rename = _renamer({name: f"__table_{i}__" for i, name in enumerate(tables)})
+    parts = []
+    for token in tokens:
+        if token.token_type in _NAME_TOKENS:
+            text = rename(token.text).lower()
+        else:
+            text = token.text if token.token_type == TokenType.STRING else token.text.lower()
+        parts.append(f"{token.token_type.name}:{text}")
+        parts.extend(f"--:{c.strip()}" for c in token.comments)
+
+    return Structure(key=stable_cache_key("\x1f".join(parts)), tables=tuple(tables), names=_names(tokens))
+
+
+def instantiate(translated: str, representative: Structure, member: Structure, dialect: str = "") -> Optional[str]:
+    """
+    把代表 chunk 的翻译结果中的表名原地替换为成员 chunk 的表名，其余文本保持原样。
+    模板新增的标识符（例如 col_batch）在替换前后必须保持不变，否则放弃快速路径返回 None。
+    """
+    if representative.key != member.key or len(representative.tables) != len(member.tables):
+        return None
+    try:
+        tokens = _tokenize(translated, dialect)
+    except Exception:
+        return None
+
+    rename = _renamer(dict(zip(representative.tables, member.tables)))
+    out: List[str] = []
+    renamed_names = set()
+    last = 0
+    for token in tokens:
+        if token.token_type not in _NAME_TOKENS:
+            continue
+        renamed = rename(token.text)
+        renamed_names.add(renamed.lower())
+        out.append(translated[last:token.start])
+        out.append(rename(translated[token.start:token.end + 1]))
+        last = token.end + 1
+    out.append(translated[last:])
+
+    if renamed_names - member.names != _names(tokens) - representative.names:
+        return None
+    return "".join(out)
+
+
+class TemplateReuse:
+    """
+    同结构 chunk 只翻译一次：每个结构的第一个 chunk 作为代表走 translate，
+    其余成员等待代表完成后替换表名并校验；任一步失败则回退到 translate。
+    """
+
+    def __init__(self, source_dialect: str = "", destination_dialect: str = "",
+                 validate: Optional[Callable[[str, str], Awaitable[str]]] = None):
+        self.source_dialect = source_dialect
+        self.destination_dialect = destination_dialect
+        # 异步校验 (成员源 chunk, 替换后的译文) -> 错误信息，用于接入语法 + 结构校验；默认只同步调用 validate_sql
+        self.validate = validate
+        self.representatives = 0
+        self.fast_path = 0
+        self.fallback = 0
+        self._classes: Dict[str, Tuple[Structure, asyncio.Future]] = {}
+
+    async def _invalid(self, source: str, sql: str) -> str:
+        if self.validate is not None:
+            return await self.validate(source, sql)
+        e = validate_sql(sql, self.destination_dialect)
+        return str(e) if e else ""
+
+    async def run(self, sql: str, translate: Callable[[str], Awaitable[str]]) -> str:
+        member = structure_of(sql, self.source_dialect)
+        if member is None:
+            return await translate(sql)
+
+        entry = self._classes.get(member.key)
+        if entry is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._classes[member.key] = (member, fut)
+            self.representatives += 1
+            try:
+                result = await translate(sql)
+            except BaseException as e:
+                fut.set_exception(e)
+                fut.exception()  # 成员会各自回退，这里避免 "exception was never retrieved"
+                raise
+            fut.set_result(result)
+            return result
+
+        representative, fut = entry
+        try:
+            translated = await asyncio.shield(fut)
+        except Exception:
+            translated = ""
+        instance = instantiate(translated, representative, member, self.destination_dialect) if translated else None
+        if instance is not None and (not self.destination_dialect or not await self._invalid(sql, instance)):
+            self.fast_path += 1
+            return instance
+
+        self.fallback += 1
+        return await translate(sql)
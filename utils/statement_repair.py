@@ -0,0 +1,59 @@
+from typing import Dict, List, Optional
+
+from sqlglot.dialects.dialect import Dialect
+from sqlglot.tokens import TokenType
+
+from . import validate_sql
+
+
+def split_statements(sql: str, dialect: str = "") -> Optional[List[str]]:
+    """
+    按顶层分号把 SQL 切成语句，每段保留原文（含前导空白、注释和结尾分号），拼接后与原文完全一致。
+    tokenizer 无法处理（例如字符串未闭合）时返回 None。
+    """
+    try:
+        tokens = Dialect.get_or_raise(dialect or None)().tokenize(sql)
+    except Exception:
+        return None
+
+    statements = []
+    start = 0
+    depth = 0
+    for t in tokens:
+        if t.token_type == TokenType.L_PAREN:
+            depth += 1
+        elif t.token_type == TokenType.R_PAREN:
+            depth -= 1
+        elif t.token_type == TokenType.SEMICOLON and depth <= 0:
+            statements.append(sql[start:t.end + 1])
+            start = t.end + 1
+    if sql[start:].strip():
+        statements.append(sql[start:])
+    elif statements:
+        statements[-1] += sql[start:]
+    return statements
+
+
+def find_broken(statements: List[str], dialect: str) -> Dict[int, str]:
+    """逐条解析，返回 {语句下标: 报错}。"""
+    broken = {}
+    for i, statement in enumerate(statements):
+        e = validate_sql(statement, dialect)
+        if e:
+            broken[i] = str(e)
+    return broken
+
+
+def splice(statements: List[str], repaired: Dict[int, str]) -> str:
+    """把修复后的语句放回原位置，保留原语句的前导空白和结尾分号。"""
+    out = []
+    for i, statement in enumerate(statements):
+        if i not in repaired:
+            out.append(statement)
+            continue
+        lead = statement[:len(statement) - len(statement.lstrip())]
+        body = repaired[i].strip()
+        if statement.rstrip().endswith(";") and not body.endswith(";"):
+            body += ";"
+        out.append(lead + body + statement[len(statement.rstrip()):])
+    return "".join(out)
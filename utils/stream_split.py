@@ -0,0 +1,93 @@
+import codecs
+import hashlib
+import io
+import mmap
+import os
+import re
+from typing import BinaryIO, Iterator, TextIO, Union
+
+# 与 split_sql 相同的切分点规则
+_CREATE_TABLE_RE = re.compile(r"create\s+table", re.IGNORECASE)
+# 块末尾可能被截断的 "create\s+table" 前缀：这部分留到下一块再匹配
+_PARTIAL_RE = re.compile(r"c(?:r(?:e(?:a(?:t(?:e(?:\s+(?:t(?:a(?:b(?:l)?)?)?)?)?)?)?)?)?)?\Z", re.IGNORECASE)
+
+Source = Union[str, "os.PathLike[str]", BinaryIO, TextIO]
+
+
+def _read_blocks(source: Source, block_size: int, encoding: str, use_mmap: bool) -> Iterator[str]:
+    """按块产出文本。路径以文本模式读取（与 open(path).read() 一样做通用换行转换）。"""
+    if isinstance(source, (str, os.PathLike)):
+        if use_mmap and os.path.getsize(source) > 0:
+            with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+                for pos in range(0, len(mm), block_size):
+                    yield decoder.decode(mm[pos:pos + block_size])
+                yield decoder.decode(b"", final=True)
+            return
+        with open(source, "r", encoding=encoding) as f:
+            yield from iter(lambda: f.read(block_size), "")
+        return
+
+    # 已打开的流：字节流增量解码，文本流直接读
+    decoder = None
+    while True:
+        block = source.read(block_size)
+        if not block:
+            break
+        if isinstance(block, bytes):
+            if decoder is None:
+                decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+            block = decoder.decode(block)
+        yield block
+    if decoder is not None:
+        yield decoder.decode(b"", final=True)
+
+
+def text_digest(source: Source, *, block_size: int = 1 << 20, encoding: str = "utf-8") -> str:
+    """按块计算文本的 sha256，与 stable_cache_key(open(path).read()) 相同，不需要整文件读入内存。"""
+    h = hashlib.sha256()
+    for block in _read_blocks(source, block_size, encoding, False):
+        h.update(block.encode("utf-8"))
+    return h.hexdigest()
+
+
+def iter_split_sql(source: Source, *, block_size: int = 1 << 20, encoding: str = "utf-8",
+                   use_mmap: bool = False) -> Iterator[str]:
+    """
+    split_sql 的流式版本，输出与 split_sql(完整文本) 完全一致：
+    - 按块读取文件 / 字节流 / 文本流，切出一个 chunk 就产出一个，内存只保留当前未完成的 chunk；
+    - 切分点同样是每个 CREATE TABLE 左侧最近的 ';' 之后；跨块边界的 "create ... table" 由 _PARTIAL_RE 留到下一块匹配。
+    """
+    buf = ""
+    start = 0    # 当前 chunk 在 buf 中的起点
+    scan = 0     # buf 中已完成匹配的位置
+    semi = -1    # buf 中 scan 之前最近的 ';'
+
+    for block in _read_blocks(source, block_size, encoding, use_mmap):
+        if start:
+            # 已产出的部分丢弃
+            buf, scan, semi = buf[start:], scan - start, semi - start
+            start = 0
+        buf += block
+
+        pos = scan
+        for m in _CREATE_TABLE_RE.finditer(buf, scan):
+            s = buf.rfind(";", pos, m.start())
+            if s != -1:
+                semi = s
+            pos = m.end()
+            if semi >= start:
+                part = buf[start:semi + 1].strip()
+                if part:
+                    yield part
+                start = semi + 1
+
+        partial = _PARTIAL_RE.search(buf, pos)
+        scan = partial.start() if partial else len(buf)
+        s = buf.rfind(";", pos, scan)
+        if s != -1:
+            semi = s
+
+    last = buf[start:].strip()
+    if last:
+        yield last
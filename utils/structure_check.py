@@ -0,0 +1,211 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect
+from sqlglot.tokens import TokenType
+
+from .rule_translate import RuleSet, _strip_storage_clauses
+
+# 结构校验失败时 exception 的前缀，process_chunk 据此改为基于源 SQL 重新翻译
+PREFIX = "结构校验未通过"
+MAX_ISSUES = 20
+
+
+Tokens = List[Tuple[TokenType, str]]
+
+# 源 SQL 中出现这些存储参数时才需要先剔除（剔除要整段分词，代价与一次解析相当）
+_STORAGE_RE = re.compile(r"\btablespace\b|\bwith\s*\(", re.IGNORECASE)
+
+
+@dataclass
+class Table:
+    name: str
+    db: str
+    columns: List[Tuple[str, exp.DataType, bool]] = field(default_factory=list)   # (字段名, 类型, 是否有注释)
+    has_comment: bool = False
+    tokens: Tokens = field(default_factory=list)   # 所在语句的 token（检查模板子句用）
+
+
+def _table(e: Optional[exp.Expression]) -> Optional[Table]:
+    if not (isinstance(e, exp.Create) and str(e.args.get("kind") or "").upper() == "TABLE" and isinstance(e.this, exp.Schema)):
+        return None
+    t = Table(e.this.this.name, e.this.this.db, has_comment=e.find(exp.SchemaCommentProperty) is not None)
+    for c in e.this.expressions:
+        if isinstance(c, exp.ColumnDef) and c.args.get("kind") is not None:
+            commented = bool(c.comments) or c.find(exp.CommentColumnConstraint) is not None
+            t.columns.append((c.name, c.args["kind"], commented))
+    return t
+
+
+def _normalize(tokens) -> Tokens:
+    """去掉空白和注释、关键字大小写归一后的 token 序列，用于比较模板子句。"""
+    return [(t.token_type, t.text if t.token_type == TokenType.STRING else t.text.upper()) for t in tokens]
+
+
+def parse_tables(sql: str, dialect: str) -> List[Table]:
+    """
+    按出现顺序取出 CREATE TABLE（字段列表形式），COMMENT ON TABLE 计入表注释。
+    整段只分词、解析一次，语法错误时抛出与 validate_sql 相同的 sqlglot 异常。
+    """
+    d = Dialect.get_or_raise(dialect or None)()
+    tokens = d.tokenize(sql)
+    expressions = d.parser().parse(tokens, sql)
+    # 与 sqlglot Parser 相同的分段方式：每个分号一段，与 expressions 一一对应
+    chunks: List[list] = [[]]
+    for i, t in enumerate(tokens):
+        if t.token_type == TokenType.SEMICOLON:
+            if i < len(tokens) - 1:
+                chunks.append([])
+        else:
+            chunks[-1].append(t)
+
+    tables: List[Table] = []
+    for e, chunk in zip(expressions, chunks):
+        t = _table(e)
+        if t is not None:
+            t.tokens = _normalize(chunk)
+            tables.append(t)
+        elif isinstance(e, exp.Comment) and str(e.args.get("kind") or "").upper() == "TABLE":
+            for t in tables:
+                t.has_comment = t.has_comment or t.name.lower() == e.this.name.lower()
+    return tables
+
+
+def _contains(haystack: Tokens, needle: Tokens) -> bool:
+    n = len(needle)
+    return any(haystack[i:i + n] == needle for i in range(len(haystack) - n + 1))
+
+
+def _type_sql(kind: exp.DataType, dialect: str) -> str:
+    return kind.sql(dialect=dialect or None).upper().replace(" ", "")
+
+
+def check(source_sql: str, output_sql: str, *, source_dialect: str, destination_dialect: str,
+          rules: Optional[RuleSet] = None, target_schema: str = "") -> List[str]:
+    """
+    确定性地比较源 chunk 与翻译结果的结构，返回不一致之处（为空表示通过或无法比较）：
+    - 表集合、表顺序、重复的表；
+    - 每张表的字段集合与顺序（rules.extra_columns 必须追加在源字段之后）；
+    - rules.type_map 中列出的源类型，输出类型必须与映射一致（映射为空串时与 sqlglot 生成的目标类型一致）；
+    - target_schema 非空时输出表必须落在该 schema；
+    - rules.table_suffix 的每一行子句、require_table_comment / require_column_comment 要求的注释。
+    语法错误不在这里报告（validate_sql 负责）；源 SQL 无法解析或不含建表语句时不做比较。
+    """
+    try:
+        output = parse_tables(output_sql, destination_dialect)
+    except Exception:
+        return []
+    return compare(source_sql, output, source_dialect=source_dialect, destination_dialect=destination_dialect,
+                   rules=rules, target_schema=target_schema)
+
+
+def compare(source_sql: str, output: List[Table], *, source_dialect: str, destination_dialect: str,
+            rules: Optional[RuleSet] = None, target_schema: str = "") -> List[str]:
+    """check 的后半部分：output 为已解析的译文（parse_tables 的结果）。"""
+    try:
+        if _STORAGE_RE.search(source_sql):
+            source_sql = _strip_storage_clauses(source_sql, source_dialect)
+        source = parse_tables(source_sql, source_dialect)
+    except Exception:
+        return []
+    if not source:
+        return []
+
+    issues: List[str] = []
+    src_names = [t.name.lower() for t in source]
+    out_names = [t.name.lower() for t in output]
+    missing = [t.name for t in source if t.name.lower() not in out_names]
+    unexpected = [t.name for t in output if t.name.lower() not in src_names]
+    duplicated = sorted({n for n in out_names if out_names.count(n) > 1})
+    if missing:
+        issues.append(f"缺少表：{', '.join(missing)}")
+    if unexpected:
+        issues.append(f"多出源 SQL 中不存在的表：{', '.join(unexpected)}")
+    if duplicated:
+        issues.append(f"表重复输出：{', '.join(duplicated)}")
+    common = [n for n in out_names if n in src_names]
+    if not duplicated and common != [n for n in src_names if n in out_names]:
+        issues.append(f"表顺序与源 SQL 不一致，应为：{', '.join(t.name for t in source if t.name.lower() in out_names)}")
+
+    extra = [(name, type_) for name, type_, _ in rules.extra_columns] if rules else []
+    clauses = [line.strip() for line in (rules.table_suffix.splitlines() if rules else []) if line.strip()]
+    if clauses:
+        tokenizer = Dialect.get_or_raise(destination_dialect or None)()
+        suffix = [_normalize(tokenizer.tokenize(line)) for line in clauses]
+    by_name = {t.name.lower(): t for t in output}
+    for src in source:
+        out = by_name.get(src.name.lower())
+        if out is None:
+            continue
+        label = f"表 {src.name}"
+
+        if target_schema and out.db.lower() != target_schema.lower():
+            issues.append(f"{label} 的库名应为 {target_schema}，实际为 {out.db or '（无）'}")
+
+        src_cols = [c[0].lower() for c in src.columns]
+        out_cols = [c[0].lower() for c in out.columns]
+        extra_names = [n.lower() for n, _ in extra if n.lower() not in src_cols]
+        lost = [c[0] for c in src.columns if c[0].lower() not in out_cols]
+        added = [c[0] for c in out.columns if c[0].lower() not in src_cols and c[0].lower() not in extra_names]
+        if lost:
+            issues.append(f"{label} 缺少字段：{', '.join(lost)}")
+        if added:
+            issues.append(f"{label} 多出源表中不存在的字段：{', '.join(added)}")
+        absent = [n for n, _ in extra if n.lower() in extra_names and n.lower() not in out_cols]
+        if absent:
+            issues.append(f"{label} 缺少模板字段：{', '.join(absent)}")
+
+        expected = src_cols + extra_names
+        actual = [c for c in out_cols if c in expected]
+        present = [c for c in expected if c in out_cols]
+        if actual != present:
+            k = next(i for i, (a, b) in enumerate(zip(actual, present)) if a != b)
+            issues.append(f"{label} 字段顺序与源表不一致：第 {k + 1} 个字段应为 {present[k]}，实际为 {actual[k]}")
+
+        out_kinds = {c[0].lower(): c for c in out.columns}
+        if rules and rules.type_map:
+            for name, kind, _ in src.columns:
+                target = out_kinds.get(name.lower())
+                if target is None or kind.this.name not in rules.type_map:
+                    continue
+                mapped = rules.type_map[kind.this.name]
+                try:
+                    want = _type_sql(exp.DataType.build(mapped, dialect=destination_dialect or None), destination_dialect) \
+                        if mapped else _type_sql(kind, destination_dialect)
+                except Exception:
+                    continue
+                got = _type_sql(target[1], destination_dialect)
+                if got != want:
+                    issues.append(f"{label} 字段 {name} 类型应为 {want}（源类型 {kind.sql()}），实际为 {got}")
+        for name, type_ in extra:
+            target = out_kinds.get(name.lower())
+            if target is not None and name.lower() in extra_names:
+                try:
+                    want = _type_sql(exp.DataType.build(type_, dialect=destination_dialect or None), destination_dialect)
+                except Exception:
+                    continue
+                if _type_sql(target[1], destination_dialect) != want:
+                    issues.append(f"{label} 模板字段 {name} 类型应为 {want}")
+
+        if rules and rules.require_table_comment and not out.has_comment:
+            issues.append(f"{label} 缺少表注释")
+        if rules and rules.require_column_comment:
+            bare = [c[0] for c in out.columns if not c[2]]
+            if bare:
+                issues.append(f"{label} 以下字段缺少注释：{', '.join(bare)}")
+        if clauses:
+            for line, needle in zip(clauses, suffix):
+                if not _contains(out.tokens, needle):
+                    issues.append(f"{label} 缺少模板子句：{line}")
+    return issues
+
+
+def describe(issues: List[str]) -> str:
+    """拼成反馈给 LLM 的 exception 文本。"""
+    lines = [f"- {i}" for i in issues[:MAX_ISSUES]]
+    if len(issues) > MAX_ISSUES:
+        lines.append(f"- ……共 {len(issues)} 处")
+    return f"{PREFIX}（与源 SQL 比对）：\n" + "\n".join(lines)
@@ -0,0 +1,147 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlglot.dialects.dialect import Dialect
+from sqlglot.tokens import TokenType
+
+from . import stable_cache_key
+
+# key 结构变化时递增，旧条目自然失效
+_KEY_VERSION = 2
+
+_WS = re.compile(r"\s+")
+
+# 大小写敏感、不能折叠的 token
+_CASE_SENSITIVE = {TokenType.STRING, TokenType.IDENTIFIER, TokenType.NATIONAL_STRING}
+
+
+def normalize_sql(sql: str, dialect: str = "") -> str:
+    """
+    用 sqlglot 的 tokenizer 归一化 SQL：
+    - 空白与换行不再参与比较；
+    - 关键字、未加引号的标识符统一小写；字符串与带引号标识符保持原样；
+    - 注释保留（源端行注释会被转写成 COMMENT），但内部空白折叠。
+    tokenizer 失败时退化为折叠空白 + 小写。
+    """
+    try:
+        tokens = Dialect.get_or_raise(dialect or None)().tokenize(sql)
+    except Exception:
+        return _WS.sub(" ", sql).strip().lower()
+
+    parts = []
+    for token in tokens:
+        text = token.text if token.token_type in _CASE_SENSITIVE else token.text.lower()
+        parts.append(f"{token.token_type.name}:{text}")
+        for comment in token.comments:
+            parts.append(f"--:{_WS.sub(' ', comment).strip()}")
+    return "\x1f".join(parts)
+
+
+def cache_key(sql: str, *, source_dialect: str, prompt: str, destination_format: str,
+              destination_dialect: str, target_schema: str, model: str) -> str:
+    payload = {
+        "v": _KEY_VERSION,
+        "sql": normalize_sql(sql, source_dialect),
+        "prompt": stable_cache_key(prompt),
+        "destination_format": destination_format,
+        "destination_dialect": destination_dialect,
+        # 规则翻译和结构校验都按 target_schema 改写 / 比较表名；不同模型的译文不通用
+        "target_schema": target_schema,
+        "model": model,
+    }
+    return stable_cache_key(json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")))
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    puts: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class TranslationCache:
+    """
+    持久化的 chunk 翻译缓存（SQLite）。
+    - 按条目数做 LRU 淘汰（accessed_at 最旧的先删）；
+    - 按 ttl 过期（created_at 超过 ttl 视为未命中并删除）。
+    每次读写都是单行主键操作，直接在调用线程执行。
+    """
+
+    def __init__(self, path: str, *, max_entries: int, ttl: float):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be > 0")
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " key TEXT PRIMARY KEY,"
+            " sql TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS translations_accessed ON translations (accessed_at)")
+        self._count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT sql, created_at FROM translations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            sql, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                self._count -= 1
+                self.stats.evictions += 1
+                self.stats.misses += 1
+                return None
+            self._conn.execute("UPDATE translations SET accessed_at = ? WHERE key = ?", (now, key))
+            self.stats.hits += 1
+            return sql
+
+    def put(self, key: str, sql: str) -> None:
+        now = time.time()
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM translations WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations (key, sql, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, sql, now, now),
+            )
+            self.stats.puts += 1
+            if not exists:
+                self._count += 1
+
+            if self._count > self.max_entries:
+                # 一次多删 10%，避免每次写入都触发淘汰
+                n = self._count - self.max_entries + self.max_entries // 10
+                deleted = self._conn.execute(
+                    "DELETE FROM translations WHERE key IN "
+                    "(SELECT key FROM translations ORDER BY accessed_at LIMIT ?)",
+                    (n,),
+                ).rowcount
+                self._count -= deleted
+                self.stats.evictions += deleted
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,157 @@
+import asyncio
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import stable_cache_key, structure_check
+from .rule_translate import RuleSet
+from .statement_repair import find_broken, split_statements
+
+# (错误信息, 出错语句下标, 语句数)；没有错误时错误信息为空串
+Check = Tuple[str, List[int], int]
+
+
+def _check(sql: str, dialect: str, source: str = "", source_dialect: str = "",
+           rules: Optional[RuleSet] = None, target_schema: str = "") -> Tuple[Tuple[Check, List[str]], float]:
+    """
+    在 worker 里运行：整段解析一次，出错时逐条语句定位；
+    解析通过且给了源 chunk 时，用同一份解析结果做结构比对。返回 ((校验结果, 结构差异), 耗时)。
+    """
+    start = time.perf_counter()
+    try:
+        tables = structure_check.parse_tables(sql, dialect)
+    except Exception as e:
+        # 与 utils.validate_sql 的判断一致
+        statements = split_statements(sql, dialect) or []
+        broken = sorted(find_broken(statements, dialect)) if statements else []
+        return ((str(e), broken, len(statements)), []), time.perf_counter() - start
+    issues = structure_check.compare(source, tables, source_dialect=source_dialect, destination_dialect=dialect,
+                                     rules=rules, target_schema=target_schema) if source else []
+    return (("", [], 0), issues), time.perf_counter() - start
+
+
+@dataclass
+class ValidationStats:
+    calls: int = 0
+    cache_hits: int = 0
+    parse_seconds: float = 0.0   # worker 内的解析耗时
+    wait_seconds: float = 0.0    # 排队 + 进程间传输耗时
+    max_parse_seconds: float = 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.cache_hits / self.calls if self.calls else 0.0
+
+
+class ValidationExecutor:
+    """
+    把 sqlglot 语法校验和结构比对移出事件循环：解析是纯 CPU 计算，大 chunk 一次几十毫秒，
+    直接在协程里跑会卡住同一循环上的其他 chunk、限流器和 HTTP 请求。
+    - mode=process：进程池（默认，绕开 GIL）；thread：线程池（sqlglot 的解析器释放 GIL 时才有意义）；
+      inline：在调用方线程直接执行（旧行为，用于对比）；workers=0 时同 inline，不启动任何 worker；
+    - 进程池按需以 spawn 方式启动，每个 worker 要重新导入 sqlglot；长期运行的服务应在启动时调用 start
+      预先拉起并预热 worker，退出时调用 close，否则首批校验要承担启动开销、worker 进程可能残留；
+    - 同时提交给池的任务不超过 max_pending 个，其余在协程侧排队，避免执行器内部队列无限增长；
+    - 相同 (方言, SQL) 的结果按 LRU 缓存 cache_size 条，并发中的相同请求只算一次。
+    """
+
+    def __init__(self, *, mode: str = "process", workers: int = 2, max_pending: int = 64, cache_size: int = 4096):
+        self.mode = mode if workers > 0 else "inline"
+        self.workers = workers
+        self.cache_size = cache_size
+        self.stats = ValidationStats()
+        self._max_pending = max_pending
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._executor: Optional[Executor] = None
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "thread":
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="sql-validate")
+            else:
+                # spawn：事件循环和 sqlite 线程已在运行，fork 出来的子进程可能继承到被持有的锁
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def _run(self, fn: Callable[..., Tuple[Any, float]], *args) -> Tuple[Any, float]:
+        if self.mode == "inline":
+            return fn(*args)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._get_executor(), fn, *args)
+            except BrokenProcessPool:
+                # worker 被杀（如 OOM）：重建进程池再试一次
+                self._executor = None
+                return await loop.run_in_executor(self._get_executor(), fn, *args)
+
+    async def start(self) -> None:
+        """拉起全部 worker 并各做一次最小的解析（完成 sqlglot 等模块的导入）；inline 模式无操作。"""
+        if self.mode == "inline":
+            return
+        await asyncio.gather(*(self._run(_check, "SELECT 1", "") for _ in range(self.workers)))
+
+    async def _cached(self, key: str, fn: Callable[..., Tuple[Any, float]], *args) -> Any:
+        self.stats.calls += 1
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats.cache_hits += 1
+            return self._cache[key]
+        if key in self._inflight:
+            self.stats.cache_hits += 1
+            return await asyncio.shield(self._inflight[key])
+
+        fut = self._inflight[key] = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        try:
+            result, parse_seconds = await self._run(fn, *args)
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()   # 没有并发等待者时避免 "exception was never retrieved"
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        fut.set_result(result)
+
+        self.stats.parse_seconds += parse_seconds
+        self.stats.max_parse_seconds = max(self.stats.max_parse_seconds, parse_seconds)
+        self.stats.wait_seconds += max(0.0, time.perf_counter() - start - parse_seconds)
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    async def check(self, sql: str, dialect: str, *, source: str = "", source_dialect: str = "",
+                    rules: Optional[RuleSet] = None, target_schema: str = "") -> Tuple[Check, List[str]]:
+        """
+        返回 ((错误信息, 出错语句下标, 语句数), 结构差异)。
+        给了 source（源 chunk）时，语法通过后再按 structure_check 比对结构，否则结构差异恒为空。
+        """
+        key = stable_cache_key("\0".join([dialect, sql] + ([source_dialect, target_schema, repr(rules), source] if source else [])))
+        return await self._cached(key, _check, sql, dialect, source, source_dialect, rules, target_schema)
+
+    async def validate(self, sql: str, dialect: str) -> str:
+        """与 utils.validate_sql 相同的判断，返回错误信息（合法时为空串）。"""
+        return (await self.check(sql, dialect))[0][0]
+
+    def snapshot(self) -> dict:
+        s = self.stats
+        done = s.calls - s.cache_hits
+        return {"mode": self.mode, "calls": s.calls, "cache_hits": s.cache_hits,
+                "avg_parse_ms": round(s.parse_seconds / done * 1000, 2) if done else 0.0,
+                "max_parse_ms": round(s.max_parse_seconds * 1000, 2),
+                "avg_wait_ms": round(s.wait_seconds / done * 1000, 2) if done else 0.0}
+
+    def close(self) -> None:
+        """取消排队中的校验并等 worker 退出；之后再次调用 check 会重新创建执行器。"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
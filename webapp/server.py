@@ -8,24 +8,47 @@ Run:
 
 Then open:
   http://localhost:8000/
+
+Whole-file jobs (server-side splitting, results streamed in order):
+  POST /api/jobs                  -> {"job_id": ..., "events": "/api/jobs/<id>/events"}
+  GET  /api/jobs/<id>             -> status snapshot
+  GET  /api/jobs/<id>/events      -> SSE: chunk (id = chunk index) / progress / end; reattach with Last-Event-ID
+  GET  /api/jobs/<id>/result      -> full result once done
 """
 
 from __future__ import annotations
 
+import contextlib
+import functools
+import json
+import math
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from starlette import status
 
 import CONFIG
-from utils import checkpointer_pool,singleflight
+from utils import checkpointer_pool,singleflight,job_store,fair_queue,admission,job_progress
+import llm_client
 import utils
-from graph import chunk_graph
-from method import main_method
-from states.main_state import ChunkState, ChunkResult, MainState
+from graph import chunk_graph, main_graph
+from method import chunk_method, main_method
+from states.main_state import ChunkRequest, ChunkState, ChunkResult, JobContext, JobRequest, MainState, PromptRequest
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with checkpointer_pool.lifespan(app):
+        # 启动时拉起并预热校验进程，首批校验不承担 spawn 开销；退出时关闭，不残留 worker 进程
+        validator = chunk_method.get_validator()
+        await validator.start()
+        try:
+            yield
+        finally:
+            validator.close()
+
 
-app = FastAPI(title="LLM SQL Chunk Translator", lifespan=checkpointer_pool.lifespan)
+app = FastAPI(title="LLM SQL Chunk Translator", lifespan=lifespan)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -36,13 +59,36 @@ async def index():
 # Serve any additional static assets if needed in the future.
 app.mount("/static", StaticFiles(directory="webapp/static"), name="static")
 
-@app.post("/api/convert_chunk", response_model=ChunkResult)
-@singleflight#必须在内层
-async def convert_chunk(req: ChunkState) -> ChunkResult:
+
+def _llm_rpm() -> float:
+    controller = llm_client.get_rate_controller()
+    return controller.rpm if controller else CONFIG.LLM_RPM
+
+
+_admission = admission.AdmissionController(
+    max_queue=CONFIG.ADMISSION_MAX_QUEUE,
+    tenant_queue=CONFIG.ADMISSION_TENANT_QUEUE,
+    max_wait=CONFIG.ADMISSION_MAX_WAIT,
+    rate=_llm_rpm,
+    queue=llm_client.get_fair_queue(),
+    next_free=lambda: llm_client.get_limiter().next_free(),
+)
+
+_jobs = job_progress.JobRegistry(max_running=CONFIG.MAX_RUNNING_JOBS, ttl=CONFIG.JOB_TTL,
+                                 directory=CONFIG.JOB_DIR, max_buffer=CONFIG.STREAM_BUFFER_CHARS)
+
+
+def _dst_lang(req: JobContext) -> str:
     # Compute sqlglot dialect for validation (optional feature).
     dst_lang = (req.destination_sql_language or "").strip()
     if not dst_lang and CONFIG.GRAMMAR_CHECK:
         dst_lang = CONFIG.SQLGLOT_DIALECT_MAP.get(req.destination_format.lower(), "")
+    return dst_lang
+
+@app.post("/api/convert_chunk", response_model=ChunkResult)
+@singleflight#必须在内层
+async def convert_chunk(req: ChunkRequest) -> ChunkResult:
+    dst_lang = _dst_lang(req)
 
     limiter = CONFIG.MAX_TRY
 
@@ -50,20 +96,38 @@ async def convert_chunk(req: ChunkState) -> ChunkResult:
     # We intentionally include prompt/sql hashes so that re-runs with different prompts don't accidentally reuse old checkpoints.
     task_id = utils.task_id(req.source_format, req.destination_format, req.general_prompt, req.sql)
 
+    job = JobContext.from_state(req)
+    job.destination_sql_language = dst_lang
+
     state = ChunkState(
         task_id=task_id,
-        general_prompt=req.general_prompt,
-        source_format=req.source_format,
-        destination_format=req.destination_format,
-        destination_sql_language=dst_lang,
-        source_sql="",              # not used by chunk graph but required by schema
-        destination_example="",     # not used by chunk graph but required by schema
+        job_id=job_store.put(job),
         sql=req.sql,
         limiter=limiter,
     )
 
+    # 翻译缓存能直接回答的请求不经过准入控制，也不占排队名额
+    hit = chunk_graph.cached(state)
+    if hit:
+        req.sql = hit
+        return req
+
+    # 前端 chunk id 为 "<sessionId>:<idx>"，按会话公平排队
+    tenant_id = req.task_id.split(":", 1)[0]
     try:
-        out_sql = await chunk_graph.start_or_resume(state)
+        _admission.enter(tenant_id)
+    except admission.Rejected as e:
+        # 排队太深：让客户端按 Retry-After 稍后再来，而不是挂在这里占用连接
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail={"message": e.reason, "retry_after": e.retry_after, "task_id": task_id},
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+
+    try:
+        # 运行期间固定共享参数，不会被 job_store 的 LRU 淘汰
+        with job_store.hold(job), fair_queue.tenant(tenant_id, "bulk"):
+            out_sql = await chunk_graph.start_or_resume(state)
         if not out_sql:
             raise RuntimeError("API 模型错误")
 
@@ -80,9 +144,81 @@ async def convert_chunk(req: ChunkState) -> ChunkResult:
                 "task_id": task_id,
             },
         )
-
-@app.post("/api/normalize_prompt", response_model=MainState)
-async def normalize_prompt(req: MainState) -> MainState:
-    result=await main_method.prompt_normalize(req)
-    req.general_prompt=result["general_prompt"]
+    finally:
+        _admission.leave(tenant_id)
+
+@app.post("/api/jobs")
+async def submit_job(req: JobRequest):
+    # 内容哈希作 job_id：同一文件 + 参数重复提交时复用正在运行的任务，服务重启后重新提交则从 checkpoint 继续
+    state = MainState(task_id=utils.stable_model_hash(req), **req.model_dump(exclude={"destination_sql_language"}),
+                      destination_sql_language=_dst_lang(req))
+    # 续写按 chunk 序号对齐，换了切分方式就不能接着上次的结果文件写
+    job = _jobs.submit(state.task_id, functools.partial(main_graph.start_or_resume, state),
+                       key=f"{state.task_id}:{CONFIG.SPLITTER}")
+    return {**job.snapshot(), "events": f"/api/jobs/{job.id}/events"}
+
+
+def _get_job(job_id: str) -> job_progress.JobProgress:
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"message": "job 不存在或已过期，请重新提交"})
+    return job
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    return _get_job(job_id).snapshot()
+
+
+def _sse(event: dict) -> str:
+    if event["event"] == "ping":
+        return ": ping\n\n"
+    head = f"event: {event['event']}\n" + (f"id: {event['id']}\n" if "id" in event else "")
+    return head + f"data: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, start: int = 0):
+    """按原文件顺序推送 chunk 结果；断线重连时 EventSource 会带上 Last-Event-ID，从下一个 chunk 继续。"""
+    job = _get_job(job_id)
+    last = request.headers.get("last-event-id", "")
+    if last.isdigit():
+        start = int(last) + 1
+
+    async def stream():
+        async for event in job.events(start):
+            yield _sse(event)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/api/jobs/{job_id}/result", response_class=FileResponse)
+async def job_result(job_id: str):
+    job = _get_job(job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=job.snapshot())
+    # 结果只在任务的结果文件里，不在内存或 checkpoint 中
+    return FileResponse(job.path, media_type="text/plain; charset=utf-8")
+
+
+@app.get("/api/metrics")
+async def metrics():
+    controller = llm_client.get_rate_controller()
+    return {
+        "llm_rate": controller.snapshot() if controller else None,
+        "retries": llm_client.get_retry_policy().snapshot(),
+        "tenants": llm_client.get_fair_queue().snapshot(),
+        "admission": _admission.snapshot(),
+        "validation": chunk_method.get_validator().snapshot(),
+        "prompt": vars(main_method.prompt_stats),
+        "prefix_cache": chunk_method.prefix_stats.snapshot(),
+    }
+
+@app.post("/api/normalize_prompt", response_model=PromptRequest)
+async def normalize_prompt(req: PromptRequest) -> PromptRequest:
+    # 由请求体重新构造 MainState：source_path 始终为空，不会读取服务端文件
+    state = MainState(**req.model_dump())
+    with fair_queue.tenant(req.task_id, "interactive"):
+        req.general_prompt=await main_method.normalize_prompt(state)
     return req
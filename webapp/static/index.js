@@ -170,6 +170,10 @@ function clamp(n, a, b) {
     return Math.max(a, Math.min(b, n));
 }
 
+function sleep(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
 function autoResizeTextarea(elm) {
     if (!elm) return;
     elm.style.height = "auto";
@@ -222,6 +226,9 @@ async function postJson(url, payload) {
         );
         err.status = resp.status;
         err.body = data;
+        // 429 时后端给出的建议等待秒数
+        const ra = parseFloat(resp.headers.get("Retry-After") || "");
+        err.retryAfter = Number.isFinite(ra) ? ra : null;
         throw err;
     }
 
@@ -871,7 +878,6 @@ function buildMainStatePayload(userPrompt) {
         destination_example: App.destinationExampleText || "",
 
         chunked_sql: App.chunks.map(c => c.src),
-        result_chunks: App.chunks.map(c => ({sql: c.dst || "", exception: c.exception || ""})),
         result: App.chunks.map(c => (c.dst || "")).join("\n\n"),
     };
 }
@@ -1037,6 +1043,9 @@ function buildChunkStatePayload(chunk) {
     };
 }
 
+// convertOneChunk 被 429 退回时的返回值：chunk 需要重新排队
+const REQUEUE = Symbol("requeue");
+
 async function convertOneChunk(chunk) {
     if (!validateBeforeRequest()) return;
     if (!App.promptText.trim()) {
@@ -1050,7 +1059,17 @@ async function convertOneChunk(chunk) {
 
     try {
         const payload = buildChunkStatePayload(chunk);
-        const resp = await postJson("/api/convert_chunk", payload);
+        let resp;
+        try {
+            resp = await postJson("/api/convert_chunk", payload);
+            Pool.onSuccess();
+        } catch (e) {
+            if (e.status !== 429) throw e;
+            // 后端排队已满：收缩并发并暂停到 Retry-After 之后；不占着 slot 原地等待，交回调用方重新排队
+            Pool.onThrottle(e.retryAfter);
+            chunk.status = STATUS.WAIT;
+            return REQUEUE;
+        }
 
         const outSql = (resp && typeof resp.sql === "string") ? resp.sql : "";
         const ex = (resp && typeof resp.exception === "string") ? resp.exception : "";
@@ -1085,19 +1104,84 @@ async function convertOneChunk(chunk) {
 }
 
 
+// 自适应并发：收到 429 时 limit 减半并暂停到 Retry-After 之后，连续成功后逐个加回到用户设置的并发数
+const Pool = {
+    max: 188,
+    limit: 188,
+    active: 0,
+    successes: 0,
+    pausedUntil: 0,
+
+    reset(max) {
+        this.max = max;
+        this.limit = max;
+        this.successes = 0;
+        this.pausedUntil = 0;
+    },
+
+    onThrottle(retryAfter) {
+        const ms = 1000 * (retryAfter || 1) * (1 + Math.random() * 0.2); // 抖动，避免同时醒来
+        this.limit = Math.max(1, Math.floor(Math.min(this.limit, this.active) / 2));
+        this.successes = 0;
+        this.pausedUntil = Math.max(this.pausedUntil, Date.now() + ms);
+        return ms;
+    },
+
+    onSuccess() {
+        this.successes++;
+        if (this.limit < this.max && this.successes >= this.limit) {
+            this.successes = 0;
+            this.limit++;
+        }
+    },
+
+    async slot() {
+        while (this.active >= this.limit || Date.now() < this.pausedUntil) {
+            await sleep(Math.max(100, this.pausedUntil - Date.now()));
+        }
+        this.active++;
+    },
+};
+
+// 单个 chunk 不经过 runWithConcurrency：被 429 退回时等到 Pool 的暂停结束再重发
+async function convertChunkUntilAccepted(chunk) {
+    while ((await convertOneChunk(chunk)) === REQUEUE) {
+        await sleep(Math.max(0, Pool.pausedUntil - Date.now()));
+    }
+}
+
 async function runWithConcurrency(items, workerFn, limit) {
     const results = new Array(items.length);
-    let next = 0;
+    const queue = items.map((_, i) => i);
+    let running = 0;
 
     async function worker() {
         while (true) {
-            const i = next++;
-            if (i >= items.length) return;
-            results[i] = await workerFn(items[i], i);
+            await Pool.slot();
+            if (queue.length === 0) {
+                Pool.active--;
+                if (running === 0) return;
+                // 仍有在途任务，可能被 429 退回队列
+                await sleep(100);
+                continue;
+            }
+            const i = queue.shift();
+            running++;
+            let r;
+            try {
+                r = await workerFn(items[i], i);
+            } finally {
+                running--;
+                Pool.active--;
+            }
+            // workerFn 返回 REQUEUE：已释放 slot，放回队首，等 Pool 暂停结束后按收缩后的并发重发
+            if (r === REQUEUE) queue.unshift(i);
+            else results[i] = r;
         }
     }
 
     const n = clamp(limit || 188, 1, items.length || 1);
+    Pool.reset(n);
     const workers = [];
     for (let i = 0; i < n; i++) workers.push(worker());
     await Promise.all(workers);
@@ -1132,8 +1216,7 @@ async function onConvertAll() {
         const {concurrency} = readSharedParams();
         await runWithConcurrency(App.chunks, async (ch) => {
             if (ch.status === STATUS.OK) return true;
-            await convertOneChunk(ch);
-            return true;
+            return (await convertOneChunk(ch)) === REQUEUE ? REQUEUE : true;
         }, concurrency);
 
         textSafe(
@@ -1170,8 +1253,7 @@ async function onRedoFailed() {
             ch.exception = "";
             ch.dst = "";
             renderChunks();
-            await convertOneChunk(ch);
-            return true;
+            return (await convertOneChunk(ch)) === REQUEUE ? REQUEUE : true;
         }, concurrency);
 
         textSafe(
@@ -1250,7 +1332,7 @@ async function onChunkAction(e) {
             chunk.dst = "";
             renderChunks();
 
-            await convertOneChunk(chunk);
+            await convertChunkUntilAccepted(chunk);
 
             textSafe(
                 "runInfo",
@@ -1277,7 +1359,7 @@ async function onChunkAction(e) {
             chunk.dst = "";
             renderChunks();
 
-            await convertOneChunk(chunk);
+            await convertChunkUntilAccepted(chunk);
 
             textSafe(
                 "runInfo",